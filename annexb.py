@@ -0,0 +1,29 @@
+# Annex B byte stream: every NAL is preceded by a 4 byte start code, valid for
+# the first NAL of an access unit and parameter sets as well as the others
+START_CODE   = '\x00\x00\x00\x01'
+# bytes buffered before each write
+ANNEXB_BATCH = 1024 * 1024
+
+class AnnexBWriter:
+    # writes depacketized NALs to fd as an Annex B stream (.264 file)
+
+    def __init__(self, fd):
+        self.fd      = fd
+        self.pending = bytearray()
+        self.nals    = 0
+        # bytes written, start codes included
+        self.size    = 0
+
+    def write(self, nal, nalSize):
+        pending = self.pending
+        pending.extend(START_CODE)
+        pending.extend(nal[:nalSize] if len(nal) != nalSize else nal)
+        self.nals += 1
+        self.size += len(START_CODE) + nalSize
+        if len(pending) >= ANNEXB_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.fd.write(self.pending)
+            self.pending = bytearray()
@@ -0,0 +1,385 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import copy
+import json
+import time
+import hashlib
+import argparse
+import traceback
+import multiprocessing
+from Queue import Empty
+from collections import deque
+from functools import partial
+import svcdecoder as svc
+import metrics
+import pcap2yuv
+
+# runs pcap2yuv on many captures, a directory of them or a manifest of jobs,
+# in worker processes that load the decoder once and reuse it from job to
+# job. Finished jobs are recorded in a state file, a rerun skips them
+PCAP_EXTS        = ('.pcap', '.pcapng', '.cap')
+# manifest columns: the positional arguments of pcap2yuv.py, '-' for an
+# empty filter or the default output
+MANIFEST_DEFAULT = '-'
+MANIFEST_COMMENT = '#'
+DEF_STATE_FILE   = 'batch.state'
+DEF_SUMMARY_FILE = 'batch-summary.json'
+# written next to the out yuv file of every job
+LOG_EXT          = '.log'
+REPORT_EXT       = '.report.json'
+# seconds between checks for dead workers while waiting for results
+POLL_INTERVAL    = 1.0
+# batch arguments, not part of the options of a job
+BATCH_ARGS       = ('source', 'outDir', 'workers', 'stateFile', 'summaryFile', 'rerun',
+                    'filterSrcIp', 'filterSSRC')
+
+class Job:
+    # one pcap2yuv run
+
+    def __init__(self, pcapFile, filterSrcIp, filterSSRC, outFile, outPacsiFile, outNalFile):
+        self.pcapFile     = pcapFile
+        self.filterSrcIp  = filterSrcIp
+        self.filterSSRC   = filterSSRC
+        self.outFile      = outFile
+        self.outPacsiFile = outPacsiFile
+        self.outNalFile   = outNalFile
+        self.logFile      = outFile + LOG_EXT
+        self.reportFile   = outFile + REPORT_EXT
+
+    def key(self, opts):
+        # identity of the job in the state file: a changed capture or other
+        # options make it a new job
+        try:
+            st   = os.stat(self.pcapFile)
+            stat = [st.st_size, int(st.st_mtime)]
+        except OSError:
+            stat = None
+        options = [(k, repr(v)) for k, v in sorted(vars(opts).items())
+                   if k not in BATCH_ARGS and k != 'decoder']
+        ident = [os.path.abspath(self.pcapFile), stat, self.filterSrcIp, self.filterSSRC,
+                 [os.path.abspath(f) for f in (self.outFile, self.outPacsiFile, self.outNalFile)],
+                 options]
+        return hashlib.sha1(json.dumps(ident)).hexdigest()
+
+def out_ext(opts):
+    # extension of the out yuv file of a job
+    if opts.annexB:
+        name = pcap2yuv.defAnnexBFile
+    elif opts.digest or opts.verify:
+        name = pcap2yuv.defDigestFile
+    elif opts.psnr:
+        name = pcap2yuv.defQualityFile
+    else:
+        name = pcap2yuv.defYUVFile
+    return os.path.splitext(name)[1]
+
+def default_outputs(pcapFile, outDir, opts):
+    # <stem>.yuv (or .264, ...), <stem>.pacsi.txt and <stem>.nal.txt in outDir
+    stem = os.path.join(outDir, os.path.splitext(os.path.basename(pcapFile))[0])
+    return [stem + out_ext(opts), stem + '.' + pcap2yuv.defPACSIFIle, stem + '.' + pcap2yuv.defNALFile]
+
+def dir_jobs(dirName, outDir, filterSrcIp, filterSSRC, opts):
+    # one job per capture of dirName, same filters for all
+    jobs = []
+    for name in sorted(os.listdir(dirName)):
+        pcapFile = os.path.join(dirName, name)
+        if os.path.splitext(name)[1].lower() in PCAP_EXTS and os.path.isfile(pcapFile):
+            jobs.append(Job(pcapFile, filterSrcIp, filterSSRC, *default_outputs(pcapFile, outDir, opts)))
+    return jobs
+
+def manifest_jobs(fileName, outDir, opts):
+    # one job per line of the manifest: <pcap file> <src IP filter> <SSRC
+    # filter> [out yuv file] [out pacsi file] [out NAL file]. Relative paths
+    # are relative to the manifest. Raises ValueError on malformed lines
+    baseDir = os.path.dirname(os.path.abspath(fileName))
+    jobs    = []
+    fd      = open(fileName)
+    try:
+        for lineNo, line in enumerate(fd, 1):
+            fields = line.split(MANIFEST_COMMENT, 1)[0].split()
+            if not fields:
+                continue
+            if not 3 <= len(fields) <= 6:
+                raise ValueError(fileName + ':' + str(lineNo) + ': expected 3 to 6 fields, got ' +
+                                 str(len(fields)))
+            pcapFile = os.path.join(baseDir, fields[0])
+            filters  = ['' if f == MANIFEST_DEFAULT else f for f in fields[1:3]]
+            outputs  = default_outputs(pcapFile, outDir, opts)
+            for i, f in enumerate(fields[3:]):
+                if f != MANIFEST_DEFAULT:
+                    outputs[i] = os.path.join(baseDir, f)
+            jobs.append(Job(pcapFile, filters[0], filters[1], *outputs))
+    finally:
+        fd.close()
+    return jobs
+
+def load_state(fileName):
+    # key -> result of the jobs recorded as finished
+    done = {}
+    try:
+        fd = open(fileName)
+    except IOError:
+        return done
+    try:
+        for line in fd:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line cut by a crash
+                continue
+            if record['result']['status'] == 0:
+                done[record['key']] = record['result']
+    finally:
+        fd.close()
+    return done
+
+_decoder = None
+
+def reused_decoder(factory):
+    # the decoder of this worker process: made for its first job, reopened
+    # for the next ones
+    global _decoder
+    if _decoder is None:
+        _decoder = (factory or svc.SVCDecoder)()
+    else:
+        _decoder.reopen()
+    return _decoder
+
+def run_job(job, opts):
+    # runs in a worker process, pcap2yuv messages go to the job's log.
+    # Returns the result of the job
+    jobOpts         = copy.copy(opts)
+    jobOpts.decoder = partial(reused_decoder, opts.decoder)
+    jobOpts.report  = job.reportFile
+    started = time.time()
+    result  = {'pcap': job.pcapFile, 'outFile': job.outFile, 'log': job.logFile}
+    log     = open(job.logFile, 'w')
+    stdout  = sys.stdout
+    sys.stdout = log
+    try:
+        result['status'] = pcap2yuv.main(job.pcapFile, job.filterSrcIp, job.filterSSRC, job.outFile,
+                                         job.outPacsiFile, job.outNalFile, jobOpts)
+    except Exception as e:
+        traceback.print_exc(file=log)
+        result['status'] = 1
+        result['error']  = str(e)
+    finally:
+        sys.stdout = stdout
+        log.close()
+    result['elapsed'] = time.time() - started
+    try:
+        fd = open(job.reportFile)
+        try:
+            report = json.load(fd)
+        finally:
+            fd.close()
+        for name in metrics.COUNTERS:
+            result[name] = report[name]
+    except (IOError, ValueError, KeyError):
+        pass
+    return result
+
+def batch_worker(taskQueue, resQueue, workerId, opts):
+    while True:
+        task = taskQueue.get()
+        if task is None:
+            return
+        n, job = task
+        resQueue.put((workerId, n, run_job(job, opts)))
+
+class BatchWorker:
+    # worker process given one job at a time, so that the job of a worker
+    # that died (e.g. in libopensvc) is known
+
+    def __init__(self, workerId, resQueue, opts):
+        self.queue = multiprocessing.Queue()
+        self.job   = None
+        self.proc  = multiprocessing.Process(target=batch_worker,
+                                             args=(self.queue, resQueue, workerId, opts))
+        self.proc.start()
+
+    def assign(self, n, job):
+        self.job = (n, job)
+        self.queue.put((n, job))
+
+    def stop(self):
+        self.queue.put(None)
+
+def run_batch(jobs, opts, workers, stateFile, rerun=False, verbose=True):
+    # runs the jobs not recorded as finished in stateFile on workers worker
+    # processes, recording them as they end. Returns the results of every
+    # job in jobs order, those of skipped jobs taken from the state file
+    done     = {} if rerun else load_state(stateFile)
+    keys     = [job.key(opts) for job in jobs]
+    results  = [None] * len(jobs)
+    pending  = deque()
+    for n, key in enumerate(keys):
+        if key in done:
+            results[n] = dict(done[key], skipped=True)
+        else:
+            pending.append(n)
+    for job in (jobs[n] for n in pending):
+        for f in (job.outFile, job.outPacsiFile, job.outNalFile):
+            outDir = os.path.dirname(os.path.abspath(f))
+            if not os.path.isdir(outDir):
+                os.makedirs(outDir)
+    total    = len(pending)
+    state    = open(stateFile, 'a')
+    resQueue = multiprocessing.Queue()
+    pool     = {}
+    def finish(n, result):
+        results[n] = result
+        state.write(json.dumps({'key': keys[n], 'result': result}) + '\n')
+        state.flush()
+        os.fsync(state.fileno())
+        if verbose:
+            print "[%d/%d]" % (total - len(pending) - len(busy()), total), jobs[n].pcapFile + ":",
+            if result['status'] == 0:
+                print "ok,", result.get('frames', 0), "frames in %.1f s" % result['elapsed']
+            else:
+                print "failed,", result.get('error', 'exit status ' + str(result['status'])) + \
+                      ", see", result['log']
+    def busy():
+        return [w for w in pool.values() if w.job is not None]
+    def next_job(w):
+        if pending:
+            n = pending.popleft()
+            w.assign(n, jobs[n])
+        else:
+            w.job = None
+    try:
+        for workerId in range(min(workers, len(pending))):
+            pool[workerId] = BatchWorker(workerId, resQueue, opts)
+            next_job(pool[workerId])
+        while busy():
+            try:
+                workerId, n, result = resQueue.get(timeout=POLL_INTERVAL)
+            except Empty:
+                for workerId, w in pool.items():
+                    if w.job is not None and not w.proc.is_alive():
+                        n, job = w.job
+                        w.job  = None
+                        finish(n, {'pcap': job.pcapFile, 'outFile': job.outFile, 'log': job.logFile,
+                                   'status': None,
+                                   'error': 'worker died with exit code ' + str(w.proc.exitcode)})
+                        pool[workerId] = BatchWorker(workerId, resQueue, opts)
+                        next_job(pool[workerId])
+                continue
+            w = pool[workerId]
+            w.job = None
+            finish(n, result)
+            next_job(w)
+    finally:
+        for w in pool.values():
+            if w.proc.is_alive():
+                if w.job is None:
+                    w.stop()
+                else:
+                    w.proc.terminate()
+        for w in pool.values():
+            w.proc.join()
+        state.close()
+    return results
+
+def summarize(results):
+    # combined summary of a batch
+    summary = {'jobs': len(results), 'skipped': 0, 'ok': 0, 'failed': 0, 'elapsed': 0.0,
+               'results': results}
+    summary.update(dict.fromkeys(metrics.COUNTERS, 0))
+    for result in results:
+        if result is None:
+            continue
+        if result.get('skipped'):
+            summary['skipped'] += 1
+        elif result['status'] == 0:
+            summary['ok'] += 1
+        else:
+            summary['failed'] += 1
+        if result['status'] == 0:
+            summary['elapsed'] += result['elapsed']
+            for name in metrics.COUNTERS:
+                summary[name] += result.get(name, 0)
+    return summary
+
+def display_summary(summary, summaryFile):
+    print ""
+    print "Jobs:", summary['jobs'], " run ok:", summary['ok'], " failed:", summary['failed'], \
+          " finished before:", summary['skipped']
+    print "Packets:", summary['packets'], " NALs:", summary['nals'], " frames:", summary['frames'], \
+          " bytes written:", summary['bytes'], " decoding time: %.1f s" % summary['elapsed']
+    for result in summary['results']:
+        if result is not None and result['status'] != 0:
+            print "Failed:", result['pcap'], "see", result['log']
+    print "Summary written in", summaryFile
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Run pcap2yuv on a directory of pcap files or on the "
+                                                 "jobs of a manifest, in worker processes that load the "
+                                                 "decoder once. Finished jobs are skipped when run again.")
+    parser.add_argument('source', metavar='<dir or manifest>',
+                        help="directory of pcap/pcapng files, or manifest with one job per line: "
+                             "<pcap file> <src IP filter> <SSRC filter> [out yuv file] [out pacsi "
+                             "file] [out NAL file], '" + MANIFEST_DEFAULT + "' for an empty filter or "
+                             "the default output. Relative paths are relative to the manifest")
+    parser.add_argument('--out-dir', dest='outDir', metavar='DIR',
+                        help="directory of the default outputs <pcap name>" +
+                             out_ext(pcap2yuv.Options()) + ", .pacsi.txt and .nal.txt, also of the state "
+                             "and summary files. Default is the directory of the captures or manifest")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), metavar='N',
+                        help="worker processes. Default is the number of CPUs")
+    parser.add_argument('--state', dest='stateFile', metavar='FILE',
+                        help="finished jobs, appended as they end. Default is <out dir>/" +
+                             DEF_STATE_FILE)
+    parser.add_argument('--summary', dest='summaryFile', metavar='FILE',
+                        help="JSON summary of all jobs. Default is <out dir>/" + DEF_SUMMARY_FILE)
+    parser.add_argument('--rerun', action='store_true',
+                        help="run every job, also those recorded as finished")
+    parser.add_argument('--src-ip', dest='filterSrcIp', default='',
+                        help="directory of captures: only packets from these source IPs (comma separated)")
+    parser.add_argument('--ssrc', dest='filterSSRC', default='',
+                        help="directory of captures: only packets of these SSRCs (comma separated)")
+    pcap2yuv.add_options(parser)
+    return parser
+
+def main(args):
+    if args.workers < 1:
+        print "Invalid --workers: must be at least 1"
+        return 1
+    isDir  = os.path.isdir(args.source)
+    outDir = args.outDir or (args.source if isDir else os.path.dirname(os.path.abspath(args.source)))
+    try:
+        if isDir:
+            jobs = dir_jobs(args.source, outDir, args.filterSrcIp, args.filterSSRC, args)
+        else:
+            jobs = manifest_jobs(args.source, outDir, args)
+    except (IOError, ValueError) as e:
+        print "Could not read jobs:", e
+        return 1
+    if not jobs:
+        print "No jobs in", args.source
+        return 1
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+    stateFile   = args.stateFile or os.path.join(outDir, DEF_STATE_FILE)
+    summaryFile = args.summaryFile or os.path.join(outDir, DEF_SUMMARY_FILE)
+    print "Running", len(jobs), "jobs in", args.workers, "worker processes ..."
+    try:
+        results = run_batch(jobs, args, args.workers, stateFile, args.rerun)
+    except KeyboardInterrupt:
+        print ""
+        print "Interrupted: finished jobs are recorded in", stateFile
+        return 1
+    summary = summarize(results)
+    fd = open(summaryFile, 'w')
+    try:
+        json.dump(summary, fd, indent=2, sort_keys=True)
+        fd.write('\n')
+    finally:
+        fd.close()
+    display_summary(summary, summaryFile)
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main(build_arg_parser().parse_args(namespace=pcap2yuv.Options())))
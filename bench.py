@@ -0,0 +1,221 @@
+#! /usr/bin/env python
+
+import os
+import gc
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+from functools import partial
+import metrics
+import pcap2yuv
+import synthpcap
+import stubdecoder
+import yuvfile
+from pacsi import parse_pacsi, PacsiWriter, PACSI_FMT_JSONL
+from pcapreader import open_pcap
+
+# benchmarks of the decoding path on a synthetic capture (see synthpcap) with
+# the stub decoder. Results are the best of --repeat runs in microseconds per
+# item, and may be saved and compared against a baseline
+BENCH_VERSION  = 1
+DEF_REPEAT     = 5
+DEF_FRAMES     = 600
+DEF_WIDTH      = 640
+DEF_HEIGHT     = 360
+# change (in %) of the time per item reported as a regression
+DEF_THRESHOLD  = 10.0
+
+class NullFile(object):
+    # write target discarding its data, so that writes do not measure the disk
+    mode   = 'wb'
+    closed = False
+
+    def write(self, data):
+        pass
+
+    def fileno(self):
+        return -1
+
+    def close(self):
+        pass
+
+def best_time(fn, repeat):
+    # min wall time of repeat calls of fn, with garbage collection off
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            t = metrics.clock()
+            fn()
+            t = metrics.clock() - t
+        finally:
+            gc.enable()
+        best = t if best is None else min(best, t)
+    return best
+
+class Bench:
+
+    def __init__(self, pcapFile, opts):
+        self.pcapFile = pcapFile
+        self.opts     = opts
+        self.packets  = list(pcap2yuv.filter_packets(open_pcap(pcapFile), set(), set()))
+        # NALs as the depacketizer hands them to the decoder
+        self.nals     = []
+        ses = self.session()
+        ses.nalSink = lambda ses, nal, nalSize: self.nals.append(bytearray(nal[:nalSize]))
+        for p in self.packets:
+            pcap2yuv.decode_packet(ses, p)
+        self.pacsis   = [nal for nal in self.nals if nal[0] & 0x1f == 30]
+        self.slices   = [nal for nal in self.nals if nal[0] & 0x1f != 30]
+
+    def session(self):
+        ses = pcap2yuv.DecodeSession(None, None, None, None)
+        ses.nalSink = lambda ses, nal, nalSize: None
+        return ses
+
+    def decoder(self):
+        return stubdecoder.StubDecoder(self.opts.width, self.opts.height, self.opts.layers)
+
+    def filter(self):
+        pkts = open_pcap(self.pcapFile)
+        for p in pcap2yuv.filter_packets(pkts, set(), set()):
+            pass
+        pkts.close()
+
+    def depacketize(self):
+        ses = self.session()
+        for p in self.packets:
+            pcap2yuv.decode_packet(ses, p)
+
+    def parse_pacsi(self):
+        for nal in self.pacsis:
+            parse_pacsi(nal, len(nal))
+
+    def pacsi_jsonl(self):
+        out = PacsiWriter(NullFile(), PACSI_FMT_JSONL)
+        for i, nal in enumerate(self.pacsis):
+            out.write(parse_pacsi(nal, len(nal)), i, 0)
+        out.flush()
+
+    def decode_nal(self):
+        dec = self.decoder()
+        for nal in self.slices:
+            dec.decode_nal(nal, len(nal))
+
+    def write_frame(self):
+        dec = self.decoder()
+        while dec.decode_nal(bytearray('\x65\x00'), 2) != stubdecoder.svc.SVC_IMAGE_READY.value:
+            pass
+        fd  = NullFile()
+        for _ in range(self.opts.frames):
+            dec.write_frame(fd)
+
+    def yuv_file(self):
+        # frames written to a YUV file next to the capture
+        dec = self.decoder()
+        while dec.decode_nal(bytearray('\x65\x00'), 2) != stubdecoder.svc.SVC_IMAGE_READY.value:
+            pass
+        yuv = yuvfile.YuvFile(os.path.join(os.path.dirname(self.pcapFile), 'bench.yuv'))
+        for _ in range(self.opts.frames):
+            yuv.write_frame(dec.frame_buffer(), dec.frame.Width, dec.frame.Height)
+        yuv.close()
+
+    def end_to_end(self):
+        opts = pcap2yuv.Options()
+        opts.decoder  = partial(stubdecoder.StubDecoder, self.opts.width, self.opts.height,
+                                self.opts.layers)
+        opts.nalTrace = self.opts.nalTrace
+        pcap2yuv.decode_stream(iter(self.packets), os.devnull, os.devnull,
+                               os.devnull if opts.nalTrace != 'off' else None, opts, verbose=False)
+
+    def run(self, repeat):
+        # (benchmark, items, unit) -> results
+        cases = ((self.filter,      len(self.packets), 'packet'),
+                 (self.depacketize, len(self.packets), 'packet'),
+                 (self.parse_pacsi, len(self.pacsis),  'PACSI'),
+                 (self.pacsi_jsonl, len(self.pacsis),  'PACSI'),
+                 (self.decode_nal,  len(self.slices),  'NAL'),
+                 (self.write_frame, self.opts.frames,  'frame'),
+                 (self.yuv_file,    self.opts.frames,  'frame'),
+                 (self.end_to_end,  len(self.packets), 'packet'))
+        results = {}
+        for fn, items, unit in cases:
+            t = best_time(fn, repeat)
+            results[fn.__name__] = {'items': items, 'unit': unit, 'seconds': t,
+                                    'usPerItem': 1e6 * t / items if items else 0.0}
+        return results
+
+def compare(results, baseline, threshold):
+    # prints the change of every benchmark against the baseline, returns the
+    # names of those slower by more than threshold %
+    slower = []
+    for name in sorted(results):
+        base = baseline.get(name)
+        if base is None or not base['usPerItem']:
+            continue
+        change = 100.0 * (results[name]['usPerItem'] - base['usPerItem']) / base['usPerItem']
+        flag   = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            slower.append(name)
+        print "%-12s %10.3f -> %10.3f us  %+6.1f%%%s" % \
+              (name, base['usPerItem'], results[name]['usPerItem'], change, flag)
+    return slower
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark pcap2yuv on a synthetic capture with a "
+                                                 "stub decoder.")
+    parser.add_argument('--frames', type=int, default=DEF_FRAMES,
+                        help="access units of the synthetic capture. Default is " + str(DEF_FRAMES))
+    parser.add_argument('--layers', type=int, default=synthpcap.DEF_LAYERS, choices=range(1, 8),
+                        help="spatial layers. Default is " + str(synthpcap.DEF_LAYERS))
+    parser.add_argument('--mtu', type=int, default=synthpcap.DEF_MTU,
+                        help="max RTP payload size. Default is " + str(synthpcap.DEF_MTU))
+    parser.add_argument('--width', type=int, default=DEF_WIDTH,
+                        help="stub decoder picture width. Default is " + str(DEF_WIDTH))
+    parser.add_argument('--height', type=int, default=DEF_HEIGHT,
+                        help="stub decoder picture height. Default is " + str(DEF_HEIGHT))
+    parser.add_argument('--nal-trace', dest='nalTrace', default='off',
+                        choices=pcap2yuv.naltrace.TRACE_MODES,
+                        help="NAL trace of the end_to_end benchmark. Default is off")
+    parser.add_argument('--repeat', type=int, default=DEF_REPEAT,
+                        help="runs per benchmark, the best one counts. Default is " + str(DEF_REPEAT))
+    parser.add_argument('--save', metavar='FILE', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='FILE',
+                        help="compare with results saved by --save; exit status is 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=DEF_THRESHOLD,
+                        help="slowdown in %% reported as regression. Default is " + str(DEF_THRESHOLD))
+    return parser
+
+def main(opts):
+    tmpDir = tempfile.mkdtemp()
+    try:
+        pcapFile = os.path.join(tmpDir, 'bench.pcap')
+        synthpcap.write_pcap(pcapFile, opts.frames, layers=opts.layers, mtu=opts.mtu)
+        results  = Bench(pcapFile, opts).run(opts.repeat)
+    finally:
+        shutil.rmtree(tmpDir)
+    for name in sorted(results):
+        r = results[name]
+        print "%-12s %8d %-6s %10.3f us/%s" % (name, r['items'], r['unit'] + 's', r['usPerItem'], r['unit'])
+    params = dict((k, getattr(opts, k)) for k in ('frames', 'layers', 'mtu', 'width', 'height', 'nalTrace'))
+    if opts.save:
+        fd = open(opts.save, 'w')
+        json.dump({'version': BENCH_VERSION, 'params': params, 'results': results}, fd,
+                  indent=1, sort_keys=True)
+        fd.close()
+        print "Results written in", opts.save
+    if opts.baseline:
+        base = json.load(open(opts.baseline))
+        if base.get('params') != params:
+            print "WARNING: baseline was run with different parameters:", base.get('params')
+        print ""
+        if compare(results, base['results'], opts.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(build_arg_parser().parse_args()))
@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+import shutil
+import os
+from functools import partial
+import synthpcap
+import stubdecoder
+import pcap2yuv
+from pcapreader import open_pcap
+
+# fixture of the tests decoding synthetic captures with the stub decoder, in
+# a temporary directory removed afterwards
+WIDTH  = 16
+HEIGHT = 8
+LAYERS = 2
+
+def options(**opts):
+    # pcap2yuv.Options decoding with the stub decoder, opts set on top
+    options = pcap2yuv.Options()
+    options.decoder = partial(stubdecoder.StubDecoder, WIDTH, HEIGHT, LAYERS)
+    for name, value in opts.items():
+        setattr(options, name, value)
+    return options
+
+class DecodeCase(unittest.TestCase):
+    # setUp writes the capture in.pcap of FRAMES access units, GOP apart
+    # IDRs and CAPTURE options of synthpcap.write_pcap
+    FRAMES  = 12
+    GOP     = 5
+    CAPTURE = {}
+
+    def setUp(self):
+        self.tmpDir   = tempfile.mkdtemp()
+        self.pcapFile = self.path('in.pcap')
+        self.write_capture(self.pcapFile, **self.CAPTURE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def path(self, name):
+        return os.path.join(self.tmpDir, name)
+
+    def write_capture(self, fileName, frames=None, gop=None, **capture):
+        return synthpcap.write_pcap(fileName, frames or self.FRAMES, gop or self.GOP, LAYERS, mtu=600,
+                                    minSlice=10, maxSlice=1500, **capture)
+
+    def packets(self, pcapFile=None):
+        return pcap2yuv.filter_packets(open_pcap(pcapFile or self.pcapFile), set(), set())
+
+    def decode_stream(self, outFile, pkts=None, pacsiFile='pacsi.txt', nalFile=None, **opts):
+        # decode_stream of the capture (or pkts) into files of the temporary
+        # directory, returns the session
+        return pcap2yuv.decode_stream(pkts if pkts is not None else self.packets(),
+                                      self.path(outFile), pacsiFile and self.path(pacsiFile),
+                                      nalFile and self.path(nalFile), options(**opts), verbose=False)
+
+    def main(self, outFile, pcapFile=None, pacsiFile='pacsi.txt', nalFile='nal.txt', **opts):
+        # exit status of pcap2yuv.main, without filters
+        return pcap2yuv.main(pcapFile or self.pcapFile, '', '', self.path(outFile),
+                             self.path(pacsiFile), self.path(nalFile), options(**opts))
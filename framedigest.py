@@ -0,0 +1,91 @@
+import hashlib
+import yuvfile
+
+# per-frame digests of the decoded frames, written instead of the YUV file.
+# A digest is the one of the frame as it would be in the YUV file
+DIGEST_ALGOS    = ('md5', 'sha1', 'sha256')
+DEF_DIGEST_ALGO = 'md5'
+# records buffered before each write
+DIGEST_BATCH    = 256
+# columns of a record, tab separated; the last one is named after the algorithm
+HEADER_COLUMNS  = ('frame', 'width', 'height')
+
+def digest_header(algo):
+    return '\t'.join(HEADER_COLUMNS + (algo,)) + '\n'
+
+def load_digests(fileName):
+    # (algorithm, [(width, height, digest)] of frame 0, 1, ...) of a digest
+    # list. Raises IOError or ValueError if it cannot be read
+    fd = open(fileName)
+    try:
+        header = fd.readline().rstrip('\n').split('\t')
+        if tuple(header[:-1]) != HEADER_COLUMNS or header[-1] not in DIGEST_ALGOS:
+            raise ValueError('not a frame digest list: ' + fileName)
+        digests = []
+        for line in fd:
+            frame, width, height, digest = line.rstrip('\n').split('\t')
+            if int(frame) != len(digests):
+                raise ValueError('frame ' + frame + ' out of order in ' + fileName)
+            digests.append((int(width), int(height), digest))
+    finally:
+        fd.close()
+    return header[-1], digests
+
+def yuv_digests(yuvFile, algo=DEF_DIGEST_ALGO):
+    # (width, height, digest) of every frame of a YUV file with its frame
+    # index, e.g. to make a reference list out of a known-good YUV file
+    index = yuvfile.load_frame_index(yuvfile.index_file_name(yuvFile))
+    if index is None:
+        raise IOError('No frame index for ' + yuvFile)
+    for n in range(index.frames):
+        width, height, data = yuvfile.read_frame(yuvFile, n, index)
+        yield width, height, hashlib.new(algo, data).hexdigest()
+
+class DigestList:
+    # digests of the decoded frames, written to fd if given and checked
+    # against the reference ones if given. The first mismatch is kept,
+    # callers stop decoding once there is one
+
+    def __init__(self, fd, algo=DEF_DIGEST_ALGO, reference=None):
+        self.fd        = fd
+        self.algo      = algo
+        self.reference = reference
+        self.pending   = [digest_header(algo)] if fd is not None else []
+        self.frames    = 0
+        self.mismatch  = None
+
+    def add_frame(self, dec):
+        # digest of the last frame of the decoder
+        h = hashlib.new(self.algo)
+        dec.hash_frame(h)
+        self.add(dec.frame.Width, dec.frame.Height, h.hexdigest())
+
+    def add(self, width, height, digest):
+        n = self.frames
+        self.frames += 1
+        if self.fd is not None:
+            self.pending.append('%d\t%d\t%d\t%s\n' % (n, width, height, digest))
+            if len(self.pending) >= DIGEST_BATCH:
+                self.flush()
+        if self.reference is None or self.mismatch is not None:
+            return
+        if n >= len(self.reference):
+            self.mismatch = 'frame %d is not in the reference (%d frames)' % (n, len(self.reference))
+        elif self.reference[n] != (width, height, digest):
+            self.mismatch = 'frame %d is %dx%d %s, reference is %dx%d %s' % \
+                            ((n, width, height, digest) + self.reference[n])
+
+    def flush(self):
+        if self.pending:
+            self.fd.write(''.join(self.pending))
+            self.pending = []
+
+    def close(self, complete=True):
+        # writes pending records, the file is left open. Frames of the
+        # reference that were not decoded are a mismatch if the whole stream
+        # was decoded
+        if self.reference is not None and self.mismatch is None and complete and \
+           self.frames < len(self.reference):
+            self.mismatch = '%d frames decoded, reference has %d' % (self.frames, len(self.reference))
+        if self.fd is not None:
+            self.flush()
@@ -0,0 +1,76 @@
+from struct import Struct
+from nal import NAL_NRI_MASK, NAL_TYPE_MASK, NAL_EXT_IDR_MASK, NAL_SLICE, NAL_IDR, NAL_PREFIX, \
+                NAL_SLICE_EXT
+
+# NALs making up the pictures of an access unit
+VCL_TYPES      = (NAL_SLICE, NAL_IDR, NAL_PREFIX, NAL_SLICE_EXT)
+SLICE_TYPES    = (NAL_SLICE, NAL_IDR, NAL_SLICE_EXT)
+# first_mb_in_slice is 0 (ue(v) coded as a single 1 bit) in the first slice of a picture
+FIRST_MB_MASK  = 0x80
+
+# nal may be a memoryview, whose items are strings
+_u8 = Struct('B').unpack_from
+
+class FrameSelector:
+    # picks the decoded frames to write: those of IDR access units only and/or
+    # one access unit out of every. An access unit starts at a prefix NAL, or
+    # at a base layer slice with first_mb_in_slice 0 not preceded by one.
+    # NALs of access units that are not written are not decoded when no other
+    # picture depends on them: every NAL of non IDR access units when only
+    # IDR frames are kept, non-reference (NRI 0) ones otherwise
+
+    def __init__(self, keyOnly=False, every=1):
+        self.keyOnly    = keyOnly
+        self.every      = every
+        # access units that may be written, i.e. IDR ones with keyOnly
+        self.candidates = 0
+        self.skipped    = 0
+        # current access unit
+        self.key        = False
+        self.selected   = True
+        self.decoded    = False
+        self.sliceSeen  = False
+        # the last NAL is the first slice of the access unit, and whether
+        # the previous access unit that was decoded is to be written
+        self.firstSlice   = False
+        self.prevSelected = True
+        self.prefixOpen   = False
+
+    def decode(self, nal):
+        # whether nal goes to the decoder
+        hdr     = _u8(nal, 0)[0]
+        nalType = hdr & NAL_TYPE_MASK
+        if nalType in (NAL_PREFIX, NAL_SLICE, NAL_IDR) and len(nal) > 1:
+            ext = _u8(nal, 1)[0]
+            if nalType == NAL_PREFIX or (not self.prefixOpen and ext & FIRST_MB_MASK):
+                self.start(nalType == NAL_IDR or bool(nalType == NAL_PREFIX and ext & NAL_EXT_IDR_MASK))
+        self.prefixOpen = nalType == NAL_PREFIX
+        self.firstSlice = False
+        if nalType not in VCL_TYPES:
+            return True
+        if not self.selected and ((self.keyOnly and not self.key) or not hdr & NAL_NRI_MASK):
+            self.skipped += 1
+            return False
+        self.decoded = True
+        if nalType in SLICE_TYPES:
+            self.firstSlice = not self.sliceSeen
+            self.sliceSeen  = True
+        return True
+
+    def start(self, key):
+        if self.decoded:
+            self.prevSelected = self.selected
+        self.key       = key
+        self.decoded   = False
+        self.sliceSeen = False
+        if key or not self.keyOnly:
+            self.candidates += 1
+            self.selected = (self.candidates - 1) % self.every == 0
+        else:
+            self.selected = False
+
+    def write_image(self):
+        # whether the picture the decoder returned for the last NAL is to be
+        # written. Pictures are returned once the first slice of the next one
+        # is decoded, so that slice returns the previous access unit
+        return self.prevSelected if self.firstSlice else self.selected
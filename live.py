@@ -0,0 +1,166 @@
+import os
+import time
+import errno
+import signal
+import socket
+import select
+import rtp
+
+# live sources given in place of the pcap file name: a pcap stream on stdin
+# (e.g. from tcpdump -U -w -) or RTP over UDP received on [HOST:]PORT
+SOURCE_STDIN     = '-'
+SOURCE_UDP       = 'udp:'
+DEF_LISTEN_HOST  = '0.0.0.0'
+# max time a packet is held waiting for a missing one before it is declared lost
+DEF_MAX_DELAY    = 0.2
+# seconds between checks for a stop request while no packet arrives
+POLL_INTERVAL    = 0.2
+# socket receive buffer, absorbing bursts while a frame is being decoded
+RECV_BUF_SIZE    = 8 * 1024 * 1024
+# bytes read from stdin at once
+READ_CHUNK       = 64 * 1024
+MAX_DATAGRAM     = 65535
+
+def is_live(source):
+    return source == SOURCE_STDIN or source.startswith(SOURCE_UDP)
+
+def udp_address(source):
+    # (host, port) of a udp:[HOST:]PORT source
+    host, _, port = source[len(SOURCE_UDP):].rpartition(':')
+    try:
+        return host or DEF_LISTEN_HOST, int(port)
+    except ValueError:
+        raise ValueError('invalid UDP source: ' + source)
+
+class StopRequest:
+    # set on SIGINT/SIGTERM, so that live streams end cleanly and the outputs
+    # are completed instead of interrupted
+
+    def __init__(self):
+        self.stopped  = False
+        self.previous = {}
+
+    def install(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.previous[signum] = signal.signal(signum, self.handler)
+
+    def uninstall(self):
+        for signum, handler in self.previous.items():
+            signal.signal(signum, handler)
+        self.previous = {}
+
+    def handler(self, signum, frame):
+        self.stopped = True
+
+class StdinStream:
+    # stdin as a file for pcapreader.PcapReader, read in chunks of what is
+    # available. Reading ends at end of file or on a stop request, even while
+    # waiting for data
+
+    def __init__(self, stop, fd=0):
+        self.fd   = fd
+        self.stop = stop
+        self.buf  = bytearray()
+
+    def _fill(self):
+        while not self.stop.stopped:
+            try:
+                ready = select.select([self.fd], [], [], POLL_INTERVAL)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if ready:
+                chunk = os.read(self.fd, READ_CHUNK)
+                self.buf.extend(chunk)
+                return len(chunk) > 0
+        return False
+
+    def read(self, size):
+        while len(self.buf) < size and not self.stop.stopped:
+            if not self._fill():
+                break
+        data = str(self.buf[:size])
+        del self.buf[:size]
+        return data
+
+    def readinto(self, data):
+        chunk = self.read(len(data))
+        data[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self):
+        pass
+
+class LiveSource:
+    # reader of a live source; closing it also restores the signal handlers
+    # of the stop request
+
+    def __init__(self, reader, stop):
+        self.reader = reader
+        self.stop   = stop
+
+    def close(self):
+        self.stop.uninstall()
+        self.reader.close()
+
+class UdpReceiver:
+    # RTP packets received on a UDP socket, filtered like filter_packets. The
+    # stream ends on a stop request or after idleTimeout seconds without any
+    # packet passing the filters. With ticks, None is yielded on each poll
+    # without packets, so that packets held for reordering can be released
+
+    def __init__(self, host, port):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUF_SIZE)
+        self.sock.bind((host, port))
+
+    def address(self):
+        return self.sock.getsockname()
+
+    def packets(self, filterSrcIp, filterSSRC, stop, idleTimeout=None, ticks=False):
+        sock   = self.sock
+        pktIdx = 0
+        last   = time.time()
+        # payloads are copied out by parse_rtp, so one buffer does
+        buf    = bytearray(MAX_DATAGRAM)
+        sock.setblocking(False)
+        while not stop.stopped:
+            try:
+                ready = select.select([sock], [], [], POLL_INTERVAL)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready and ticks:
+                yield None
+            # drain the socket before waiting again
+            while ready and not stop.stopped:
+                try:
+                    size, (srcIp, _) = sock.recvfrom_into(buf)
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        break
+                    raise
+                pktIdx += 1
+                srcIp   = rtp.ip_to_int(srcIp)
+                if filterSrcIp and srcIp not in filterSrcIp:
+                    continue
+                ssrc = rtp.peek_ssrc(buf, 0, size)
+                if ssrc is None or (filterSSRC and ssrc not in filterSSRC):
+                    continue
+                p = rtp.parse_rtp(buf, 0, size)
+                if p is None:
+                    continue
+                p.index = pktIdx
+                p.time  = time.time()
+                p.srcIp = srcIp
+                yield p
+                # idle from now on, not while the packet was decoded
+                last = time.time()
+            # packets filtered out wake the loop too
+            if idleTimeout is not None and time.time() - last > idleTimeout:
+                return
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,122 @@
+import sys
+import json
+import time
+import resource
+
+# seconds between two progress lines
+PROGRESS_INTERVAL = 0.5
+# timed stages, in report order. Times are exclusive: filter does not include
+# pcap reading, depacketize does not include decode, write and PACSI parsing
+STAGE_PCAP        = 'pcap'
+STAGE_FILTER      = 'filter'
+STAGE_DEPACKETIZE = 'depacketize'
+STAGE_DECODE      = 'decode'
+STAGE_WRITE       = 'write'
+STAGE_PACSI       = 'pacsi'
+STAGES            = (STAGE_PCAP, STAGE_FILTER, STAGE_DEPACKETIZE, STAGE_DECODE, STAGE_WRITE, STAGE_PACSI)
+COUNTERS          = ('packets', 'nals', 'frames', 'bytes')
+
+clock = time.time
+
+class RunMetrics:
+    # counters and cumulative stage times of a run. Stages running in other
+    # threads only add to their own entries of times
+
+    def __init__(self):
+        self.started  = clock()
+        self.times    = dict.fromkeys(STAGES, 0.0)
+        self.packets  = 0
+        self.nals     = 0
+        self.frames   = 0
+        self.bytes    = 0
+        self.nalTypes = {}
+        # (outer, inner) stages whose times are nested, see nest()
+        self.nested   = []
+        # counters at the last progress line
+        self.shownAt  = self.started
+        self.shown    = (0, 0, 0, 0)
+
+    def nest(self, outer, *inner):
+        # the time of outer includes the time of inner stages, subtracted in report()
+        self.nested.extend((outer, stage) for stage in inner)
+
+    def add_nal(self, nalType):
+        self.nals += 1
+        self.nalTypes[nalType] = self.nalTypes.get(nalType, 0) + 1
+
+    def add_frame(self, size):
+        self.frames += 1
+        self.bytes  += size
+
+    def counters(self):
+        return (self.packets, self.nals, self.frames, self.bytes)
+
+    def progress(self, queues=(), force=False):
+        # status line with the rates since the previous one, at most every
+        # PROGRESS_INTERVAL seconds
+        now     = clock()
+        elapsed = now - self.shownAt
+        if not force and elapsed < PROGRESS_INTERVAL:
+            return
+        counters = self.counters()
+        rates    = [(c - s) / elapsed if elapsed > 0 else 0.0 for c, s in zip(counters, self.shown)]
+        self.shownAt, self.shown = now, counters
+        print "\r%d pkts  %.0f pkts/s  %.0f NALs/s  %.1f frames/s  %.2f MB/s" % \
+              (self.packets, rates[0], rates[1], rates[2], rates[3] / (1024 * 1024)),
+        for q in queues:
+            print q.name, str(q.fill()) + "/" + str(q.maxsize),
+        sys.stdout.flush()
+
+    def merge(self, report):
+        # adds the report() of a run decoding packets read by this one, e.g.
+        # of a session worker; packets were already counted when read
+        for stage in STAGES:
+            self.times[stage] += report['times'][stage]
+        for name in COUNTERS[1:]:
+            setattr(self, name, getattr(self, name) + report[name])
+        for nalType, count in report['nalTypes'].items():
+            self.nalTypes[int(nalType)] = self.nalTypes.get(int(nalType), 0) + count
+
+    def report(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        times = dict(self.times)
+        for outer, inner in self.nested:
+            times[outer] -= self.times[inner]
+        rep = {'elapsed': clock() - self.started,
+               'times': times,
+               'nalTypes': dict((str(t), c) for t, c in sorted(self.nalTypes.items())),
+               # kilobytes on Linux; for worker processes the largest of them
+               'peakMemoryKB': usage,
+               'peakChildMemoryKB': child}
+        for name in COUNTERS:
+            rep[name] = getattr(self, name)
+        return rep
+
+    def save(self, fileName, **extra):
+        rep = self.report()
+        rep.update(extra)
+        fd = open(fileName, 'w')
+        try:
+            json.dump(rep, fd, indent=1, sort_keys=True)
+            fd.write('\n')
+        finally:
+            fd.close()
+
+def timed(items, metrics, stage):
+    # yields items, adding the time spent getting each one to a stage
+    it    = iter(items)
+    times = metrics.times
+    try:
+        while True:
+            t = clock()
+            try:
+                item = next(it)
+            except StopIteration:
+                times[stage] += clock() - t
+                return
+            times[stage] += clock() - t
+            yield item
+    finally:
+        if hasattr(it, 'close'):
+            it.close()
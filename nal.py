@@ -0,0 +1,216 @@
+from struct import Struct
+
+# ---------------
+# --- NAL HEADER
+# ---------------
+NAL_F_MASK             = 0x80
+NAL_NRI_MASK           = 0x60
+NAL_TYPE_MASK          = 0x1f
+# SVC extension (prefix and coded slice extension NALs), first byte
+NAL_EXT_IDR_MASK       = 0x40
+NAL_EXT_LEN            = 3
+# SVC extension (and PACSI) fields, second and third byte
+NAL_EXT_DID_MASK       = 0x70
+NAL_EXT_QID_MASK       = 0x0f
+NAL_EXT_TID_MASK       = 0xe0
+# highest layer identifiers, i.e. no layer limit
+MAX_DID                = 7
+MAX_QID                = 15
+MAX_TID                = 7
+# FU header
+FU_S_MASK              = 0x80
+FU_E_MASK              = 0x40
+# ---------------
+# --- NAL TYPES
+# ---------------
+NAL_SLICE              = 1
+NAL_IDR                = 5
+NAL_SEI                = 6
+NAL_SPS                = 7
+NAL_PPS                = 8
+NAL_AUD                = 9
+NAL_PREFIX             = 14
+NAL_SUBSET_SPS         = 15
+NAL_SLICE_EXT          = 20
+STAP_A                 = 24
+STAP_B                 = 25
+MTAP16                 = 26
+MTAP24                 = 27
+FU_A                   = 28
+FU_B                   = 29
+PACSI                  = 30
+NI_MTAP                = 31
+PARAMETER_SETS         = (NAL_SPS, NAL_PPS, NAL_SUBSET_SPS)
+# STAP-A sub NAL size field
+STAP_SIZE_LEN          = 2
+# decoding order number of STAP-B and FU-B, DON base of MTAPs (interleaved
+# packetization mode), 16 bit
+DON_LEN                = 2
+DON_MOD                = 1 << 16
+# MTAP16/MTAP24 unit after its size: DON distance and timestamp offset
+MTAP16_UNIT_LEN        = 3
+MTAP24_UNIT_LEN        = 4
+# RFC 6190 NI-MTAP: subtype and J flag following the NAL header, with J set
+# every unit has a DON after its timestamp offset
+NI_MTAP_SUBTYPE_MASK   = 0xf8
+NI_MTAP_SUBTYPE        = 2 << 3
+NI_MTAP_J_MASK         = 0x04
+NI_MTAP_UNIT_LEN       = 2
+AGGREGATES             = (STAP_A, STAP_B, MTAP16, MTAP24, NI_MTAP)
+# SPS id follows profile_idc, constraint flags and level_idc; ids fit in
+# 4 bytes of Exp-Golomb (at most 255)
+SPS_ID_OFFSET          = 3
+EXP_GOLOMB_BYTES       = 4
+
+# byte reads go through Struct, buf may be a memoryview (see rtp)
+_u8   = Struct('B').unpack_from
+_u8x2 = Struct('BB').unpack_from
+_u16  = Struct('>H').unpack_from
+
+def aggregated_nals(buf, start, end):
+    # (start, end, DON) of every NAL aggregated in a STAP-A, STAP-B, MTAP16,
+    # MTAP24 or NI-MTAP payload. DON is None for NALs sent in decoding order
+    # (STAP-A, NI-MTAP without J)
+    nalType = _u8(buf, start)[0] & NAL_TYPE_MASK
+    pos     = start + 1
+    don     = None
+    unitLen = 0
+    if nalType == STAP_B:
+        if pos + DON_LEN > end:
+            return
+        don  = _u16(buf, pos)[0]
+        pos += DON_LEN
+    elif nalType in (MTAP16, MTAP24):
+        if pos + DON_LEN > end:
+            return
+        # DON base
+        don     = _u16(buf, pos)[0]
+        pos    += DON_LEN
+        unitLen = MTAP16_UNIT_LEN if nalType == MTAP16 else MTAP24_UNIT_LEN
+    elif nalType == NI_MTAP:
+        if pos >= end or _u8(buf, pos)[0] & NI_MTAP_SUBTYPE_MASK != NI_MTAP_SUBTYPE:
+            return
+        withDon = bool(_u8(buf, pos)[0] & NI_MTAP_J_MASK)
+        unitLen = NI_MTAP_UNIT_LEN + (DON_LEN if withDon else 0)
+        pos    += 1
+    while pos + STAP_SIZE_LEN < end:
+        size = _u16(buf, pos)[0]
+        pos += STAP_SIZE_LEN
+        if unitLen:
+            if pos + unitLen > end:
+                return
+            if nalType == NI_MTAP:
+                nalDon = _u16(buf, pos + NI_MTAP_UNIT_LEN)[0] if withDon else None
+            else:
+                nalDon = (don + _u8(buf, pos)[0]) % DON_MOD
+            pos += unitLen
+        else:
+            # STAP-B: the NALs that follow the first one have the next DONs
+            nalDon = don
+            if don is not None:
+                don = (don + 1) % DON_MOD
+        if size:
+            yield pos, min(pos + size, end), nalDon
+        pos += size
+
+def _is_base_idr_ext(buf, pos, end):
+    # whether the SVC extension at pos has idr_flag set in the base
+    # dependency layer (DID 0)
+    return pos + 1 < end and bool(_u8(buf, pos)[0] & NAL_EXT_IDR_MASK) and \
+           not _u8(buf, pos + 1)[0] & NAL_EXT_DID_MASK
+
+def _is_key_nal(buf, pos, end):
+    # IDR slices, prefix and SVC slice NALs of the base dependency layer with
+    # idr_flag set. An IDR in an enhancement layer only (announced by PACSIs
+    # with the I flag as well) does not refresh the base layer
+    nalType = _u8(buf, pos)[0] & NAL_TYPE_MASK
+    if nalType == NAL_IDR:
+        return True
+    if nalType in (NAL_PREFIX, NAL_SLICE_EXT):
+        return _is_base_idr_ext(buf, pos + 1, end)
+    return False
+
+def is_key_payload(buf, start, end):
+    # whether an RTP payload starts or carries a key picture: an IDR picture
+    # of the base layer
+    if start >= end:
+        return False
+    nalType = _u8(buf, start)[0] & NAL_TYPE_MASK
+    if nalType in AGGREGATES:
+        for pos, nalEnd, don in aggregated_nals(buf, start, end):
+            if _is_key_nal(buf, pos, nalEnd):
+                return True
+        return False
+    if nalType in (FU_A, FU_B):
+        if start + 1 >= end or not _u8(buf, start + 1)[0] & FU_S_MASK:
+            return False
+        fuType = _u8(buf, start + 1)[0] & NAL_TYPE_MASK
+        if fuType == NAL_IDR:
+            return True
+        # the SVC extension follows the FU header, and the DON for FU-B
+        ext = start + 2 if nalType == FU_A else start + 2 + DON_LEN
+        return fuType == NAL_SLICE_EXT and _is_base_idr_ext(buf, ext, end)
+    return _is_key_nal(buf, start, end)
+
+def parameter_set_nals(buf, start, end):
+    # (start, end) of the SPS, PPS and subset SPS NALs of an RTP payload
+    if start >= end:
+        return
+    nalType = _u8(buf, start)[0] & NAL_TYPE_MASK
+    if nalType in AGGREGATES:
+        for pos, nalEnd, don in aggregated_nals(buf, start, end):
+            if (_u8(buf, pos)[0] & NAL_TYPE_MASK) in PARAMETER_SETS:
+                yield pos, nalEnd
+    elif nalType in PARAMETER_SETS:
+        yield start, end
+
+def _exp_golomb(buf, pos, end, skip):
+    # unsigned Exp-Golomb value after the first skip bytes of RBSP from pos
+    # (emulation prevention bytes removed), or None if it does not fit
+    bits  = 0
+    count = 0
+    zeros = 0
+    while count < skip + EXP_GOLOMB_BYTES and pos < end:
+        b    = _u8(buf, pos)[0]
+        pos += 1
+        if zeros >= 2 and b == 3:
+            zeros = 0
+            continue
+        zeros  = zeros + 1 if b == 0 else 0
+        count += 1
+        if count > skip:
+            bits = bits << 8 | b
+    if count < skip + EXP_GOLOMB_BYTES:
+        bits <<= 8 * (skip + EXP_GOLOMB_BYTES - count)
+    size  = 8 * EXP_GOLOMB_BYTES
+    zeros = size - bits.bit_length()
+    if 2 * zeros + 1 > size:
+        return None
+    return (bits >> (size - 2 * zeros - 1)) - 1
+
+def parameter_set_id(buf, start, end):
+    # seq_parameter_set_id of an SPS or subset SPS, pic_parameter_set_id of
+    # a PPS, None if truncated
+    nalType = _u8(buf, start)[0] & NAL_TYPE_MASK
+    skip    = 0 if nalType == NAL_PPS else SPS_ID_OFFSET
+    return _exp_golomb(buf, start + 1, end, skip)
+
+def carries_parameter_sets(buf, start, end):
+    # whether an RTP payload carries SPS, PPS or subset SPS NALs
+    for nal in parameter_set_nals(buf, start, end):
+        return True
+    return False
+
+def ext_layer(buf, pos):
+    # (DID, QID, TID) of the SVC extension following the header byte at pos
+    b2, b3 = _u8x2(buf, pos + 2)
+    return (b2 & NAL_EXT_DID_MASK) >> 4, b2 & NAL_EXT_QID_MASK, (b3 & NAL_EXT_TID_MASK) >> 5
+
+def above_layer(nalType, buf, pos, end, layer):
+    # whether a prefix, SVC slice or PACSI NAL whose header byte (or FU header)
+    # is at pos belongs to a layer above the target (DID, QID, TID)
+    if nalType not in (NAL_PREFIX, NAL_SLICE_EXT, PACSI) or pos + NAL_EXT_LEN >= end:
+        return False
+    did, qid, tid = ext_layer(buf, pos)
+    tDid, tQid, tTid = layer
+    return did > tDid or (did == tDid and qid > tQid) or tid > tTid
@@ -0,0 +1,54 @@
+# NAL trace modes: nothing, per (NAL type, result) counts written at the end,
+# or one record per NAL
+TRACE_OFF      = 'off'
+TRACE_SUMMARY  = 'summary'
+TRACE_FULL     = 'full'
+TRACE_MODES    = (TRACE_OFF, TRACE_SUMMARY, TRACE_FULL)
+# decode results of a traced NAL
+RES_OK         = 'ok'
+RES_IMAGE      = 'image'
+RES_GHOST      = 'ghost'
+RES_ERROR      = 'error'
+RES_PACSI      = 'pacsi'
+RES_DROPPED    = 'dropped'
+RES_SKIPPED    = 'skipped'
+# records buffered before each write
+TRACE_BATCH    = 1024
+# columns of a full trace record, tab separated
+RECORD_HEADER  = 'index\ttype\tsize\tresult\twidth\theight\n'
+SUMMARY_HEADER = 'type\tresult\tcount\tbytes\n'
+
+class NalTrace:
+    # NAL trace written to fd; callers skip it altogether when the trace is off
+
+    def __init__(self, fd, mode=TRACE_FULL):
+        self.fd      = fd
+        self.mode    = mode
+        self.pending = [RECORD_HEADER] if mode == TRACE_FULL else []
+        # (NAL type, result) -> [count, bytes]
+        self.counts  = {}
+
+    def add(self, index, nalType, size, result, width=0, height=0):
+        if self.mode == TRACE_FULL:
+            self.pending.append('%d\t%d\t%d\t%s\t%d\t%d\n' % (index, nalType, size, result, width, height))
+            if len(self.pending) >= TRACE_BATCH:
+                self.flush()
+            return
+        count = self.counts.get((nalType, result))
+        if count is None:
+            count = self.counts[(nalType, result)] = [0, 0]
+        count[0] += 1
+        count[1] += size
+
+    def flush(self):
+        if self.pending:
+            self.fd.write(''.join(self.pending))
+            self.pending = []
+
+    def close(self):
+        # writes pending records or the summary, the file is left open
+        if self.mode == TRACE_SUMMARY:
+            self.pending.append(SUMMARY_HEADER)
+            for (nalType, result), (count, size) in sorted(self.counts.items()):
+                self.pending.append('%d\t%s\t%d\t%d\n' % (nalType, result, count, size))
+        self.flush()
@@ -1,4 +1,7 @@
-from struct import unpack
+import json
+from operator import attrgetter
+from binascii import hexlify
+from struct import Struct, unpack, unpack_from
 
 # ---------
 # --- PACSI
@@ -78,39 +81,87 @@ FPS_MAP                = {0:'7.5',1:'12.5',2:'15',3:'25',4:'30',5:'50',6:'60'}
 BSINFO_LEN             = 2
 BSINFO_FMT             = 'BB'
 
-class Pacsi:
+def mask_shift(mask):
+    shifts = 0
+    while not mask & 0x01:
+        mask    = mask >> 1
+        shifts += 1
+    return shifts
+
+# shift of every 8 bit mask
+MASK_SHIFTS = [0] + [mask_shift(mask) for mask in range(1, 256)]
+
+def byte_table(*masks):
+    # for every byte value, the tuple of its bitfields under masks
+    shifts = [MASK_SHIFTS[mask] for mask in masks]
+    return tuple(tuple((b & mask) >> shift for mask, shift in zip(masks, shifts))
+                 for b in range(256))
+
+# byte value -> decoded bitfields
+F_NRI_TYPE_TABLE       = byte_table(F_MASK, NRI_MASK, TYPE_MASK)
+R_I_PRID_TABLE         = byte_table(R_MASK, I_MASK, PRID_MASK)
+N_DID_QID_TABLE        = byte_table(N_MASK, DID_MASK, QID_MASK)
+TID_U_D_O_RR_TABLE     = byte_table(TID_MASK, U_MASK, D_MASK, O_MASK, RR_MASK)
+X_Y_T_A_P_C_S_E_TABLE  = byte_table(X_MASK, Y_MASK, T_MASK, A_MASK, P_MASK, C_MASK, S_MASK, E_MASK)
+SL_R_P_TABLE           = byte_table(SL_R_MASK, SL_P_MASK)
+FPS_IDX_LT_TABLE       = byte_table(FPS_IDX_MASK, LT_MASK)
+PRID_CB_R_TABLE        = byte_table(LD_PRID_MASK, CB_MASK, LD_R_MASK)
+
+def lazy_field(index):
+    # read-only attribute backed by the fields() tuple, decoded on first access
+    return property(lambda self: self.fields()[index])
+
+# ------------------
+# --- PACSI RECORDS
+# ------------------
+# output formats: text dump, one JSON object per line, fixed width binary records
+PACSI_FMT_TEXT         = 'text'
+PACSI_FMT_JSONL        = 'jsonl'
+PACSI_FMT_BINARY       = 'binary'
+PACSI_FORMATS          = (PACSI_FMT_TEXT, PACSI_FMT_JSONL, PACSI_FMT_BINARY)
+# (column, struct/numpy type) of a binary record, little endian. Absent
+# optional fields and SEIs are -1
+PACSI_RECORD           = (('index', 'I'), ('rtpTs', 'I'),
+                          ('f', 'B'), ('nri', 'B'), ('type', 'B'), ('r', 'B'), ('i', 'B'),
+                          ('prid', 'B'), ('n', 'B'), ('did', 'B'), ('qid', 'B'), ('tid', 'B'),
+                          ('u', 'B'), ('d', 'B'), ('o', 'B'), ('rr', 'B'), ('x', 'B'), ('y', 'B'),
+                          ('t', 'B'), ('a', 'B'), ('p', 'B'), ('c', 'B'), ('s', 'B'), ('e', 'B'),
+                          ('tl0picidx', 'h'), ('idrpicid', 'i'), ('donc', 'i'), ('seiCount', 'B'),
+                          ('layerCount', 'h'), ('refFrmCount', 'h'), ('numOfNaluUnit', 'h'))
+PACSI_RECORD_STRUCT    = Struct('<' + ''.join(t for _, t in PACSI_RECORD))
+# records buffered before each write
+PACSI_WRITE_BATCH      = 256
+# distinct SEIs whose JSON encoding is kept for reuse
+SEI_JSON_CACHE_LEN     = 1024
+# header fields, in record order
+PACSI_HEAD_FIELDS      = ('f', 'nri', 'type', 'r', 'i', 'prid', 'n', 'did', 'qid',
+                          'tid', 'u', 'd', 'o', 'rr', 'x', 'y', 't', 'a', 'p', 'c', 's', 'e')
+pacsi_head             = attrgetter(*PACSI_HEAD_FIELDS)
+# stream layout fields, in fields() order
+SL_FIELDS              = ('lpb0', 'lpb1', 'lpb2', 'lpb3', 'lpb4', 'lpb5', 'lpb6', 'lpb7', 'r', 'p')
+
+class Pacsi(object):
+    __slots__ = ('f', 'nri', 'type', 'r', 'i', 'prid', 'n', 'did', 'qid',
+                 'tid', 'u', 'd', 'o', 'rr', 'x', 'y', 't', 'a', 'p', 'c', 's', 'e',
+                 'tl0picidx', 'idrpicid', 'donc', 'seiList')
     
     def __init__(self, f_nri_type, r_i_prid, 
                        n_did_qid, tid_u_d_o_rr,
                        x_y_t_a_p_c_s_e ):
-        self.f    = get_bitfield(f_nri_type, F_MASK)    
-        self.nri  = get_bitfield(f_nri_type, NRI_MASK) 
-        self.type = get_bitfield(f_nri_type, TYPE_MASK)
-        self.r    = get_bitfield(r_i_prid, R_MASK)
-        self.i    = get_bitfield(r_i_prid, I_MASK)
-        self.prid = get_bitfield(r_i_prid, PRID_MASK)
-        self.n    = get_bitfield(n_did_qid, N_MASK)
-        self.did  = get_bitfield(n_did_qid, DID_MASK)
-        self.qid  = get_bitfield(n_did_qid, QID_MASK)
-        self.tid  = get_bitfield(tid_u_d_o_rr, TID_MASK)
-        self.u    = get_bitfield(tid_u_d_o_rr, U_MASK)
-        self.d    = get_bitfield(tid_u_d_o_rr, D_MASK)
-        self.o    = get_bitfield(tid_u_d_o_rr, O_MASK)
-        self.rr   = get_bitfield(tid_u_d_o_rr, RR_MASK)
-        self.x    = get_bitfield(x_y_t_a_p_c_s_e, X_MASK)
-        self.y    = get_bitfield(x_y_t_a_p_c_s_e, Y_MASK)
-        self.t    = get_bitfield(x_y_t_a_p_c_s_e, T_MASK)
-        self.a    = get_bitfield(x_y_t_a_p_c_s_e, A_MASK)
-        self.p    = get_bitfield(x_y_t_a_p_c_s_e, P_MASK)
-        self.c    = get_bitfield(x_y_t_a_p_c_s_e, C_MASK)
-        self.s    = get_bitfield(x_y_t_a_p_c_s_e, S_MASK)
-        self.e    = get_bitfield(x_y_t_a_p_c_s_e, E_MASK)
+        self.f, self.nri, self.type = F_NRI_TYPE_TABLE[f_nri_type & 0xff]
+        self.r, self.i, self.prid   = R_I_PRID_TABLE[r_i_prid & 0xff]
+        self.n, self.did, self.qid  = N_DID_QID_TABLE[n_did_qid & 0xff]
+        self.tid, self.u, self.d, \
+        self.o, self.rr             = TID_U_D_O_RR_TABLE[tid_u_d_o_rr & 0xff]
+        self.x, self.y, self.t, \
+        self.a, self.p, self.c, \
+        self.s, self.e              = X_Y_T_A_P_C_S_E_TABLE[x_y_t_a_p_c_s_e & 0xff]
         
         self.tl0picidx = None
         self.idrpicid  = None
         self.donc      = None
         self.seiList   = []
-        
+
     def add_opt_Y(self, tl0picidx, idrpicid):
         self.tl0picidx = tl0picidx
         self.idrpicid  = idrpicid
@@ -120,6 +171,30 @@ class Pacsi:
         
     def add_sei(self, sei):
         self.seiList.append(sei)
+
+    def head_dict(self):
+        d = dict(zip(PACSI_HEAD_FIELDS, pacsi_head(self)))
+        for name in ('tl0picidx', 'idrpicid', 'donc'):
+            if getattr(self, name) is not None:
+                d[name] = getattr(self, name)
+        return d
+
+    def to_dict(self):
+        d = self.head_dict()
+        d['seiList'] = [sei.to_dict() for sei in self.seiList]
+        return d
+
+    def pack_record(self, index, rtpTs):
+        layerCount = refFrmCount = numOfNaluUnit = -1
+        for sei in self.seiList:
+            if isinstance(sei, StreamLayout):
+                layerCount = len(sei.layerList)
+            elif isinstance(sei, BitStreamInfo):
+                refFrmCount, numOfNaluUnit = sei.fields()
+        opt = [-1 if v is None else v for v in (self.tl0picidx, self.idrpicid, self.donc)]
+        return PACSI_RECORD_STRUCT.pack(index, rtpTs & 0xffffffff,
+                                        *list(pacsi_head(self)) +
+                                        opt + [len(self.seiList), layerCount, refFrmCount, numOfNaluUnit])
         
     def __str__(self):
         s  = "------------"             + "\n"
@@ -156,15 +231,29 @@ class Pacsi:
             s += str(sei)
         return s
         
-class Sei:
+class Sei(object):
+    # the payload is kept as a view on the PACSI NAL, subclasses decode their
+    # fields from it when first read
+    __slots__ = ('f', 'nri', 'type', 'payloadType', 'payloadSize', 'view')
     
     def __init__(self, F_NRI_TYPE, payloadType, payloadSize, payload):
-        self.f           = get_bitfield(F_NRI_TYPE, F_MASK)
-        self.nri         = get_bitfield(F_NRI_TYPE, NRI_MASK)
-        self.type        = get_bitfield(F_NRI_TYPE, TYPE_MASK)  
+        self.f, self.nri, self.type = F_NRI_TYPE_TABLE[F_NRI_TYPE & 0xff]
         self.payloadType = payloadType
         self.payloadSize = payloadSize
-        self.payload     = payload
+        self.view        = payload if isinstance(payload, memoryview) else memoryview(payload)
+
+    @property
+    def payload(self):
+        return bytearray(self.view)
+
+    def head_dict(self):
+        return {'f': self.f, 'nri': self.nri, 'type': self.type,
+                'payloadType': self.payloadType, 'payloadSize': self.payloadSize}
+
+    def to_dict(self):
+        d = self.head_dict()
+        d['payload'] = hexlify(self.view.tobytes())
+        return d
     
     def __print_hex(self, bs):
         s = ''
@@ -196,28 +285,44 @@ class Sei:
         return s      
         
 class StreamLayout(Sei):
+    __slots__ = ('decoded', 'layers')
     
     def __init__(self, F_NRI_TYPE, payloadType, payloadSize, payload):
         Sei.__init__(self, F_NRI_TYPE, payloadType, payloadSize, payload)
-        ptr = UUID_LEN
-        self.lpb0, self.lpb1, \
-        self.lpb2, self.lpb3, \
-        self.lpb4, self.lpb5, \
-        self.lpb6, self.lpb7 = extract_fields(payload, ptr, LPB_FMT, LPB_LEN)
-        ptr   += LPB_LEN
-        r_p    = extract_fields(payload, ptr, R_P_FMT, R_P_LEN)[0]
-        self.r = get_bitfield(r_p, SL_R_MASK)
-        self.p = get_bitfield(r_p, SL_P_MASK)
-        ptr   += R_P_LEN
-        
-        self.layerList = []
-        if self.p:
-            ldLen = extract_fields(payload, ptr, LDL_FMT, LDL_LEN)[0]
-            ptr  += LDL_LEN
-            while ptr < len(payload):
-                ld    = extract_fields(payload, ptr, LD_FMT, ldLen)
-                self.layerList.append(LayerDescription(*ld))
-                ptr  += ldLen
+        self.decoded = None
+        self.layers  = None
+
+    def fields(self):
+        # (lpb0 .. lpb7, r, p)
+        if self.decoded is None:
+            ptr          = UUID_LEN
+            lpb          = unpack_from(LPB_FMT, self.view, ptr)
+            r_p          = unpack_from(R_P_FMT, self.view, ptr + LPB_LEN)[0]
+            self.decoded = lpb + SL_R_P_TABLE[r_p]
+        return self.decoded
+
+    lpb0, lpb1, lpb2, lpb3, lpb4, lpb5, lpb6, lpb7, r, p = [lazy_field(i) for i in range(10)]
+
+    @property
+    def layerList(self):
+        if self.layers is None:
+            self.layers = []
+            if self.p:
+                ptr   = UUID_LEN + LPB_LEN + R_P_LEN
+                ldLen = unpack_from(LDL_FMT, self.view, ptr)[0]
+                ptr  += LDL_LEN
+                while ptr < len(self.view):
+                    ld    = unpack_from(LD_FMT, self.view, ptr)
+                    self.layers.append(LayerDescription(*ld))
+                    ptr  += ldLen
+        return self.layers
+
+    def to_dict(self):
+        d = self.head_dict()
+        d.update(zip(SL_FIELDS, self.fields()))
+        d['sei'] = 'streamLayout'
+        d['layerList'] = [ld.to_dict() for ld in self.layerList]
+        return d
                 
     def __str__(self):
         s  = "-----------------------" + "\n"
@@ -240,7 +345,9 @@ class StreamLayout(Sei):
             s += str(ld)
         return s
                  
-class LayerDescription:
+class LayerDescription(object):
+    __slots__ = ('codedWidth', 'codedHeight', 'dispWidth', 'dispHeight', 'bitrate',
+                 'fpsIdx', 'lt', 'prid', 'cb', 'r', 'r2')
     
     def __init__(self, codedWidth, codedHeight, dispWidth, dispHeight, bitrate,
                        fpsIdx_lt, prid_cb_r, r2):
@@ -249,12 +356,12 @@ class LayerDescription:
         self.dispWidth   = dispWidth
         self.dispHeight  = dispHeight
         self.bitrate     = bitrate
-        self.fpsIdx      = get_bitfield(fpsIdx_lt, FPS_IDX_MASK) 
-        self.lt          = get_bitfield(fpsIdx_lt, LT_MASK)
-        self.prid        = get_bitfield(prid_cb_r, LD_PRID_MASK)
-        self.cb          = get_bitfield(prid_cb_r, CB_MASK)
-        self.r           = get_bitfield(prid_cb_r, LD_R_MASK)
+        self.fpsIdx, self.lt         = FPS_IDX_LT_TABLE[fpsIdx_lt & 0xff]
+        self.prid, self.cb, self.r   = PRID_CB_R_TABLE[prid_cb_r & 0xff]
         self.r2          = r2
+
+    def to_dict(self):
+        return dict(zip(self.__slots__, layer_fields(self)))
         
     def __str__(self):
         s  = "-- LAYER DESCRIPTION --"                      + "\n"
@@ -272,12 +379,28 @@ class LayerDescription:
         s += "R2             :" + str(self.r2)              + "\n"
         return s   
 
+layer_fields = attrgetter(*LayerDescription.__slots__)
+
 class BitStreamInfo(Sei):
+    __slots__ = ('decoded',)
     
     def __init__(self, F_NRI_TYPE, payloadType, payloadSize, payload):
         Sei.__init__(self, F_NRI_TYPE, payloadType, payloadSize, payload)
-        ptr = UUID_LEN
-        self.refFrmCount, self.numOfNaluUnit = extract_fields(payload, ptr, BSINFO_FMT, BSINFO_LEN)
+        self.decoded = None
+
+    def fields(self):
+        # (refFrmCount, numOfNaluUnit)
+        if self.decoded is None:
+            self.decoded = unpack_from(BSINFO_FMT, self.view, UUID_LEN)
+        return self.decoded
+
+    refFrmCount, numOfNaluUnit = [lazy_field(i) for i in range(2)]
+
+    def to_dict(self):
+        d = self.head_dict()
+        d['sei'] = 'bitStreamInfo'
+        d['refFrmCount'], d['numOfNaluUnit'] = self.fields()
+        return d
 
     def __str__(self):
         s  = "------------------------" + "\n"
@@ -289,51 +412,84 @@ class BitStreamInfo(Sei):
         s += "NUM OF NALU UNIT :" + str(self.numOfNaluUnit) + "\n" 
         return s
 
+class PacsiWriter(object):
+    # writes parsed PACSIs to fd in one of PACSI_FORMATS; jsonl and binary
+    # records are tagged with packet index and RTP timestamp and written in
+    # batches of PACSI_WRITE_BATCH
+
+    def __init__(self, fd, fmt=PACSI_FMT_TEXT):
+        self.fd       = fd
+        self.fmt      = fmt
+        self.pending  = []
+        self.seiCache = {}
+
+    def sei_json(self, sei):
+        # stream layout and bitstream info SEIs mostly repeat unchanged, so
+        # their encoding is cached by content
+        key = (sei.f, sei.nri, sei.type, sei.payloadType, sei.payloadSize, sei.view.tobytes())
+        s   = self.seiCache.get(key)
+        if s is None:
+            if len(self.seiCache) >= SEI_JSON_CACHE_LEN:
+                self.seiCache.clear()
+            s = self.seiCache[key] = json.dumps(sei.to_dict(), separators=(',', ':'))
+        return s
+
+    def write(self, pacsi, index, rtpTs):
+        if self.fmt == PACSI_FMT_JSONL:
+            d = pacsi.head_dict()
+            d['index'], d['rtpTs'] = index, rtpTs
+            seis = ','.join([self.sei_json(sei) for sei in pacsi.seiList])
+            self.pending.append(json.dumps(d, separators=(',', ':'))[:-1] +
+                                ',"seiList":[' + seis + ']}\n')
+        elif self.fmt == PACSI_FMT_BINARY:
+            self.pending.append(pacsi.pack_record(index, rtpTs))
+        else:
+            self.pending.append('\n' + str(pacsi) + '\n')
+        if len(self.pending) >= PACSI_WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.fd.write(''.join(self.pending))
+            self.pending = []
+
 def get_bitfield(field, mask):
-    bitfield = field & mask
-    shifts   = 0
-    while not mask & 0x01:
-        mask    = mask >> 1
-        shifts += 1
-    return bitfield >> shifts
+    return (field & mask) >> MASK_SHIFTS[mask]
 
 def extract_fields(byteArray, startByte, fmtString, totalLen):
     return unpack(fmtString, str(byteArray[startByte : startByte + totalLen]))
     
 def parse_pacsi(nal, nalSize):
+    # SEIs keep views on nal: their fields are only decoded when read
+    view      = memoryview(nal)[:nalSize]
     ptr       = 0
-    pacsi     = Pacsi(*extract_fields(nal, ptr, PACSI_HEAD_FMT, PACSI_HEAD_LEN))
+    pacsi     = Pacsi(*unpack_from(PACSI_HEAD_FMT, view, ptr))
     ptr      += PACSI_HEAD_LEN
     if pacsi.y:
-        pacsi.add_opt_Y(*extract_fields(nal, ptr, PACSI_Y_OPT_FIELDS_FMT, PACSI_Y_OPT_FIELDS_LEN))
+        pacsi.add_opt_Y(*unpack_from(PACSI_Y_OPT_FIELDS_FMT, view, ptr))
         ptr += PACSI_Y_OPT_FIELDS_LEN
     if pacsi.t:
-        pacsi.add_opt_T(*extract_fields(nal, ptr, PACSI_T_OPT_FIELDS_FMT, PACSI_T_OPT_FIELDS_LEN))
+        pacsi.add_opt_T(*unpack_from(PACSI_T_OPT_FIELDS_FMT, view, ptr))
         ptr += PACSI_T_OPT_FIELDS_LEN
     while ptr < nalSize:
         # get SEI size and SEI
-        seiSize    = extract_fields(nal, ptr, SEI_SIZE_FMT, SEI_SIZE_LEN)[0]
+        seiSize    = unpack_from(SEI_SIZE_FMT, view, ptr)[0]
         ptr       += SEI_SIZE_LEN
-        seiNal     = nal[ptr : ptr + seiSize]
+        seiNal     = view[ptr : ptr + seiSize]
         ptr       += seiSize
         # identify first fields of SEI
-        fNriType, paylType, paylSize = extract_fields(seiNal, 0, SEI_HDR_FMT, SEI_HDR_LEN)
+        fNriType, paylType, paylSize = unpack_from(SEI_HDR_FMT, seiNal, 0)
         if SEI_HDR_LEN + UUID_LEN < seiSize:
-            uuid = seiNal[SEI_HDR_LEN : SEI_HDR_LEN + UUID_LEN]
+            uuid = seiNal[SEI_HDR_LEN : SEI_HDR_LEN + UUID_LEN].tobytes()
         else:
-            uuid = bytearray()
+            uuid = ''
         payload    = seiNal[SEI_HDR_LEN :]
         # create SEI of proper type
         if   uuid == STREAM_LAYOUT_UUID:
             sei = StreamLayout(fNriType, paylType, paylSize, payload)
-            pacsi.add_sei(sei)
         elif uuid == BITSREAM_INFO_UUID:
             sei = BitStreamInfo(fNriType, paylType, paylSize, payload)
-            pacsi.add_sei(sei)      
         else:
             sei = Sei(fNriType, paylType, paylSize, payload)
-            pacsi.add_sei(sei)
+        pacsi.add_sei(sei)
     return pacsi
-    
-          
-        
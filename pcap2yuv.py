@@ -1,126 +1,701 @@
 #! /usr/bin/env python
 
 import sys
+import copy
 import os.path
-from os import fstat
-import logging
-logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
-import scapy.all as _s
+import shutil
+import argparse
+import heapq
+import tempfile
+import cPickle
+import multiprocessing
+from Queue import Empty, Full
+from itertools import chain, dropwhile
 import svcdecoder as svc
-from struct import unpack
-from pacsi import parse_pacsi
+import rtp
+import reorder
+import pipeline
+import pcapindex
+import naltrace
+import metrics
+import annexb
+import yuvfile
+import framesel
+import framedigest
+import quality
+import live
+from metrics import RunMetrics, timed
+from nal import is_key_payload, carries_parameter_sets, parameter_set_nals, parameter_set_id, \
+                above_layer, aggregated_nals, MAX_DID, MAX_QID, MAX_TID, DON_LEN
+from struct import Struct
+from pacsi import parse_pacsi, PacsiWriter, PACSI_FORMATS, PACSI_FMT_TEXT, PACSI_FMT_BINARY
+from pcapreader import open_pcap, PcapReader, PcapFormatError
 
 # output files
 defYUVFile     = "out.yuv"
+defAnnexBFile  = "out.264"
+defDigestFile  = "out.digests"
+defQualityFile = "out.quality"
 defPACSIFIle   = "pacsi.txt"
 defNALFile     = "nal.txt"
 # constants
 warnOutFileSize = 1024*1024*1024
 warnUnitMeasure = 'GB'
 nalTypeBits     = 0x1f 
+# session demultiplexing: packets per batch sent to a worker, batches queued
+sessionsBySSRC    = 'ssrc'
+sessionsBySrcIp   = 'srcip'
+sessionBatchLen   = 256
+sessionQueueLen   = 32
+# GOP segments queued per worker process of --jobs, bytes copied at once when
+# stitching their outputs
+segmentQueueLen   = 2
+stitchChunk       = 4 * 1024 * 1024
+# time bases of --start/--end
+timeBasePcap      = 'pcap'
+timeBaseRtp       = 'rtp'
+rtpClockRate      = 90000
+# kinds of items handed from the depacketizer to the decoder stage
+itemTrace         = 0
+itemNal           = 1
+# the items that follow came in another packet, see defer_nal
+itemPacket        = 2
+# header reads of NALs, which may be views on a mapped capture (see pcapreader)
+_u8               = Struct('B').unpack_from
+_u8x2             = Struct('BB').unpack_from
+_u16              = Struct('>H').unpack_from
+# STAP-A sub NAL size and header
+_stapNal          = Struct('>HB').unpack_from
 
-def display_help():
-    print "Usage: " , sys.argv[0] , " <pcap file> <src IP filter> <SSRC filter> [out yuv file] [out pacsi file] [out NAL file]"
-    print "     <pcap file>      : pcap file name"
-    print "     <src IP filter>  : source IP address of packets to be decoded. Ex. 10.0.0.1"
-    print "     <SSRC filter>    : RTP SSRC value of packets to be decoded in decimal format."
-    print "                        Use comma to separate multiple SSRCs. Ex. 889614168,889614169"
-    print "     [out yuv file]   : Output yuv file name. Default is", defYUVFile
-    print "     [out pacsi file] : Output pacsi file name. Default is", defPACSIFIle
-    print "     [out NAL file]   : Output NAL file name. Default is", defNALFile
+class Options:
+    # optional settings of a run; command line options override these defaults
+    reorderDepth = reorder.DEF_REORDER_DEPTH
+    # NALs of interleaved packetization held to put them in decoding order
+    interleaveDepth = reorder.DEF_DON_DEPTH
+    # seconds a packet waits for a missing one; live sources default to live.DEF_MAX_DELAY
+    maxDelay     = None
+    # live sources: end the stream after this many seconds without packets
+    idleTimeout  = None
+    sessions     = None
+    # worker processes decoding sessions at once, the number of CPUs if None
+    sessionJobs  = None
+    queueSize    = pipeline.DEF_QUEUE_SIZE
+    noIndex      = False
+    start        = None
+    end          = None
+    timeBase     = timeBasePcap
+    frames       = None
+    # frame selection: IDR frames only, one frame out of everyNth
+    keyFrames    = False
+    everyNth     = 1
+    indexFile    = None
+    # target layer: highest DID, QID and TID kept (None means no limit)
+    targetDid    = None
+    targetQid    = None
+    targetTid    = None
+    pacsiFormat  = PACSI_FMT_TEXT
+    nalTrace     = naltrace.TRACE_FULL
+    report       = None
+    # callable returning the decoder, svcdecoder.SVCDecoder if None (see stubdecoder)
+    decoder      = None
+    # write the depacketized NALs as an Annex B stream instead of decoding them
+    annexB       = False
+    dropPacsi    = False
+    pipeline     = False
+    # worker processes decoding GOP segments, see decode_segments
+    jobs         = 1
+    # least packets of a GOP segment besides the access unit it starts with:
+    # short GOPs are merged, so that each does not cost a new decoder
+    segmentPackets = 2048
+    # hash the frames instead of writing them, and check the digests against
+    # a reference list (see framedigest); verify implies digest
+    digest       = False
+    digestAlgo   = framedigest.DEF_DIGEST_ALGO
+    verify       = None
+    # reference YUV file and its (width, height): per-frame PSNR (and SSIM)
+    # are written instead of the frames, see quality
+    psnr         = None
+    refSize      = None
+    # frame rate of the --psnr reference, None to take it from the timestamps
+    refFps       = None
+    ssim         = False
 
-def display_status(current, total):
-    print "\r" + str(current) + "/" + str(total), 
-    sys.stdout.flush()    
+class DecodeSession:
+    # outputs, decoder and depacketization state of one decoded stream
+
+    def __init__(self, fd, fdp, fdn, dec):
+        self.fd          = fd
+        self.fdp         = fdp
+        self.fdn         = fdn
+        self.dec         = dec
+        # NAL trace, None when off
+        self.trace       = None
+        self.metrics     = None
+        # NAL sinks add to the decode, write and PACSI stage times, only
+        # taken for --report
+        self.timeNals    = False
+        self.nalBuf      = bytearray()
+        # DON of the fragmented NAL, None unless it started with an FU-B
+        self.fuDon       = None
+        self.fuDiscard   = False
+        # NALs of interleaved packets waiting for their decoding order
+        self.donBuf      = reorder.DonBuffer()
+        self.droppedNals = 0
+        # PACSI output and the packet being decoded, which tags its records
+        self.pacsiOut     = None
+        self.packet       = None
+        # frame selection, None when every frame is written
+        self.selector     = None
+        # Annex B output replacing the decoder, see write_annexb
+        self.annexB       = None
+        self.dropPacsi    = False
+        # target (DID, QID, TID), NALs above it are dropped before decoding
+        self.layer        = None
+        self.layerDropped = 0
+        self.prefixDrop   = False
+        self.fuSkip       = False
+        # receives every depacketized NAL
+        self.nalSink     = decode_nal_and_write
+        self.items       = []
+        # packet the decoder stage takes the next items for
+        self.itemsPacket = None
+        # digests written and checked instead of the frames, see framedigest
+        self.digests     = None
+        # PSNR/SSIM against the reference written instead of the frames
+        self.quality     = None
+        # frames written; none are while decoding preroll packets
+        self.frames      = 0
+        self.preroll     = False
+        # filled in when the stream is over
+        self.width        = 0
+        self.height       = 0
+        self.reorderStats = None
+
+    def discard_fu(self):
+        # drop an incomplete fragmented NAL instead of decoding it
+        if self.nalBuf or not self.fuDiscard:
+            self.droppedNals += 1
+        self.nalBuf[:] = bytearray()
+        self.fuDiscard = True
+
+    def above_layer(self, nalType, buf, pos, end):
+        # whether a NAL is above the target layer and must be dropped; an AVC
+        # base layer slice goes with the prefix NAL preceding it
+        if self.layer is None:
+            return False
+        if nalType in (1, 5):
+            drop = self.prefixDrop
+        else:
+            drop = above_layer(nalType, buf, pos, end, self.layer)
+        self.prefixDrop = drop and nalType == 14
+        if drop:
+            self.layerDropped += 1
+            if self.trace is not None:
+                self.trace.add(self.packet.index, nalType, end - pos, naltrace.RES_DROPPED)
+        return drop
+
+class DeferredTrace:
+    # stands in for the NAL trace in the depacketizer stage, so that trace
+    # records reach the decoder stage in order with their NALs
+
+    def __init__(self, ses):
+        self.ses = ses
+
+    def add(self, *record):
+        self.ses.items.append((itemTrace, record))
+
+def defer_nal(ses, nal, nalSize):
+    # NAL sink of the depacketizer stage: NALs may be views on packets, so
+    # copy. NALs out of the DON buffer name the packet they came in
+    if ses.packet is not ses.itemsPacket:
+        ses.items.append((itemPacket, ses.packet))
+        ses.itemsPacket = ses.packet
+    ses.items.append((itemNal, bytearray(nal[:nalSize])))
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Generate YUV file from pcap file containing RTP "
+                                                 "packets carrying video encoded in H.264-SVC.")
+    parser.add_argument('pcapFile', metavar='<pcap file>',
+                        help="pcap file name, or a live source: '" + live.SOURCE_STDIN + "' for a pcap "
+                             "stream on stdin (e.g. tcpdump -U -w -), '" + live.SOURCE_UDP +
+                             "[HOST:]PORT' for RTP received over UDP")
+    parser.add_argument('filterSrcIp', metavar='<src IP filter>',
+                        help="source IP address of packets to be decoded. Ex. 10.0.0.1")
+    parser.add_argument('filterSSRC', metavar='<SSRC filter>',
+                        help="RTP SSRC value of packets to be decoded in decimal format. "
+                             "Use comma to separate multiple SSRCs. Ex. 889614168,889614169")
+    parser.add_argument('outFile', metavar='out yuv file', nargs='?',
+                        help="Output yuv file name, .264 file name with --annexb, frame digest list "
+                             "with --digest or frame quality with --psnr. Default is " + defYUVFile +
+                             ", " + defAnnexBFile + ", " + defDigestFile + " or " + defQualityFile)
+    parser.add_argument('outPacsiFile', metavar='out pacsi file', nargs='?', default=defPACSIFIle,
+                        help="Output pacsi file name. Default is " + defPACSIFIle)
+    parser.add_argument('outNalFile', metavar='out NAL file', nargs='?', default=defNALFile,
+                        help="Output NAL file name. Default is " + defNALFile)
+    add_options(parser)
+    return parser
+
+def add_options(parser):
+    # decoding options, shared with batch.py
+    parser.add_argument('--reorder-depth', dest='reorderDepth', type=int, metavar='N',
+                        help="max out-of-order RTP packets held per SSRC before declaring the "
+                             "missing ones lost. 0 disables reordering. Default is " +
+                             str(Options.reorderDepth))
+    parser.add_argument('--interleave-depth', dest='interleaveDepth', type=int, metavar='N',
+                        help="max NALs of interleaved packetization (STAP-B, MTAP, FU-B, NI-MTAP with "
+                             "DONs) held to put them in decoding order. Default is " +
+                             str(Options.interleaveDepth))
+    parser.add_argument('--max-delay', dest='maxDelay', type=float, metavar='SEC',
+                        help="max time an out-of-order packet waits for a missing one before that is "
+                             "declared lost. Default is no limit, " + str(live.DEF_MAX_DELAY) +
+                             " for live sources")
+    parser.add_argument('--idle-timeout', dest='idleTimeout', type=float, metavar='SEC',
+                        help="live sources: stop when no packet passed the filters for SEC seconds. "
+                             "Otherwise live decoding stops on SIGINT/SIGTERM")
+    parser.add_argument('--sessions', choices=[sessionsBySSRC, sessionsBySrcIp],
+                        help="decode every session passing the filters in its own worker process. "
+                             "A session is a (src IP, SSRC) pair with '" + sessionsBySSRC + "' or all "
+                             "SSRCs of a src IP with '" + sessionsBySrcIp + "'. Output file names get "
+                             "the session appended. Ex. out_10.0.0.1_889614168.yuv")
+    parser.add_argument('--session-jobs', dest='sessionJobs', type=int, metavar='N',
+                        help="with --sessions, decode at most N sessions at once; the packets of "
+                             "the others are spooled to disk until a worker is done. Default is "
+                             "the number of CPUs")
+    parser.add_argument('--start', type=float, metavar='SEC',
+                        help="first second to output, relative to the first packet passing the "
+                             "filters. Decoding starts at the last IDR before it")
+    parser.add_argument('--end', type=float, metavar='SEC',
+                        help="stop reading after this second, relative to the first packet "
+                             "passing the filters")
+    parser.add_argument('--time-base', dest='timeBase', choices=[timeBasePcap, timeBaseRtp],
+                        help="time of a packet for --start/--end: pcap capture time, or RTP "
+                             "timestamp (" + str(rtpClockRate) + " Hz clock, per SSRC). Default is " +
+                             Options.timeBase)
+    parser.add_argument('--frames', type=int, metavar='N',
+                        help="stop after writing N frames")
+    parser.add_argument('--keyframes', dest='keyFrames', action='store_true',
+                        help="write IDR frames only; other access units are not decoded")
+    parser.add_argument('--every', dest='everyNth', type=int, metavar='N',
+                        help="write one frame out of N (one IDR frame out of N with --keyframes); "
+                             "non-reference NALs of the others are not decoded")
+    parser.add_argument('--no-index', dest='noIndex', action='store_true',
+                        help="neither use nor write the sidecar index of the pcap file")
+    parser.add_argument('--index-file', dest='indexFile', metavar='FILE',
+                        help="sidecar index file name. Default is <pcap file>" + pcapindex.INDEX_EXT)
+    parser.add_argument('--pacsi-format', dest='pacsiFormat', choices=PACSI_FORMATS,
+                        help="PACSI output: text dump, one JSON object per line, or fixed width binary "
+                             "records (columns in pacsi.PACSI_RECORD). jsonl and binary records carry "
+                             "the packet index and RTP timestamp. Default is " + Options.pacsiFormat)
+    parser.add_argument('--nal-trace', dest='nalTrace', choices=naltrace.TRACE_MODES,
+                        help="NAL file contents: nothing (the file is not written), counts per NAL "
+                             "type and decode result, or one record per NAL with packet index, NAL "
+                             "type, size, decode result and frame size. Default is " + Options.nalTrace)
+    parser.add_argument('--report', metavar='FILE',
+                        help="write a JSON run report: time spent per stage (pcap reading, filtering, "
+                             "depacketization, decoding, frame writing, PACSI parsing), packet, NAL, "
+                             "frame and byte counts, NALs per type and peak memory")
+    parser.add_argument('--did', dest='targetDid', type=int, choices=range(MAX_DID + 1), metavar='DID',
+                        help="extract the target layer: drop NALs with a higher dependency_id")
+    parser.add_argument('--qid', dest='targetQid', type=int, choices=range(MAX_QID + 1), metavar='QID',
+                        help="extract the target layer: drop NALs of the target dependency_id "
+                             "with a higher quality_id")
+    parser.add_argument('--tid', dest='targetTid', type=int, choices=range(MAX_TID + 1), metavar='TID',
+                        help="extract the target layer: drop NALs with a higher temporal_id")
+    parser.add_argument('--annexb', dest='annexB', action='store_true',
+                        help="do not decode: write the depacketized NALs (STAP-A and FU-A contents "
+                             "included) with start codes as an H.264 Annex B stream. No PACSI file "
+                             "is written and libopensvc is not needed")
+    parser.add_argument('--drop-pacsi', dest='dropPacsi', action='store_true',
+                        help="leave PACSI NALs out of the --annexb stream")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="run pcap reading, depacketization, decoding and frame writing as "
+                             "concurrent stages connected by bounded queues")
+    parser.add_argument('--queue-size', dest='queueSize', type=int, metavar='N',
+                        help="capacity of each pipeline queue. Default is " + str(Options.queueSize))
+    parser.add_argument('--jobs', type=int, metavar='N',
+                        help="cut the stream at IDR access units and decode the GOP segments in N "
+                             "worker processes with a decoder each. Outputs are stitched back in "
+                             "order and are the same as with a single process. Not with --sessions, "
+                             "--pipeline, --annexb, --every or --frames")
+    parser.add_argument('--digest', action='store_true',
+                        help="do not write the YUV file: hash every frame straight from the decoder "
+                             "buffers and write one line per frame (number, width, height, digest) "
+                             "in the out yuv file. Default name is " + defDigestFile)
+    parser.add_argument('--digest-algo', dest='digestAlgo', choices=framedigest.DIGEST_ALGOS,
+                        help="hash of --digest. Default is " + Options.digestAlgo)
+    parser.add_argument('--verify', metavar='FILE',
+                        help="check the frame digests against the --digest list FILE of a known-good "
+                             "run, stopping at the first mismatch (exit status 1). Implies --digest, "
+                             "with the hash of FILE")
+    parser.add_argument('--psnr', metavar='REF',
+                        help="do not write the YUV file: compare every frame, straight from the "
+                             "decoder buffers, with its source frame in the YUV 4:2:0 file REF (e.g. "
+                             "the encoder's source), found by RTP timestamp and write its PSNR per plane in "
+                             "the out yuv file, and a summary in <out yuv file>" + quality.SUMMARY_EXT +
+                             ". Default name is " + defQualityFile + ". Needs numpy and --ref-size")
+    parser.add_argument('--ref-size', dest='refSize', type=quality.parse_size, metavar='WxH',
+                        help="resolution of the --psnr reference. Ex. 1280x720")
+    parser.add_argument('--ref-fps', dest='refFps', type=float, metavar='FPS',
+                        help="frame rate of the --psnr reference. Needed when not every frame of "
+                             "it is sent, e.g. with --tid or a capture of a lower frame rate. Default "
+                             "is the smallest timestamp distance between access units")
+    parser.add_argument('--ssim', action='store_true',
+                        help="with --psnr, also compute SSIM per plane (8x8 windows)")
+
+def display_outputs(outFile, width, height, outPacsiFile, outNalFile, opts):
+    if opts.annexB:
+        print "Annex B stream written in", outFile
+        if outNalFile:
+            print "List of extracted NALs is written in" , outNalFile
+        return
+    if opts.digest or opts.verify or opts.psnr:
+        if opts.psnr:
+            print "Frame quality written in", outFile, "summary in", quality.summary_file_name(outFile)
+        else:
+            print "Frame digests written in", outFile
+        print "Parsed PACSIs are written in" , outPacsiFile
+        if outNalFile:
+            print "List of decoded NALs is written in" , outNalFile
+        return
+    print "YUV file written in", outFile
+    display_footer(width, height, outPacsiFile, outNalFile)
+
+def display_quality(summary):
+    print "Frames compared: %d of %d (no reference frame left: %d, size differs: %d)" % \
+          (summary['compared'], summary['frames'], summary['noReference'], summary['sizeDiffers'])
+    if 'psnr' in summary:
+        for name in ('mean', 'min', 'global'):
+            print "PSNR %-6s Y %.3f  U %.3f  V %.3f dB" % \
+                  ((name,) + tuple(summary['psnr'][p][name] for p in quality.PLANES))
+    if 'ssim' in summary:
+        for name in ('mean', 'min'):
+            print "SSIM %-6s Y %.5f  U %.5f  V %.5f" % \
+                  ((name,) + tuple(summary['ssim'][p][name] for p in quality.PLANES))
 
 def display_footer(width, height, outPacsiFile, outNalFile):
     print "Use PYUV for viewing: http://dsplab.diei.unipg.it/pyuv_raw_video_sequence_player_original_one"
     print "Set format YUV 4:2:0 and resolution " + str(width) + "x" + str(height)
     print "Parsed PACSIs are written in" , outPacsiFile 
-    print "List of decoded NALs is written in" , outNalFile
+    if outNalFile:
+        print "List of decoded NALs is written in" , outNalFile
 
-def filter_packets(pkts, filterSrcIp, filterSSRC):
-    pkts2decode = []
-    pktcnt      = 0
-    print "Processing packets to be filtered..."
+def filter_packets(pkts, filterSrcIp, filterSSRC, indexer=None):
+    # generator stage: packets are yielded one at a time as they are read,
+    # so nothing is accumulated no matter how big the capture is.
+    # Filters are sets of integers, see rtp.parse_ip_filter/parse_ssrc_filter.
+    # If given, indexer (a pcapindex.PcapIndex) is fed every RTP packet.
+    # Packets are numbered by their record ordinal in the capture, so that
+    # they are the same when only some records are read (see read_records)
+    for ts, linktype, data, offset, ordinal in pkts:
+        udp = rtp.dissect(linktype, data)
+        if udp is None:
+            continue
+        srcIp, buf, start, end = udp
+        if indexer is not None:
+            ssrc = rtp.peek_ssrc(buf, start, end)
+            if ssrc is None:
+                continue
+            payStart, payEnd = rtp.payload_bounds(buf, start, end)
+            indexer.add(srcIp, ssrc, offset, ordinal, rtp.peek_seq(buf, start),
+                        rtp.peek_ts(buf, start), ts, is_key_payload(buf, payStart, payEnd),
+                        carries_parameter_sets(buf, payStart, payEnd))
+        if filterSrcIp and srcIp not in filterSrcIp:
+            continue
+        ssrc = rtp.peek_ssrc(buf, start, end)
+        if ssrc is None:
+            continue
+        if filterSSRC and ssrc not in filterSSRC:
+            continue
+        p = rtp.parse_rtp(buf, start, end)
+        if p is None:
+            continue
+        p.index = ordinal
+        p.time  = ts
+        p.srcIp = srcIp
+        yield p
+    if indexer is not None:
+        indexer.complete = True
+
+class PacketClock:
+    # time of packets in seconds for --start/--end, relative to the first one
+
+    def __init__(self, timeBase, origin=None):
+        self.timeBase = timeBase
+        self.origin   = origin
+        self.rtpTs    = {}
+
+    def time(self, p):
+        if self.timeBase == timeBasePcap:
+            if self.origin is None:
+                self.origin = p.time
+            return p.time - self.origin
+        # extended RTP timestamp relative to the first one of the SSRC
+        first, last = self.rtpTs.get(p.ssrc, (None, None))
+        if first is None:
+            first = last = p.timestamp
+        else:
+            delta = (p.timestamp - last) % (1 << 32)
+            if delta >= 1 << 31:
+                delta -= 1 << 32
+            last += delta
+        self.rtpTs[p.ssrc] = (first, last)
+        return float(last - first) / rtpClockRate
+
+def select_range(pkts, start, end, clock):
+    # generator stage keeping the packets in [start, end]. Reading stops after
+    # end. Packets before start are dropped up to the last key picture (its
+    # whole access unit), the rest of them are yielded flagged as preroll,
+    # after the latest parameter sets sent before them
+    pending    = None
+    # (ssrc, NAL type, parameter set id) -> (count of parameter sets seen
+    # when last sent, NAL packet, packet it was sent in)
+    params     = {}
+    paramsSeen = 0
     for p in pkts:
-        # display status
-        pktcnt += 1
-        display_status(pktcnt, len(pkts))         
-        # filter
-        if p.getlayer(_s.IP) is None:
+        if p is None:
+            # poll tick of a live source
+            yield p
             continue
-        if p.getlayer(_s.UDP) is None:
+        t = clock.time(p)
+        if end is not None and t > end:
+            return
+        if start is None or t >= start:
+            if start is not None:
+                for q in preroll_params(params, pending or [], p) + (pending or []):
+                    q.preroll = True
+                    yield q
+            pending = start = None
+            yield p
             continue
-        if not filterSrcIp or p[_s.IP].src in filterSrcIp:
-            p.getlayer(_s.UDP).decode_payload_as(_s.RTP)
-            if p[_s.RTP].version != 2:
-                continue
-            if not filterSSRC or str(p[_s.RTP].sourcesync) in filterSSRC:
-                pkts2decode.append(p)   
-    print ""
-    return pkts2decode   
+        payload = p.payload
+        if is_key_payload(payload, 0, len(payload)):
+            # restart from the first packet of this access unit
+            cut = 0
+            if pending:
+                while cut < len(pending) and (pending[cut].ssrc, pending[cut].timestamp) != \
+                                             (p.ssrc, p.timestamp):
+                    cut += 1
+                pending = pending[cut:]
+            else:
+                pending = []
+            pending.append(p)
+        elif pending is not None:
+            pending.append(p)
+        for nalStart, nalEnd in parameter_set_nals(payload, 0, len(payload)):
+            nal = bytearray(payload[nalStart:nalEnd])
+            q   = rtp.RtpPacket(p.ssrc, p.seq, p.timestamp, False, p.payloadType, nal)
+            q.index, q.time, q.srcIp = p.index, p.time, p.srcIp
+            key = (p.ssrc, nal[0] & nalTypeBits, parameter_set_id(nal, 0, len(nal)))
+            params[key] = (paramsSeen, q, p)
+            paramsSeen += 1
+
+def preroll_params(params, pending, first):
+    # NAL packets of the parameter sets (see select_range) not sent in the
+    # pending packets, in the order they were last sent. Their sequence
+    # numbers are the ones just before the first packet of their SSRC, so
+    # that they do not look lost, late or duplicated
+    kept   = set(id(q) for q in pending)
+    replay = [q for _, q, src in sorted(params.values()) if id(src) not in kept]
+    seqs   = {}
+    for q in reversed(pending + [first]):
+        seqs[q.ssrc] = q.seq
+    for q in reversed(replay):
+        if q.ssrc in seqs:
+            seqs[q.ssrc] = q.seq = (seqs[q.ssrc] - 1) % reorder.SEQ_MOD
+    return replay
 
-def decode_nal_and_write(fd, fdp, fdn, dec, nal, nalSize):
-    nalType = nal[0] & nalTypeBits
+def decode_nal_and_write(ses, nal, nalSize):
+    fd, trace, dec = ses.fd, ses.trace, ses.dec
+    times    = ses.metrics.times
+    timeNals = ses.timeNals
+    nalType  = _u8(nal, 0)[0] & nalTypeBits
+    ses.metrics.add_nal(nalType)
     if nalType == 30:
+        result = naltrace.RES_PACSI
+        if timeNals:
+            t = metrics.clock()
         try:
             pacsi = parse_pacsi(nal, nalSize)
-            fdp.write('\n')
-            fdp.write(str(pacsi))
-            fdp.write('\n')
+            ses.pacsiOut.write(pacsi, ses.packet.index, ses.packet.timestamp)
         except Exception as e:
             print "Error parsing PACSI: " , e
+            result = naltrace.RES_ERROR
+        if timeNals:
+            times[metrics.STAGE_PACSI] += metrics.clock() - t
+        if trace is not None:
+            trace.add(ses.packet.index, nalType, nalSize, result)
+    elif ses.selector is not None and not ses.selector.decode(nal):
+        if ses.quality is not None and nalType in (1, 5, 20):
+            ses.quality.sources.access_unit(ses.packet.timestamp, False)
+        if trace is not None:
+            trace.add(ses.packet.index, nalType, nalSize, naltrace.RES_SKIPPED)
     else:
         try:
-            rval = dec.decode_nal(nal, nalSize)
-            if   rval == svc.SVC_STATUS_OK.value:
-                fdn.write("NAL decoded\n")
-            elif rval == svc.SVC_IMAGE_READY.value:
-                fdn.write("Got image. Width: " + str(dec.frame.Width) + 
-                          " , Height: " + str(dec.frame.Height) + "\n")
-                dec.write_frame(fd)        
-            elif rval == svc.SVC_GHOST_IMAGE.value:
-                fdn.write("Got ghost image\n")
+            if ses.quality is not None and nalType in (1, 5, 20):
+                ses.quality.sources.access_unit(ses.packet.timestamp, True)
+            if timeNals:
+                t = metrics.clock()
+                rval = dec.decode_nal(nal, nalSize)
+                times[metrics.STAGE_DECODE] += metrics.clock() - t
+            else:
+                rval = dec.decode_nal(nal, nalSize)
+            if rval == svc.SVC_IMAGE_READY.value:
+                if ses.quality is not None:
+                    source = ses.quality.sources.picture()
+                if not ses.preroll and (ses.selector is None or ses.selector.write_image()):
+                    if timeNals:
+                        t = metrics.clock()
+                    if ses.digests is not None:
+                        ses.digests.add_frame(dec)
+                    elif ses.quality is not None:
+                        ses.quality.add_frame(dec, source)
+                    else:
+                        fd.write_frame(dec.frame_buffer(), dec.frame.Width, dec.frame.Height)
+                    if timeNals:
+                        times[metrics.STAGE_WRITE] += metrics.clock() - t
+                    ses.frames += 1
+                    ses.metrics.add_frame(yuvfile.frame_size(dec.frame.Width, dec.frame.Height))
+                if trace is not None:
+                    trace.add(ses.packet.index, nalType, nalSize, naltrace.RES_IMAGE,
+                              dec.frame.Width, dec.frame.Height)
+            elif trace is not None:
+                trace.add(ses.packet.index, nalType, nalSize,
+                          naltrace.RES_GHOST if rval == svc.SVC_GHOST_IMAGE.value else naltrace.RES_OK)
         except svc.SVCException as svcE:
             print "Error decoding NAL: " , svcE
+            if trace is not None:
+                trace.add(ses.packet.index, nalType, nalSize, naltrace.RES_ERROR)
 
-def decode_packet(fd, fdp, fdn, dec, nalBuf, p):
-    rawStr = p.getlayer(_s.Raw).load
-    nal = bytearray(rawStr)
+def write_annexb(ses, nal, nalSize):
+    # NAL sink of --annexb, in place of decode_nal_and_write
+    nalType = _u8(nal, 0)[0] & nalTypeBits
+    ses.metrics.add_nal(nalType)
+    if nalType == 30 and ses.dropPacsi:
+        result = naltrace.RES_DROPPED
+    elif ses.selector is not None and not ses.selector.decode(nal):
+        result = naltrace.RES_SKIPPED
+    else:
+        if ses.timeNals:
+            t = metrics.clock()
+            ses.annexB.write(nal, nalSize)
+            ses.metrics.times[metrics.STAGE_WRITE] += metrics.clock() - t
+        else:
+            ses.annexB.write(nal, nalSize)
+        ses.metrics.bytes += len(annexb.START_CODE) + nalSize
+        result = naltrace.RES_PACSI if nalType == 30 else naltrace.RES_OK
+    if ses.trace is not None:
+        ses.trace.add(ses.packet.index, nalType, nalSize, result)
+
+def hold_nal(ses, nal, don):
+    # NAL of interleaved packetization, decoded in DON order
+    release_nals(ses, ses.donBuf.push(don, (nal, ses.packet)))
+
+def release_nals(ses, held):
+    # each NAL out of the DON buffer is decoded as part of the packet it came
+    # in; the target layer is checked in decoding order, as prefix NALs and
+    # their base layer slices may be sent apart
+    p = ses.packet
+    for nal, q in held:
+        ses.packet, ses.preroll = q, q.preroll
+        nalSize = len(nal)
+        if not ses.above_layer(_u8(nal, 0)[0] & nalTypeBits, nal, 0, nalSize):
+            ses.nalSink(ses, nal, nalSize)
+    if p is not None:
+        ses.packet, ses.preroll = p, p.preroll
+
+def flush_nals(ses):
+    # interleaved NALs still held, at the end of the stream or before NALs
+    # sent in decoding order
+    if ses.donBuf.held:
+        release_nals(ses, ses.donBuf.flush())
+
+def decode_packet(ses, p):
+    nalBuf  = ses.nalBuf
+    nal     = p.payload
     nalSize = len(nal)
-    nalType = nal[0] & nalTypeBits
-    fdn.write("NAL type: " + str(nalType) + "\n")
+    nalType = _u8(nal, 0)[0] & nalTypeBits
+    ses.preroll = p.preroll
+    ses.packet  = p
+    # packets were lost: a fragmented NAL in progress cannot be completed
+    if p.lossBefore and nalBuf:
+        ses.discard_fu()
     # Single NAL
     if 1 <= nalType <= 23 or nalType == 30:
-        decode_nal_and_write(fd, fdp, fdn, dec, nal, nalSize) 
+        if ses.donBuf.held:
+            flush_nals(ses)
+        if not ses.above_layer(nalType, nal, 0, nalSize):
+            ses.nalSink(ses, nal, nalSize) 
     # STAP-A NAL
-    if nalType == 24:
+    elif nalType == 24:
+        if ses.donBuf.held:
+            flush_nals(ses)
         P = 1
         while P < nalSize:
-            subNalSize = unpack('>H', str(nal[P : P + 2]))[0]
+            subNalSize, subNalType = _stapNal(nal, P)
+            subNalType &= nalTypeBits
             P += 2
-            subNal     = nal[P : P + subNalSize]
-            subNalType = subNal[0] & nalTypeBits
-            fdn.write("Sub NAL type: " + str(subNalType) + "\n")
-            decode_nal_and_write(fd, fdp, fdn, dec, subNal, subNalSize) 
+            if ses.above_layer(subNalType, nal, P, min(P + subNalSize, nalSize)):
+                # a leading PACSI carries the lowest layer of the aggregate,
+                # so an AVC base slice sent after it goes with a prefix NAL
+                # of the aggregate
+                if P == 3 and subNalType == 30:
+                    ses.prefixDrop = True
+                    break
+            else:
+                ses.nalSink(ses, nal[P : P + subNalSize], subNalSize) 
             P += subNalSize 
+    # STAP-B, MTAP16, MTAP24 or NI-MTAP NAL
+    elif 25 <= nalType <= 27 or nalType == 31:
+        for start, end, don in aggregated_nals(nal, 0, nalSize):
+            if don is not None:
+                hold_nal(ses, nal[start : end], don)
+            elif not ses.above_layer(_u8(nal, start)[0] & nalTypeBits, nal, start, end):
+                flush_nals(ses)
+                ses.nalSink(ses, nal[start : end], end - start)
     # FU-A or FU-B NAL
-    if nalType == 28 or nalType == 29:
-        P = 0
-        S = (nal[P + 1] & 0x80) == 0x80
-        E = (nal[P + 1] & 0x40) == 0x40
+    elif nalType == 28 or nalType == 29:
+        fuIndicator, fuHeader = _u8x2(nal, 0)
+        S = (fuHeader & 0x80) == 0x80
+        E = (fuHeader & 0x40) == 0x40
+        # FU-B has the DON of the NAL after the FU header
+        P = 2 + DON_LEN if nalType == 29 else 2
         if S:
-            nalHeader = (nal[P] & 0xe0) | (nal[P + 1] & nalTypeBits)
+            # start without end of the previous fragmented NAL
+            if nalBuf:
+                ses.discard_fu()
+            ses.fuDiscard = False
+            if nalType == 29:
+                # its layer is checked in decoding order, see release_nals
+                ses.fuDon  = _u16(nal, 2)[0]
+                ses.fuSkip = False
+            else:
+                ses.fuDon  = None
+                ses.fuSkip = ses.above_layer(fuHeader & nalTypeBits, nal, 1, nalSize)
+                if ses.fuSkip:
+                    return
+            nalHeader = (fuIndicator & 0xe0) | (fuHeader & nalTypeBits)
             nalBuf.append(nalHeader)
-            nalBuf.extend(nal[P + 2 : P + nalSize])
-        else:
-            nalBuf.extend(nal[P + 2 : P + nalSize])
+            nalBuf.extend(nal[P : nalSize])
+        elif ses.fuSkip:
+            # rest of a NAL above the target layer
+            ses.fuSkip = not E
+            return
+        elif not nalBuf:
+            # start of this fragmented NAL was lost
             if E:
-                recNalType = nalBuf[0] & nalTypeBits
-                fdn.write("Reconstructed NAL type: " + str(recNalType) + "\n")
-                decode_nal_and_write(fd, fdp, fdn, dec, nalBuf, len(nalBuf)) 
-                nalBuf[:] = bytearray()
+                ses.discard_fu()
+                ses.fuDiscard = False
+            return
+        else:
+            nalBuf.extend(nal[P : nalSize])
+        if E:
+            # the NAL may be held by the DON buffer, the next one gets a new buffer
+            ses.nalBuf = bytearray()
+            if ses.fuDon is None:
+                flush_nals(ses)
+                ses.nalSink(ses, nalBuf, len(nalBuf))
+            else:
+                hold_nal(ses, nalBuf, ses.fuDon)
 
 def base_dir_exist(fileName): 
     outDirName = os.path.dirname(fileName)
@@ -129,85 +704,909 @@ def base_dir_exist(fileName):
         return False
     return True
 
-def main(pcapFile, filterSrcIp, filterSSRC, outFile, outPacsiFile, outNalFile):
-    warnDisplayed = False
-    filterSrcIp   = filterSrcIp.split(',') if filterSrcIp else ''
-    filterSSRC    = filterSSRC.split(',')  if filterSSRC  else ''
+def read_records(pcapFile, idxFile, filterSrcIp, filterSSRC, opts):
+    # returns (reader, records to filter, indexer, packet clock). With a valid
+    # sidecar index only the records of the matching sessions are read,
+    # starting near --start if given; otherwise all of them are, and an
+    # indexer is returned to build the index on the way
+    pkts  = open_pcap(pcapFile)
+    clock = PacketClock(opts.timeBase)
+    if opts.noIndex or not hasattr(pkts, 'iter_at'):
+        return pkts, pkts, None, clock
+    index = pcapindex.load_index(idxFile, pcapFile)
+    if index is None:
+        return pkts, pkts, pcapindex.PcapIndex(), clock
+    print "Using index", idxFile
+    records  = index.records(filterSrcIp, filterSSRC)
+    sessions = index.select(filterSrcIp, filterSSRC)
+    if sessions and opts.start is not None and opts.timeBase == timeBasePcap:
+        clock.origin = index.first_time(sessions)
+        keyOffset    = index.key_offset_before(sessions, clock.origin + opts.start)
+        # parameter sets sent before the key packet are read too, see select_range
+        records      = heapq.merge(index.param_records_before(sessions, keyOffset),
+                                   dropwhile(lambda record: record[0] < keyOffset, records))
+    return pkts, pkts.iter_at(records), None, clock
+
+def open_live(source, filterSrcIp, filterSSRC, opts, runMetrics):
+    # returns (live.LiveSource, packets passing the filters) of a pcap stream
+    # on stdin or a UDP socket. Packets are handed on as soon as they arrive
+    # and the stream ends on SIGINT/SIGTERM, so outputs are completed
+    stop = live.StopRequest()
+    if source == live.SOURCE_STDIN:
+        reader  = PcapReader(live.StdinStream(stop))
+        records = timed(reader, runMetrics, metrics.STAGE_PCAP)
+        pkts    = timed(filter_packets(records, filterSrcIp, filterSSRC), runMetrics, metrics.STAGE_FILTER)
+        runMetrics.nest(metrics.STAGE_FILTER, metrics.STAGE_PCAP)
+    else:
+        reader  = live.UdpReceiver(*live.udp_address(source))
+        # waiting for packets counts as reading. Poll ticks (None) let the
+        # reorder buffers release packets held too long (see reorder_packets)
+        pkts    = timed(reader.packets(filterSrcIp, filterSSRC, stop, opts.idleTimeout, ticks=True),
+                        runMetrics, metrics.STAGE_PCAP)
+    stop.install()
+    return live.LiveSource(reader, stop), pkts
+
+def close_records(pkts, indexer, idxFile, pcapFile):
+    pkts.close()
+    # an index is only written after a scan of the whole file
+    if indexer is None or not indexer.complete:
+        return
+    try:
+        indexer.save(idxFile, pcapFile)
+        print "Index of pcap file written in", idxFile
+    except IOError as e:
+        print "Could not write index of pcap file: ", e
+
+def main(pcapFile, filterSrcIp, filterSSRC, outFile, outPacsiFile, outNalFile, opts=None):
+    opts = opts or Options()
+    try:
+        srcIpSet = rtp.parse_ip_filter(filterSrcIp)
+        ssrcSet  = rtp.parse_ssrc_filter(filterSSRC)
+    except ValueError as e:
+        print "Invalid filter:", e
+        return 1
+    if opts.everyNth < 1:
+        print "Invalid frame selection: --every must be at least 1"
+        return 1
+    if opts.jobs < 1:
+        print "Invalid --jobs: must be at least 1"
+        return 1
+    if opts.sessionJobs is not None and opts.sessionJobs < 1:
+        print "Invalid --session-jobs: must be at least 1"
+        return 1
+    if opts.jobs > 1 and (opts.sessions or opts.pipeline or opts.annexB or opts.everyNth > 1 or
+                          opts.frames):
+        print "--jobs cannot be combined with --sessions, --pipeline, --annexb, --every or --frames"
+        return 1
+    if (opts.digest or opts.verify) and (opts.annexB or opts.jobs > 1):
+        print "--digest and --verify cannot be combined with --annexb or --jobs"
+        return 1
+    if opts.psnr:
+        if quality.numpy is None:
+            print "--psnr needs numpy"
+            return 1
+        if opts.refSize is None:
+            print "--psnr needs the resolution of the reference, see --ref-size"
+            return 1
+        if opts.annexB or opts.digest or opts.verify or opts.sessions or opts.jobs > 1:
+            print "--psnr cannot be combined with --annexb, --digest, --verify, --sessions or --jobs"
+            return 1
+        # frames are numbered from the first access unit decoded, which is
+        # not the first one of the source after a seek
+        if opts.start is not None:
+            print "--psnr cannot be combined with --start"
+            return 1
+        if opts.refFps is not None and opts.refFps <= 0:
+            print "Invalid --ref-fps: must be positive"
+            return 1
+        # access units above the target layer never reach the decoder, so
+        # their timestamps cannot give the frame period
+        if opts.targetTid is not None and opts.refFps is None:
+            print "--psnr with --tid needs the frame rate of the reference, see --ref-fps"
+            return 1
+        if not os.path.isfile(opts.psnr):
+            print "File " + opts.psnr + " does not exist"
+            return 1
+    if opts.verify:
+        if opts.sessions:
+            print "--verify cannot be combined with --sessions"
+            return 1
+        try:
+            framedigest.load_digests(opts.verify)
+        except (IOError, ValueError) as e:
+            print "Could not read reference digests: ", e
+            return 1
     # check files existence
-    if not os.path.isfile(pcapFile):
+    isLive = live.is_live(pcapFile)
+    if not isLive and not os.path.isfile(pcapFile):
         print "File " + pcapFile + " does not exist"
         return 1
     if not base_dir_exist(outFile):
         return 1
-    if not base_dir_exist(outPacsiFile):
+    if opts.annexB:
+        outPacsiFile = None
+    elif not base_dir_exist(outPacsiFile):
         return 1
-    if not base_dir_exist(outNalFile):
+    if opts.nalTrace == naltrace.TRACE_OFF:
+        outNalFile = None
+    elif not base_dir_exist(outNalFile):
         return 1        
-    # process and filter pcap
-    print "Parsing PCAP file..."
-    pkts = _s.rdpcap(pcapFile)
-    pkts2decode = filter_packets(pkts, filterSrcIp, filterSSRC)
-    if not len(pkts2decode):
+    runMetrics  = RunMetrics()
+    if isLive:
+        if opts.maxDelay is None:
+            opts = copy.copy(opts)
+            opts.maxDelay = live.DEF_MAX_DELAY
+        try:
+            pkts, pkts2decode = open_live(pcapFile, srcIpSet, ssrcSet, opts, runMetrics)
+        except (ValueError, IOError, PcapFormatError) as e:
+            print "Could not open live source " + pcapFile + ": ", e
+            return 1
+        print "Receiving packets from", pcapFile, "... (stop with Ctrl-C)"
+        indexer  = idxFile = None
+        pktClock = PacketClock(opts.timeBase)
+    else:
+        # stream and filter pcap
+        print "Parsing PCAP file..."
+        idxFile     = opts.indexFile or pcapindex.index_file_name(pcapFile)
+        try:
+            pkts, records, indexer, pktClock = read_records(pcapFile, idxFile, srcIpSet, ssrcSet, opts)
+        except PcapFormatError as e:
+            print "Could not read " + pcapFile + ": ", e
+            return 1
+        records     = timed(records, runMetrics, metrics.STAGE_PCAP)
+        pkts2decode = timed(filter_packets(records, srcIpSet, ssrcSet, indexer),
+                            runMetrics, metrics.STAGE_FILTER)
+        runMetrics.nest(metrics.STAGE_FILTER, metrics.STAGE_PCAP)
+    if opts.start is not None or opts.end is not None:
+        pkts2decode = select_range(pkts2decode, opts.start, opts.end, pktClock)
+    # past the poll ticks of a live source
+    firstPkt    = next((p for p in pkts2decode if p is not None), None)
+    if firstPkt is None:
+        close_records(pkts, indexer, idxFile, pcapFile)
         print "No packets found for applied filters (src-IP = " + str(filterSrcIp) + \
                                                    " ; SSRC = " + str(filterSSRC) + ")"
         return 1
+    pkts2decode = chain([firstPkt], pkts2decode)
+    if opts.sessions:
+        rval = decode_sessions(pkts2decode, outFile, outPacsiFile, outNalFile, opts, runMetrics)
+        close_records(pkts, indexer, idxFile, pcapFile)
+        save_report(runMetrics, opts, pcapFile)
+        return rval
     # decode packets
-    fd     = open(outFile, 'wb')  
-    fdp    = open(outPacsiFile, 'w')
-    fdn    = open(outNalFile, 'w')
-    dec    = svc.SVCDecoder()
-    nalBuf = bytearray()
-    pktcnt = 0
-    print "Decoding" , len(pkts2decode) , "packets ... "
-    for p in pkts2decode:
-        # decode
-        decode_packet(fd, fdp, fdn, dec, nalBuf, p) 
-        # display status
-        pktcnt += 1
-        display_status(pktcnt, len(pkts2decode))
-        # check yuv file size
-        if not warnDisplayed and fstat(fd.fileno()).st_size > warnOutFileSize:
-            print ""
-            print ""
-            print "WARNING: YUV file size exceeds 1", warnUnitMeasure
-            print "if you stop the program, initial part of YUV file is still readable"
-            print "YUV file is written in", outFile
-            display_footer(dec.frame.Width, dec.frame.Height, outPacsiFile, outNalFile)
-            print ""
-            warnDisplayed = True
-    print ""                         
-    dec.close()
-    fdn.close()
-    fdp.close()
-    fd.close()
+    rval = 0
+    if opts.jobs > 1:
+        print "Decoding GOP segments in", opts.jobs, "worker processes ... "
+        ses = decode_segments(pkts2decode, outFile, outPacsiFile, outNalFile, opts, runMetrics)
+        skippedNals = ses.skippedNals
+        rval = 1 if ses.failed else 0
+    else:
+        print "Decoding packets ... "
+        ses = decode_stream(pkts2decode, outFile, outPacsiFile, outNalFile, opts, runMetrics=runMetrics)
+        skippedNals = ses.selector and ses.selector.skipped
+        if opts.verify and ses.digests.mismatch is not None:
+            rval = 1
+    close_records(pkts, indexer, idxFile, pcapFile)
+    save_report(runMetrics, opts, pcapFile)
     # display final message
     print ""
-    print "YUV file written in", outFile
-    display_footer(dec.frame.Width, dec.frame.Height, outPacsiFile, outNalFile)
-    return 0  
+    print "RTP packets " + str(ses.reorderStats)
+    print "Incomplete fragmented NALs dropped:", ses.droppedNals
+    if ses.layerDropped:
+        print "NALs above target layer dropped:", ses.layerDropped
+    if ses.lateNals:
+        print "Late interleaved NALs dropped:", ses.lateNals
+    if skippedNals is not None:
+        print "NALs of frames not selected skipped:", skippedNals
+    display_outputs(outFile, ses.width, ses.height, outPacsiFile, outNalFile, opts)
+    if opts.psnr:
+        display_quality(ses.quality.summary())
+    if opts.verify:
+        if ses.digests.mismatch is not None:
+            print "Frames do not match", opts.verify + ":", ses.digests.mismatch
+        else:
+            print "All", ses.digests.frames, "frames match", opts.verify
+    return rval
+
+def save_report(runMetrics, opts, pcapFile):
+    if not opts.report:
+        return
+    try:
+        runMetrics.save(opts.report, pcapFile=pcapFile)
+        print "Run report written in", opts.report
+    except IOError as e:
+        print "Could not write run report: ", e
+
+def save_frame_index(yuv, outFile, verbose):
+    # frame offsets and sizes of the YUV file, for random access to frames
+    try:
+        yuv.index.save(yuvfile.index_file_name(outFile))
+    except IOError as e:
+        print "Could not write frame index: ", e
+        return
+    if verbose:
+        print "Frame index written in", yuvfile.index_file_name(outFile)
+
+def depacketize_stream(ses, pkts, reorderBuf):
+    # depacketizer stage: yields, per packet, the trace records and NALs it produced
+    times = ses.metrics.times
+    for p in reorder.reorder_packets(pkts, reorderBuf):
+        t = metrics.clock()
+        ses.itemsPacket = p
+        decode_packet(ses, p)
+        times[metrics.STAGE_DEPACKETIZE] += metrics.clock() - t
+        items     = ses.items
+        ses.items = []
+        yield p, items
+    # interleaved NALs still held, with no packet of their own
+    ses.itemsPacket = None
+    flush_nals(ses)
+    if ses.items:
+        yield None, ses.items
+
+def decode_items(ses, step):
+    # decoder stage
+    p, items = step
+    if p is not None:
+        ses.packet  = p
+        ses.preroll = p.preroll
+    for kind, v in items:
+        if kind == itemTrace:
+            ses.trace.add(*v)
+        elif kind == itemPacket:
+            ses.packet  = v
+            ses.preroll = v.preroll
+        else:
+            ses.nalSink(ses, v, len(v))
+
+def target_layer(opts):
+    # (DID, QID, TID) to extract, None to decode every layer
+    if opts.targetDid is None and opts.targetQid is None and opts.targetTid is None:
+        return None
+    return (MAX_DID if opts.targetDid is None else opts.targetDid,
+            MAX_QID if opts.targetQid is None else opts.targetQid,
+            MAX_TID if opts.targetTid is None else opts.targetTid)
+
+def decode_stream(pkts, outFile, outPacsiFile, outNalFile, opts, verbose=True, runMetrics=None,
+                  segment=False):
+    # reorder, depacketize and decode one stream of filtered packets. A GOP
+    # segment (see decode_segments) is already in sequence order and may
+    # have hidden packets
+    warnDisplayed = False
+    reorderBuf    = reorder.ReorderBuffer(opts.reorderDepth, opts.maxDelay)
+    digest        = opts.digest or opts.verify is not None
+    if opts.annexB:
+        fd = open(outFile, 'wb')
+    elif digest or opts.psnr:
+        fd = open(outFile, 'w')
+    else:
+        fd = yuvfile.YuvFile(outFile)
+    fdn    = open(outNalFile, 'w') if outNalFile else None
+    if opts.annexB:
+        # no decoder and no PACSI parsing: NALs go to the file as they are
+        fdp = dec = None
+        ses = DecodeSession(fd, fdp, fdn, dec)
+        ses.annexB    = annexb.AnnexBWriter(fd)
+        ses.dropPacsi = opts.dropPacsi
+        ses.nalSink   = write_annexb
+    else:
+        fdp = open(outPacsiFile, 'wb' if opts.pacsiFormat == PACSI_FMT_BINARY else 'w')
+        dec = (opts.decoder or svc.SVCDecoder)()
+        ses = DecodeSession(fd, fdp, fdn, dec)
+        ses.pacsiOut = PacsiWriter(fdp, opts.pacsiFormat)
+        if digest:
+            algo, reference = opts.digestAlgo, None
+            if opts.verify is not None:
+                algo, reference = framedigest.load_digests(opts.verify)
+            ses.digests = framedigest.DigestList(fd, algo, reference)
+        elif opts.psnr:
+            ses.quality = quality.QualityMeter(fd, quality.ReferenceYuv(opts.psnr, *opts.refSize),
+                                               opts.ssim,
+                                               opts.refFps and float(rtpClockRate) / opts.refFps)
+    # frames go to the YUV file
+    writeYuv     = dec is not None and ses.digests is None and ses.quality is None
+    ses.metrics  = runMetrics or RunMetrics()
+    ses.timeNals = opts.report is not None
+    if opts.keyFrames or opts.everyNth > 1:
+        ses.selector = framesel.FrameSelector(opts.keyFrames, opts.everyNth)
+    times        = ses.metrics.times
+    if fdn:
+        ses.trace = naltrace.NalTrace(fdn, opts.nalTrace)
+    layer  = target_layer(opts)
+    if layer is not None and dec is not None:
+        dec.set_target_layer(*layer)
+    ses.layer  = layer
+    ses.donBuf = reorder.DonBuffer(opts.interleaveDepth)
+    queues = []
+    if opts.pipeline:
+        # reader and depacketizer threads feed the decoder, a writer thread
+        # takes the frames; libopensvc calls release the GIL meanwhile
+        depSes         = DecodeSession(None, None, None, None)
+        if ses.trace is not None:
+            depSes.trace = DeferredTrace(depSes)
+        depSes.nalSink = defer_nal
+        depSes.layer   = layer
+        depSes.metrics = ses.metrics
+        depSes.donBuf  = ses.donBuf
+        pkts   = pipeline.threaded(pkts, 'read', queues, opts.queueSize)
+        steps  = pipeline.threaded(depacketize_stream(depSes, pkts, reorderBuf),
+                                   'depacketize', queues, opts.queueSize)
+        step   = decode_items
+        if writeYuv:
+            ses.fd = pipeline.FrameWriter(fd, queues, opts.queueSize)
+    else:
+        depSes = ses
+        steps  = pkts if segment else reorder.reorder_packets(pkts, reorderBuf)
+        step   = decode_segment_packet if segment else decode_packet
+        # decoding happens within depacketization
+        ses.metrics.nest(metrics.STAGE_DEPACKETIZE, metrics.STAGE_DECODE, metrics.STAGE_WRITE,
+                         metrics.STAGE_PACSI)
+    try:
+        for s in steps:
+            # decode
+            t = metrics.clock()
+            step(ses, s) 
+            if not opts.pipeline:
+                times[metrics.STAGE_DEPACKETIZE] += metrics.clock() - t
+                ses.metrics.packets += 1
+            elif s[0] is not None:
+                ses.metrics.packets += 1
+            if opts.frames and ses.frames >= opts.frames:
+                break
+            if ses.digests is not None and ses.digests.mismatch is not None:
+                break
+            if not verbose:
+                continue
+            # display status
+            ses.metrics.progress(queues)
+            # check yuv file size
+            if writeYuv and not warnDisplayed and fd.size > warnOutFileSize:
+                print ""
+                print ""
+                print "WARNING: YUV file size exceeds 1", warnUnitMeasure
+                print "if you stop the program, initial part of YUV file is still readable"
+                print "YUV file is written in", outFile
+                display_footer(dec.frame.Width, dec.frame.Height, outPacsiFile, outNalFile)
+                print ""
+                warnDisplayed = True
+        else:
+            # the stream is over: interleaved NALs still held are decoded
+            # (by the depacketizer stage in the pipeline)
+            if not opts.pipeline:
+                flush_nals(ses)
+        if hasattr(steps, 'close'):
+            steps.close()
+        if opts.pipeline and writeYuv:
+            ses.fd.close()
+    except BaseException:
+        # a failure or Ctrl-C: the YUV file is still cut to the frames written
+        exc = sys.exc_info()
+        abort_output(ses.fd, fd, steps)
+        raise exc[0], exc[1], exc[2]
+    if verbose:
+        ses.metrics.progress(queues, force=True)
+        print ""                         
+        for q in queues:
+            print q
+    if dec is not None:
+        dec.close()
+        ses.pacsiOut.flush()
+        fdp.close()
+        ses.width  = dec.frame.Width
+        ses.height = dec.frame.Height
+    else:
+        ses.annexB.flush()
+    if ses.digests is not None:
+        # frames of the reference after --frames are not missing
+        ses.digests.close(complete=not (opts.frames and ses.frames >= opts.frames))
+    if ses.quality is not None:
+        ses.quality.close(outFile)
+    if fdn:
+        ses.trace.close()
+        fdn.close()
+    fd.close()
+    if writeYuv:
+        save_frame_index(fd, outFile, verbose)
+    ses.reorderStats = reorderBuf.stats
+    ses.droppedNals  = depSes.droppedNals
+    ses.layerDropped = depSes.layerDropped
+    ses.lateNals     = ses.donBuf.late
+    return ses
+
+def abort_output(writer, fd, steps):
+    # closes what decode_stream has open on the way out, leaving the error
+    # being raised to the caller
+    for f in (steps, writer, fd):
+        if hasattr(f, 'close'):
+            try:
+                f.close()
+            except Exception:
+                pass
+
+def session_key(p, sessions):
+    if sessions == sessionsBySrcIp:
+        return (p.srcIp,)
+    return (p.srcIp, p.ssrc)
+
+def session_label(key, sep=' '):
+    return sep.join([rtp.int_to_ip(key[0])] + [str(k) for k in key[1:]])
+
+def session_file_name(fileName, key):
+    root, ext = os.path.splitext(fileName)
+    return root + '_' + session_label(key, '_') + ext
+
+def session_worker(pktQueue, resQueue, key, outFiles, opts, spoolFile=None):
+    # runs in a worker process: one decoder and one set of outputs per session.
+    # Batches spooled to spoolFile (see SessionWorker) come first
+    def batches():
+        if spoolFile is not None:
+            fd = open(spoolFile, 'rb')
+            try:
+                while True:
+                    try:
+                        batch = cPickle.load(fd)
+                    except EOFError:
+                        break
+                    for p in batch:
+                        yield p
+            finally:
+                fd.close()
+        while True:
+            batch = pktQueue.get()
+            if batch is None:
+                return
+            for p in batch:
+                yield p
+    try:
+        ses = decode_stream(batches(), *outFiles, opts=opts, verbose=False)
+        resQueue.put((key, None, ses.width, ses.height, str(ses.reorderStats), ses.droppedNals,
+                      ses.layerDropped, ses.lateNals, ses.selector and ses.selector.skipped,
+                      ses.metrics.report()))
+    except Exception as e:
+        resQueue.put((key, str(e), 0, 0, '', 0, 0, 0, None, None))
+
+class SessionWorker:
+    # packets of one session, handed on in batches to the worker process
+    # decoding it. Until the process is started (see decode_sessions) the
+    # batches are spooled to a file, which the worker reads first
+
+    def __init__(self, key, outFile, outPacsiFile, outNalFile):
+        self.key      = key
+        self.outFiles = [session_file_name(f, key) if f else None
+                         for f in (outFile, outPacsiFile, outNalFile)]
+        self.batch    = []
+        self.queue    = None
+        self.proc     = None
+        self.spool    = None
+
+    def spool_to(self, spoolDir):
+        self.spool = open(os.path.join(spoolDir, session_label(self.key, '_')), 'wb')
+
+    def start(self, resQueue, opts):
+        spoolFile = None
+        if self.spool is not None:
+            self.spool.close()
+            spoolFile = self.spool.name
+        self.queue = multiprocessing.Queue(sessionQueueLen)
+        self.proc  = multiprocessing.Process(target=session_worker,
+                                             args=(self.queue, resQueue, self.key, self.outFiles,
+                                                   opts, spoolFile))
+        self.proc.start()
+
+    def put(self, item):
+        if self.proc is None:
+            cPickle.dump(item, self.spool, cPickle.HIGHEST_PROTOCOL)
+            return
+        # a worker that died must not block the reader forever
+        while self.proc.is_alive():
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except Full:
+                pass
+
+    def add(self, p):
+        self.batch.append(p)
+        if len(self.batch) >= sessionBatchLen:
+            self.put(self.batch)
+            self.batch = []
+
+    def finish(self):
+        # the last batch, then the end of the session once started
+        if self.batch:
+            self.put(self.batch)
+            self.batch = []
+        if self.proc is not None:
+            self.put(None)
+
+def display_session(result, worker, opts, runMetrics):
+    # returns whether the session was decoded
+    key, err, width, height, reorderStats, droppedNals, layerDropped, lateNals, skippedNals, \
+        report = result
+    print ""
+    print "Session", session_label(key)
+    if err:
+        print "Error decoding session: ", err
+        return False
+    runMetrics.merge(report)
+    print "RTP packets " + reorderStats
+    print "Incomplete fragmented NALs dropped:", droppedNals
+    if layerDropped:
+        print "NALs above target layer dropped:", layerDropped
+    if lateNals:
+        print "Late interleaved NALs dropped:", lateNals
+    if skippedNals is not None:
+        print "NALs of frames not selected skipped:", skippedNals
+    display_outputs(worker.outFiles[0], width, height, worker.outFiles[1], worker.outFiles[2], opts)
+    return True
+
+def decode_sessions(pkts, outFile, outPacsiFile, outNalFile, opts, runMetrics):
+    # read the capture once and hand every session to its own worker process,
+    # at most opts.sessionJobs of them at once: the packets of the sessions
+    # beyond that are spooled to disk until a worker is done. runMetrics gets
+    # the reading and the workers' decoding added up
+    maxJobs  = opts.sessionJobs or multiprocessing.cpu_count()
+    resQueue = multiprocessing.Queue()
+    workers  = {}
+    # started workers without a result yet, spooled ones in order of arrival
+    running  = []
+    waiting  = []
+    spoolDir = None
+    rval     = 0
+    print "Decoding sessions ... "
+    try:
+        for p in pkts:
+            if p is None:
+                # poll tick of a live source: packets held by workers wait
+                # for the next packet of their session
+                continue
+            key    = session_key(p, opts.sessions)
+            worker = workers.get(key)
+            if worker is None:
+                worker = workers[key] = SessionWorker(key, outFile, outPacsiFile, outNalFile)
+                if len(running) < maxJobs:
+                    worker.start(resQueue, opts)
+                    running.append(worker)
+                else:
+                    if spoolDir is None:
+                        # next to the outputs, like the parts of decode_segments
+                        spoolDir = tempfile.mkdtemp(prefix='.pcap2yuv-',
+                                                    dir=os.path.dirname(os.path.abspath(outFile)))
+                    worker.spool_to(spoolDir)
+                    waiting.append(worker)
+            worker.add(p)
+            runMetrics.packets += 1
+            runMetrics.progress()
+        runMetrics.progress(force=True)
+        for worker in workers.values():
+            worker.finish()
+        print ""
+        # results are taken as they come: a worker cannot exit before its
+        # result is read, and a spooled session starts in the place it leaves
+        while running or waiting:
+            while waiting and len(running) < maxJobs:
+                worker = waiting.pop(0)
+                worker.start(resQueue, opts)
+                worker.finish()
+                running.append(worker)
+            # a worker found dead before waiting for a result has none to come
+            dead = [worker for worker in running if not worker.proc.is_alive()]
+            try:
+                result = resQueue.get(timeout=1)
+            except Empty:
+                for worker in dead:
+                    print "Session", session_label(worker.key), "terminated abnormally"
+                    running.remove(worker)
+                    rval = 1
+                continue
+            worker = workers[result[0]]
+            if not display_session(result, worker, opts, runMetrics):
+                rval = 1
+            worker.proc.join()
+            running.remove(worker)
+    finally:
+        for worker in workers.values():
+            if worker.proc is not None and worker.proc.is_alive():
+                worker.proc.terminate()
+                worker.proc.join()
+            if worker.spool is not None:
+                worker.spool.close()
+        if spoolDir is not None:
+            shutil.rmtree(spoolDir, ignore_errors=True)
+    return rval
+
+class HiddenPacsiOut:
+    # PACSI output of hidden packets: nothing is written
+
+    def write(self, pacsi, index, rtpTs):
+        pass
+
+def decode_segment_packet(ses, p):
+    # decoding step of GOP segments. Hidden packets (the access unit a
+    # segment starts with, whose outputs belong to the previous segment, and
+    # parameter sets sent before the segment) only bring the decoder to the
+    # state it has in a serial decode: no frame, PACSI, trace record or count
+    # comes out of them
+    if not p.hidden:
+        decode_packet(ses, p)
+        return
+    saved = (ses.trace, ses.pacsiOut, ses.metrics, ses.droppedNals, ses.layerDropped,
+             ses.donBuf.late, ses.selector and ses.selector.skipped)
+    ses.trace, ses.pacsiOut, ses.metrics = None, HiddenPacsiOut(), RunMetrics()
+    p.preroll = True
+    try:
+        decode_packet(ses, p)
+        # interleaved NALs are not held past the hidden packets
+        flush_nals(ses)
+    finally:
+        ses.trace, ses.pacsiOut, ses.metrics, ses.droppedNals, ses.layerDropped, ses.donBuf.late, \
+            skipped = saved
+        if ses.selector is not None:
+            ses.selector.skipped = skipped
+
+def gop_segments(pkts, minPackets):
+    # cuts packets in sequence order into GOP segments starting at IDR access
+    # units of the base layer: packets carrying IDR slices or base layer SVC
+    # NALs with idr_flag (see nal.is_key_payload), and those before them of
+    # the same RTP timestamp. Besides that access unit a segment has at least
+    # minPackets packets. Yields (params, packets, lead, lookahead) once the
+    # next segment's first access unit is complete: packets of the parameter
+    # sets sent before the segment, one per NAL in the order they were last
+    # sent, its packets, of which the first lead make up the access unit it
+    # starts with (none for the first segment), and the access unit the next
+    # segment starts with
+    # (ssrc, NAL) -> (count of parameter sets seen when last sent, packet)
+    params     = {}
+    paramsSeen = 0
+    segParams  = []
+    packets    = []
+    lead       = 0
+    # RTP timestamp and SSRC of the first access unit while it is incomplete,
+    # the previous segment waits for it meanwhile
+    leadKey    = None
+    prev       = None
+    for p in pkts:
+        key = (p.ssrc, p.timestamp)
+        if leadKey is not None and key != leadKey:
+            lead, leadKey = len(packets), None
+            if prev is not None:
+                yield prev + (packets[:lead],)
+                prev = None
+        payload = p.payload
+        if leadKey is None and len(packets) - lead >= minPackets and \
+           is_key_payload(payload, 0, len(payload)):
+            cut = len(packets)
+            while cut > lead and (packets[cut - 1].ssrc, packets[cut - 1].timestamp) == key:
+                cut -= 1
+            if cut - lead >= minPackets:
+                prev      = (segParams, packets[:cut], lead)
+                segParams = [q for _, q in sorted(params.values())]
+                packets   = packets[cut:]
+                lead      = 0
+                leadKey   = key
+        packets.append(p)
+        for start, end in parameter_set_nals(payload, 0, len(payload)):
+            nal = bytearray(payload[start:end])
+            q   = rtp.RtpPacket(p.ssrc, p.seq, p.timestamp, False, p.payloadType, nal)
+            q.index = p.index
+            params[(p.ssrc, str(nal))] = (paramsSeen, q)
+            paramsSeen += 1
+    if prev is not None:
+        # the last segment is its first access unit only, which has no output
+        yield prev + (packets,)
+    elif packets:
+        yield segParams, packets, lead, []
+
+def segment_file_names(tmpDir, n, outFiles):
+    return [os.path.join(tmpDir, str(n) + '_' + os.path.basename(f)) if f else None for f in outFiles]
+
+def segment_worker(taskQueue, resQueue, tmpDir, outFiles, opts):
+    # runs in a worker process: decodes GOP segments, each with a new
+    # decoder, into part files of tmpDir. The segment's packets are followed
+    # by the first access unit of the next one, whose decoding returns the
+    # last picture of the segment
+    while True:
+        task = taskQueue.get()
+        if task is None:
+            return
+        n, params, packets, lead, lookahead = task
+        for p in params + packets[:lead]:
+            p.hidden = True
+        try:
+            ses = decode_stream(iter(params + packets + lookahead),
+                                *segment_file_names(tmpDir, n, outFiles), opts=opts, verbose=False,
+                                segment=True)
+            resQueue.put((n, None, ses.width, ses.height, ses.droppedNals, ses.layerDropped,
+                          ses.lateNals, ses.selector and ses.selector.skipped,
+                          ses.trace and ses.trace.counts, ses.metrics.report()))
+        except Exception as e:
+            resQueue.put((n, str(e), 0, 0, 0, 0, 0, None, None, None))
+
+class SegmentStitcher:
+    # appends the part files of decoded GOP segments to the outputs in segment
+    # order, as soon as the segments before are done, and adds up their counts
+
+    def __init__(self, tmpDir, outFiles, opts, runMetrics):
+        self.tmpDir       = tmpDir
+        self.outFiles     = outFiles
+        self.runMetrics   = runMetrics
+        outFile, outPacsiFile, outNalFile = outFiles
+        self.fd           = open(outFile, 'wb')
+        self.fdp          = open(outPacsiFile, 'wb')
+        self.fdn          = open(outNalFile, 'w') if outNalFile else None
+        # a summary trace is the sum of the segments' ones
+        self.trace        = naltrace.NalTrace(self.fdn, opts.nalTrace) \
+                            if outNalFile and opts.nalTrace == naltrace.TRACE_SUMMARY else None
+        self.index        = yuvfile.FrameIndex()
+        self.size         = 0
+        self.done         = {}
+        self.next         = 0
+        self.failed       = 0
+        self.width        = 0
+        self.height       = 0
+        self.droppedNals  = 0
+        self.layerDropped = 0
+        self.lateNals     = 0
+        self.skippedNals  = None
+        self.reorderStats = None
+
+    def add(self, result):
+        self.done[result[0]] = result
+        while self.next in self.done:
+            self._append(self.done.pop(self.next))
+            self.next += 1
+
+    def finish(self, count):
+        # segments still missing, e.g. of a worker that died, are failures
+        while self.next < count:
+            if self.next in self.done:
+                self._append(self.done.pop(self.next))
+            else:
+                print "Segment", self.next, "was not decoded"
+                self.failed += 1
+            self.next += 1
+
+    def _append(self, result):
+        n, err, width, height, droppedNals, layerDropped, lateNals, skippedNals, counts, report = result
+        yuvPart, pacsiPart, nalPart = segment_file_names(self.tmpDir, n, self.outFiles)
+        if err:
+            print "Error decoding segment", n, ": ", err
+            self.failed += 1
+            return
+        index = yuvfile.load_frame_index(yuvfile.index_file_name(yuvPart))
+        if index is None:
+            print "Error decoding segment", n, ": no frame index"
+            self.failed += 1
+            return
+        self.index.extend(index, self.size)
+        self.size += self._copy(yuvPart, self.fd)
+        self._copy(pacsiPart, self.fdp)
+        if self.trace is not None:
+            for k, (count, size) in counts.items():
+                total = self.trace.counts.setdefault(k, [0, 0])
+                total[0] += count
+                total[1] += size
+        elif self.fdn:
+            # every part starts with the record header
+            self._copy(nalPart, self.fdn, len(naltrace.RECORD_HEADER) if n else 0)
+        if width:
+            self.width, self.height = width, height
+        self.droppedNals  += droppedNals
+        self.layerDropped += layerDropped
+        self.lateNals     += lateNals
+        if skippedNals is not None:
+            self.skippedNals = (self.skippedNals or 0) + skippedNals
+        self.runMetrics.merge(report)
+
+    def _copy(self, part, fd, skip=0):
+        # appends part to fd from offset skip and removes it, returns its size
+        src = open(part, 'rb')
+        try:
+            src.seek(skip)
+            shutil.copyfileobj(src, fd, stitchChunk)
+            size = src.tell()
+        finally:
+            src.close()
+        os.remove(part)
+        return size
+
+    def close(self, outFile, verbose=True):
+        if self.trace is not None:
+            self.trace.close()
+        for fd in (self.fd, self.fdp, self.fdn):
+            if fd is not None:
+                fd.close()
+        try:
+            self.index.save(yuvfile.index_file_name(outFile))
+        except IOError as e:
+            print "Could not write frame index: ", e
+            return
+        if verbose:
+            print "Frame index written in", yuvfile.index_file_name(outFile)
+
+def put_task(queue, procs, task):
+    # workers that died must not block the reader forever
+    while any(proc.is_alive() for proc in procs):
+        try:
+            queue.put(task, timeout=1)
+            return
+        except Full:
+            pass
+
+def decode_segments(pkts, outFile, outPacsiFile, outNalFile, opts, runMetrics, verbose=True):
+    # puts the packets in sequence order and cuts them into GOP segments (see
+    # gop_segments) decoded by opts.jobs worker processes. Returns the
+    # SegmentStitcher holding the counts of the run
+    reorderBuf = reorder.ReorderBuffer(opts.reorderDepth, opts.maxDelay)
+    outFiles   = [outFile, outPacsiFile, outNalFile]
+    # part files go next to the outputs, unless written to a pipe or device
+    tmpBase    = os.path.dirname(os.path.abspath(outFile))
+    if os.path.exists(outFile) and not os.path.isfile(outFile):
+        tmpBase = None
+    tmpDir     = tempfile.mkdtemp(prefix='.pcap2yuv-', dir=tmpBase)
+    stitcher   = SegmentStitcher(tmpDir, outFiles, opts, runMetrics)
+    tasks      = multiprocessing.Queue(segmentQueueLen * opts.jobs)
+    results    = multiprocessing.Queue()
+    procs      = [multiprocessing.Process(target=segment_worker,
+                                          args=(tasks, results, tmpDir, outFiles, opts))
+                  for _ in range(opts.jobs)]
+    def counted(pkts):
+        for p in pkts:
+            if p is not None:
+                runMetrics.packets += 1
+            if verbose:
+                runMetrics.progress()
+            yield p
+    count = 0
+    try:
+        for proc in procs:
+            proc.start()
+        for seg in gop_segments(reorder.reorder_packets(counted(pkts), reorderBuf), opts.segmentPackets):
+            put_task(tasks, procs, (count,) + seg)
+            count += 1
+            while True:
+                try:
+                    stitcher.add(results.get_nowait())
+                except Empty:
+                    break
+        for proc in procs:
+            put_task(tasks, procs, None)
+        while stitcher.next < count:
+            try:
+                stitcher.add(results.get(timeout=1))
+            except Empty:
+                if not any(proc.is_alive() for proc in procs):
+                    break
+        for proc in procs:
+            proc.join()
+        while True:
+            try:
+                stitcher.add(results.get_nowait())
+            except Empty:
+                break
+        stitcher.finish(count)
+    finally:
+        # workers left running after a failure or an interruption
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        stitcher.close(outFile, verbose)
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    if verbose:
+        runMetrics.progress(force=True)
+        print ""
+    stitcher.reorderStats = reorderBuf.stats
+    return stitcher
 
 if __name__ == "__main__":
-    if not 4 <= len(sys.argv) <= 7:
-        display_help()
-        exit(1)	
-    pcapFileIn    = sys.argv[1]
-    filterSrcIpIn = sys.argv[2]
-    filterSSRCIn  = sys.argv[3]
-    if len(sys.argv) == 5: 
-        outFileIn      = sys.argv[4]
-        outPacsiFileIn = defYUVFile
-        outNalFileIn   = defNALFile
-    elif len(sys.argv) == 6:
-        outFileIn      = sys.argv[4]
-        outPacsiFileIn = sys.argv[5]
-        outNalFileIn   = defNALFile
-    elif len(sys.argv) == 7:
-        outFileIn      = sys.argv[4]
-        outPacsiFileIn = sys.argv[5]
-        outNalFileIn   = sys.argv[6]    
+    args = build_arg_parser().parse_args(namespace=Options())
+    if args.annexB:
+        outFile = args.outFile or defAnnexBFile
+    elif args.digest or args.verify:
+        outFile = args.outFile or defDigestFile
+    elif args.psnr:
+        outFile = args.outFile or defQualityFile
     else:
-        outFileIn      = defYUVFile
-        outPacsiFileIn = defPACSIFIle 
-        outNalFileIn   = defNALFile   
-    # real main
-    exit(main(pcapFileIn, filterSrcIpIn, filterSSRCIn, outFileIn, outPacsiFileIn, outNalFileIn))
+        outFile = args.outFile or defYUVFile
+    exit(main(args.pcapFile, args.filterSrcIp, args.filterSSRC,
+              outFile, args.outPacsiFile, args.outNalFile, args))
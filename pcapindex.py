@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import heapq
+from bisect import bisect_left, bisect_right
+from array import array
+
+# sidecar index file: one JSON header line followed by the binary arrays of
+# every session, in header order
+INDEX_VERSION   = 4
+INDEX_EXT       = '.idx'
+# (attribute, array typecode, header count) of the per session arrays. File
+# offsets are kept as doubles, exact up to 2**53 and 8 bytes on every platform
+INDEX_ARRAYS    = (('offsets',       'd', 'count'),
+                   ('ordinals',      'd', 'count'),
+                   ('keyOffsets',    'd', 'keyCount'),
+                   ('keyTimes',      'd', 'keyCount'),
+                   ('keyRtpTs',      'L', 'keyCount'),
+                   ('paramOffsets',  'd', 'paramCount'),
+                   ('paramOrdinals', 'd', 'paramCount'))
+
+class SessionIndex:
+    # RTP packets of one (src IP, SSRC) in a capture
+
+    def __init__(self, srcIp, ssrc):
+        self.srcIp      = srcIp
+        self.ssrc       = ssrc
+        self.firstSeq   = None
+        self.lastSeq    = None
+        self.firstTs    = None
+        self.lastTs     = None
+        self.firstTime  = None
+        self.lastTime   = None
+        # pcap record offsets and ordinals (see pcapreader) of all packets,
+        # offsets of the first packet of the access units carrying key
+        # pictures, offsets and ordinals of the packets carrying parameter sets
+        self.offsets       = array('d')
+        self.ordinals      = array('d')
+        self.keyOffsets    = array('d')
+        self.keyTimes      = array('d')
+        self.keyRtpTs      = array('L')
+        self.paramOffsets  = array('d')
+        self.paramOrdinals = array('d')
+        # offset of the first packet of the current access unit
+        self.auOffset      = None
+
+    def add(self, offset, ordinal, seq, rtpTs, time, isKey, hasParams=False):
+        if self.firstSeq is None:
+            self.firstSeq, self.firstTs, self.firstTime = seq, rtpTs, time
+        if self.auOffset is None or rtpTs != self.lastTs:
+            self.auOffset = offset
+        self.lastSeq, self.lastTs, self.lastTime = seq, rtpTs, time
+        self.offsets.append(offset)
+        self.ordinals.append(ordinal)
+        if isKey and (not self.keyOffsets or self.keyOffsets[-1] != self.auOffset):
+            self.keyOffsets.append(self.auOffset)
+            self.keyTimes.append(time)
+            self.keyRtpTs.append(rtpTs)
+        if hasParams:
+            self.paramOffsets.append(offset)
+            self.paramOrdinals.append(ordinal)
+
+    def records(self):
+        return zip(self.offsets, self.ordinals)
+
+    def header(self):
+        return {'srcIp': self.srcIp, 'ssrc': self.ssrc,
+                'firstSeq': self.firstSeq, 'lastSeq': self.lastSeq,
+                'firstTs': self.firstTs, 'lastTs': self.lastTs,
+                'firstTime': self.firstTime, 'lastTime': self.lastTime,
+                'count': len(self.offsets), 'keyCount': len(self.keyOffsets),
+                'paramCount': len(self.paramOffsets)}
+
+class PcapIndex:
+
+    def __init__(self):
+        self.sessions = {}
+        # set once every record of the capture went through add()
+        self.complete = False
+
+    def add(self, srcIp, ssrc, offset, ordinal, seq, rtpTs, time, isKey, hasParams=False):
+        ses = self.sessions.get((srcIp, ssrc))
+        if ses is None:
+            ses = self.sessions[(srcIp, ssrc)] = SessionIndex(srcIp, ssrc)
+        ses.add(offset, ordinal, seq, rtpTs, time, isKey, hasParams)
+
+    def select(self, filterSrcIp, filterSSRC):
+        # sessions passing the filters (empty filter means no filter)
+        return [ses for (srcIp, ssrc), ses in sorted(self.sessions.items())
+                if (not filterSrcIp or srcIp in filterSrcIp) and
+                   (not filterSSRC or ssrc in filterSSRC)]
+
+    def records(self, filterSrcIp, filterSSRC):
+        # (record offset, ordinal) of the packets passing the filters, in
+        # capture order
+        return heapq.merge(*[ses.records() for ses in self.select(filterSrcIp, filterSSRC)])
+
+    def first_time(self, sessions):
+        return min(ses.firstTime for ses in sessions)
+
+    def key_offset_before(self, sessions, time):
+        # offset from which every session has a key packet at or before time
+        offset = None
+        for ses in sessions:
+            i   = bisect_right(ses.keyTimes, time)
+            off = ses.keyOffsets[i - 1] if i else ses.offsets[0]
+            offset = off if offset is None else min(offset, off)
+        return offset
+
+    def param_records_before(self, sessions, offset):
+        # (record offset, ordinal) of the packets carrying parameter sets
+        # before offset, in capture order
+        records = []
+        for ses in sessions:
+            n = bisect_left(ses.paramOffsets, offset)
+            records.append(zip(ses.paramOffsets[:n], ses.paramOrdinals[:n]))
+        return heapq.merge(*records)
+
+    def save(self, fileName, pcapFile):
+        st  = os.stat(pcapFile)
+        sessions = sorted(self.sessions.values(), key=lambda ses: (ses.srcIp, ses.ssrc))
+        hdr = {'version': INDEX_VERSION, 'pcapSize': st.st_size, 'pcapMtime': st.st_mtime,
+               'byteorder': sys.byteorder, 'itemsize': array('L').itemsize,
+               'sessions': [ses.header() for ses in sessions]}
+        fd = open(fileName, 'wb')
+        try:
+            fd.write(json.dumps(hdr) + '\n')
+            for ses in sessions:
+                for name, _, _ in INDEX_ARRAYS:
+                    getattr(ses, name).tofile(fd)
+        finally:
+            fd.close()
+
+def index_file_name(pcapFile):
+    return pcapFile + INDEX_EXT
+
+def load_index(fileName, pcapFile):
+    # index of pcapFile, or None if missing, unreadable or out of date
+    try:
+        fd = open(fileName, 'rb')
+    except IOError:
+        return None
+    try:
+        hdr = json.loads(fd.readline())
+        st  = os.stat(pcapFile)
+        if hdr.get('version') != INDEX_VERSION or hdr['pcapSize'] != st.st_size or \
+           hdr['pcapMtime'] != st.st_mtime or hdr['itemsize'] != array('L').itemsize:
+            return None
+        index = PcapIndex()
+        for sh in hdr['sessions']:
+            ses = SessionIndex(sh['srcIp'], sh['ssrc'])
+            for name in ('firstSeq', 'lastSeq', 'firstTs', 'lastTs', 'firstTime', 'lastTime'):
+                setattr(ses, name, sh[name])
+            for name, typecode, count in INDEX_ARRAYS:
+                arr = array(typecode)
+                arr.fromfile(fd, sh[count])
+                if hdr['byteorder'] != sys.byteorder:
+                    arr.byteswap()
+                setattr(ses, name, arr)
+            index.sessions[(ses.srcIp, ses.ssrc)] = ses
+        return index
+    except (ValueError, KeyError, EOFError, OSError):
+        return None
+    finally:
+        fd.close()
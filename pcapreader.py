@@ -0,0 +1,345 @@
+import os
+import mmap
+from bisect import bisect_right
+from struct import Struct
+from ctypes import pythonapi, py_object, byref, POINTER, c_void_p, c_ssize_t, c_ubyte
+
+# ----------------
+# --- CLASSIC PCAP
+# ----------------
+# magic numbers as read with native (little endian) order
+PCAP_MAGIC_US          = 0xa1b2c3d4
+PCAP_MAGIC_NS          = 0xa1b23c4d
+PCAP_MAGIC_US_SWAPPED  = 0xd4c3b2a1
+PCAP_MAGIC_NS_SWAPPED  = 0x4d3cb2a1
+# global header (MAGIC, VER_MAJOR, VER_MINOR, THISZONE, SIGFIGS, SNAPLEN, LINKTYPE)
+PCAP_HDR_LEN           = 24
+PCAP_HDR_FMT           = 'IHHiIII'
+# record header (TS_SEC, TS_FRAC, CAPLEN, ORIGLEN)
+PCAP_REC_LEN           = 16
+PCAP_REC_FMT           = 'IIII'
+# ----------
+# --- PCAPNG
+# ----------
+# block header (TYPE, TOTAL_LEN), TOTAL_LEN is repeated after the body
+PCAPNG_SHB             = 0x0a0d0d0a
+PCAPNG_IDB             = 0x00000001
+PCAPNG_EPB             = 0x00000006
+PCAPNG_BLOCK_FMT       = 'II'
+PCAPNG_BLOCK_HDR_LEN   = 8
+PCAPNG_BLOCK_MIN_LEN   = 12
+# SHB body (BYTE_ORDER_MAGIC, VER_MAJOR, VER_MINOR, SECTION_LEN)
+PCAPNG_BYTE_ORDER      = 0x1a2b3c4d
+PCAPNG_SHB_LEN         = 16
+# IDB body (LINKTYPE, RESERVED, SNAPLEN) followed by options
+PCAPNG_IDB_FMT         = 'HHI'
+PCAPNG_IDB_LEN         = 8
+# EPB body (INTERFACE_ID, TS_HIGH, TS_LOW, CAPLEN, ORIGLEN) followed by data
+PCAPNG_EPB_FMT         = 'IIIII'
+PCAPNG_EPB_LEN         = 20
+# options (CODE, LENGTH), values padded to 32 bits
+PCAPNG_OPT_FMT         = 'HH'
+PCAPNG_OPT_LEN         = 4
+PCAPNG_OPT_END         = 0
+PCAPNG_OPT_TSRESOL     = 9
+PCAPNG_OPT_TSOFFSET    = 14
+# if_tsresol: negative power of 10, or of 2 with the high bit set
+PCAPNG_TSRESOL_POW2    = 0x80
+PCAPNG_DEF_TSRESOL     = 6
+
+_magic = Struct('<I').unpack_from
+_u8    = Struct('B').unpack_from
+
+_as_read_buffer          = pythonapi.PyObject_AsReadBuffer
+_as_read_buffer.argtypes = [py_object, POINTER(c_void_p), POINTER(c_ssize_t)]
+
+class PcapFormatError(Exception):
+    pass
+
+# streaming reader of classic pcap files: yields (timestamp, linktype, data,
+# record file offset, record ordinal) one record at a time, ordinals counting
+# the records of the capture from 1. Raises PcapFormatError on anything else
+# (e.g. pcapng). Besides a file name, takes an open file (e.g. a stream that
+# cannot seek, see live.StdinStream)
+class PcapReader:
+
+    def __init__(self, fileName):
+        self.fd = fileName if hasattr(fileName, 'read') else open(fileName, 'rb')
+        hdr = self.fd.read(PCAP_HDR_LEN)
+        if len(hdr) < PCAP_HDR_LEN:
+            self.fd.close()
+            raise PcapFormatError('Truncated pcap global header')
+        magic = _magic(hdr)[0]
+        if   magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            order = '<'
+        elif magic in (PCAP_MAGIC_US_SWAPPED, PCAP_MAGIC_NS_SWAPPED):
+            order = '>'
+        else:
+            self.fd.close()
+            raise PcapFormatError('Not a classic pcap file')
+        self.tsDiv    = 1e9 if magic in (PCAP_MAGIC_NS, PCAP_MAGIC_NS_SWAPPED) else 1e6
+        self.linktype = Struct(order + PCAP_HDR_FMT).unpack(hdr)[6] & 0x0fffffff
+        self.recHdr   = Struct(order + PCAP_REC_FMT)
+
+    def __iter__(self):
+        read    = self.fd.read
+        recHdr  = self.recHdr
+        tsDiv   = self.tsDiv
+        lt      = self.linktype
+        offset  = PCAP_HDR_LEN
+        ordinal = 0
+        while True:
+            hdr = read(PCAP_REC_LEN)
+            if len(hdr) < PCAP_REC_LEN:
+                return
+            tsSec, tsFrac, capLen, _ = recHdr.unpack(hdr)
+            data = bytearray(capLen)
+            if self.fd.readinto(data) < capLen:
+                return
+            ordinal += 1
+            yield tsSec + tsFrac / tsDiv, lt, data, offset, ordinal
+            offset += PCAP_REC_LEN + capLen
+
+    def iter_at(self, records):
+        # same as iterating, but only for the records at the given (offset,
+        # ordinal), see pcapindex
+        for offset, ordinal in records:
+            offset = int(offset)
+            self.fd.seek(offset)
+            hdr = self.fd.read(PCAP_REC_LEN)
+            if len(hdr) < PCAP_REC_LEN:
+                return
+            tsSec, tsFrac, capLen, _ = self.recHdr.unpack(hdr)
+            data = bytearray(capLen)
+            if self.fd.readinto(data) < capLen:
+                return
+            yield tsSec + tsFrac / self.tsDiv, self.linktype, data, offset, int(ordinal)
+
+    def close(self):
+        self.fd.close()
+
+# scapy based fallback for files PcapReader cannot handle, same output
+class ScapyPcapReader:
+
+    def __init__(self, fileName):
+        from rtp import load_scapy
+        self.s      = load_scapy()
+        self.reader = self.s.PcapReader(fileName)
+
+    def __iter__(self):
+        layer2num = self.s.conf.l2types.layer2num
+        for ordinal, p in enumerate(self.reader, 1):
+            yield float(p.time), layer2num.get(p.__class__), bytearray(str(p)), None, ordinal
+
+    def close(self):
+        self.reader.close()
+
+def map_view(fileName):
+    # memoryview on the whole file mapped read-only. ctypes only wraps writable
+    # buffers, so the array is made from the address of the map, and keeps the
+    # map alive: it is unmapped once no view on it is left
+    fd = open(fileName, 'rb')
+    try:
+        try:
+            m = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error) as e:
+            # empty file, or not a regular file
+            raise PcapFormatError('Cannot map ' + fileName + ': ' + str(e))
+    finally:
+        fd.close()
+    addr, size = c_void_p(), c_ssize_t()
+    _as_read_buffer(m, byref(addr), byref(size))
+    data     = (c_ubyte * size.value).from_address(addr.value)
+    data.map = m
+    return memoryview(data)
+
+class PcapngSection:
+    # byte order and interfaces (linktype, timestamp divisor, timestamp
+    # offset) of a pcapng section
+
+    def __init__(self, order):
+        self.block      = Struct(order + PCAPNG_BLOCK_FMT)
+        self.idb        = Struct(order + PCAPNG_IDB_FMT)
+        self.epb        = Struct(order + PCAPNG_EPB_FMT)
+        self.opt        = Struct(order + PCAPNG_OPT_FMT)
+        self.tsOffset   = Struct(order + 'q')
+        self.interfaces = []
+
+    def add_interface(self, view, start, end):
+        linktype = self.idb.unpack_from(view, start)[0]
+        tsResol  = PCAPNG_DEF_TSRESOL
+        tsOffset = 0
+        pos      = start + PCAPNG_IDB_LEN
+        while pos + PCAPNG_OPT_LEN <= end:
+            code, size = self.opt.unpack_from(view, pos)
+            pos += PCAPNG_OPT_LEN
+            if code == PCAPNG_OPT_END:
+                break
+            if code == PCAPNG_OPT_TSRESOL and size >= 1:
+                tsResol = _u8(view, pos)[0]
+            elif code == PCAPNG_OPT_TSOFFSET and size >= 8:
+                tsOffset = self.tsOffset.unpack_from(view, pos)[0]
+            pos += (size + 3) & ~3
+        if tsResol & PCAPNG_TSRESOL_POW2:
+            tsDiv = float(2 ** (tsResol & ~PCAPNG_TSRESOL_POW2))
+        else:
+            tsDiv = float(10 ** tsResol)
+        self.interfaces.append((linktype, tsDiv, tsOffset))
+
+# reader of classic pcap and pcapng files through a memory map: yields the
+# same records as PcapReader, the data being a memoryview on the mapped file
+# so that packets are never copied. pcapng files may have several sections
+# and interfaces; blocks other than enhanced packet blocks are skipped.
+# Raises PcapFormatError on anything else
+class MappedPcapReader:
+
+    def __init__(self, fileName):
+        self.view     = map_view(fileName)
+        self.sections = None
+        self.starts   = None
+        magic = _magic(self.view)[0] if len(self.view) >= PCAP_HDR_LEN else None
+        if magic == PCAPNG_SHB:
+            self.pcapng = True
+            if self.section(0) is None:
+                raise PcapFormatError('Invalid pcapng section header')
+            return
+        if   magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            order = '<'
+        elif magic in (PCAP_MAGIC_US_SWAPPED, PCAP_MAGIC_NS_SWAPPED):
+            order = '>'
+        else:
+            raise PcapFormatError('Not a pcap or pcapng file')
+        self.pcapng   = False
+        self.tsDiv    = 1e9 if magic in (PCAP_MAGIC_NS, PCAP_MAGIC_NS_SWAPPED) else 1e6
+        self.linktype = Struct(order + PCAP_HDR_FMT).unpack_from(self.view)[6] & 0x0fffffff
+        self.recHdr   = Struct(order + PCAP_REC_FMT)
+
+    def __iter__(self):
+        return self._blocks() if self.pcapng else self._records()
+
+    def _record(self, offset, ordinal):
+        # (timestamp, linktype, data, offset, ordinal) of the pcap record at
+        # offset, None if it is truncated
+        view  = self.view
+        start = offset + PCAP_REC_LEN
+        if start > len(view):
+            return None
+        tsSec, tsFrac, capLen, _ = self.recHdr.unpack_from(view, offset)
+        if start + capLen > len(view):
+            return None
+        return tsSec + tsFrac / self.tsDiv, self.linktype, view[start : start + capLen], offset, \
+               ordinal
+
+    def _records(self):
+        offset  = PCAP_HDR_LEN
+        ordinal = 1
+        while True:
+            rec = self._record(offset, ordinal)
+            if rec is None:
+                return
+            yield rec
+            offset  += PCAP_REC_LEN + len(rec[2])
+            ordinal += 1
+
+    def section(self, offset):
+        # PcapngSection of the section header block at offset, None if invalid
+        view = self.view
+        if offset + PCAPNG_BLOCK_HDR_LEN + PCAPNG_SHB_LEN > len(view):
+            return None
+        for order in ('<', '>'):
+            if Struct(order + 'I').unpack_from(view, offset + PCAPNG_BLOCK_HDR_LEN)[0] == \
+               PCAPNG_BYTE_ORDER:
+                return PcapngSection(order)
+        return None
+
+    def _walk(self):
+        # (offset, section, block type, body start, body end) of every block.
+        # Interfaces are added to their section as they are met
+        view    = self.view
+        size    = len(view)
+        offset  = 0
+        section = None
+        while offset + PCAPNG_BLOCK_MIN_LEN <= size:
+            if _magic(view, offset)[0] == PCAPNG_SHB:
+                section = self.section(offset)
+                if section is None:
+                    return
+            blockType, blockLen = section.block.unpack_from(view, offset)
+            if blockLen < PCAPNG_BLOCK_MIN_LEN or blockLen % 4 or offset + blockLen > size:
+                return
+            start = offset + PCAPNG_BLOCK_HDR_LEN
+            end   = offset + blockLen - 4
+            if blockType == PCAPNG_IDB and end - start >= PCAPNG_IDB_LEN:
+                section.add_interface(view, start, end)
+            yield offset, section, blockType, start, end
+            offset += blockLen
+
+    def _packet(self, offset, section, start, end, ordinal):
+        # (timestamp, linktype, data, offset, ordinal) of an enhanced packet
+        # block, None if it refers to an unknown interface
+        if end - start < PCAPNG_EPB_LEN:
+            return None
+        iface, tsHigh, tsLow, capLen, _ = section.epb.unpack_from(self.view, start)
+        if iface >= len(section.interfaces):
+            return None
+        linktype, tsDiv, tsOffset = section.interfaces[iface]
+        start += PCAPNG_EPB_LEN
+        return ((tsHigh << 32) | tsLow) / tsDiv + tsOffset, linktype, \
+               self.view[start : min(start + capLen, end)], offset, ordinal
+
+    def _blocks(self):
+        ordinal = 1
+        for offset, section, blockType, start, end in self._walk():
+            if blockType == PCAPNG_EPB:
+                pkt = self._packet(offset, section, start, end, ordinal)
+                if pkt is not None:
+                    yield pkt
+                    ordinal += 1
+
+    def iter_at(self, records):
+        # same as iterating, but only for the records at the given (offset,
+        # ordinal), see pcapindex
+        if not self.pcapng:
+            for offset, ordinal in records:
+                rec = self._record(int(offset), int(ordinal))
+                if rec is None:
+                    return
+                yield rec
+            return
+        if self.sections is None:
+            # (offset, section) of every section, whose interfaces are all
+            # known once every block was walked through
+            self.sections = []
+            for offset, section, _, _, _ in self._walk():
+                if not self.sections or self.sections[-1][1] is not section:
+                    self.sections.append((offset, section))
+            self.starts   = [offset for offset, _ in self.sections]
+        for offset, ordinal in records:
+            offset = int(offset)
+            i      = bisect_right(self.starts, offset) - 1
+            if i < 0 or offset + PCAPNG_BLOCK_MIN_LEN > len(self.view):
+                return
+            section  = self.sections[i][1]
+            blockLen = section.block.unpack_from(self.view, offset)[1]
+            pkt = self._packet(offset, section, offset + PCAPNG_BLOCK_HDR_LEN, offset + blockLen - 4,
+                               int(ordinal))
+            if pkt is not None:
+                yield pkt
+
+    def close(self):
+        # views already yielded stay valid
+        self.view     = None
+        self.sections = None
+
+def open_pcap(fileName):
+    # regular files are mapped, anything else (e.g. a named pipe) is streamed
+    try:
+        if os.path.isfile(fileName):
+            return MappedPcapReader(fileName)
+        return PcapReader(fileName)
+    except PcapFormatError:
+        # other formats are read by scapy, which is optional
+        try:
+            return ScapyPcapReader(fileName)
+        except ImportError:
+            raise PcapFormatError('not a supported capture file')
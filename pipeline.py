@@ -0,0 +1,162 @@
+import sys
+import threading
+from Queue import Queue, Empty
+
+# default capacity (in items) of the queues between stages
+DEF_QUEUE_SIZE = 64
+# items a stage batches together before handing them to the next one
+STAGE_BATCH    = 32
+
+_END = object()
+
+class StageQueue:
+    # bounded queue between two pipeline stages, recording how full it is.
+    # A queue that is mostly full means its consumer is the bottleneck, one
+    # that is mostly empty means its producer is
+
+    def __init__(self, name, maxsize=DEF_QUEUE_SIZE):
+        self.name       = name
+        self.maxsize    = maxsize
+        self.queue      = Queue(maxsize)
+        self.puts       = 0
+        self.fillSum    = 0
+        self.maxFill    = 0
+        self.fullWaits  = 0
+        self.emptyWaits = 0
+
+    def put(self, item):
+        fill = self.queue.qsize()
+        if fill >= self.maxsize:
+            self.fullWaits += 1
+        self.puts    += 1
+        self.fillSum += fill
+        self.maxFill  = max(self.maxFill, fill)
+        self.queue.put(item)
+
+    def get(self):
+        if self.queue.empty():
+            self.emptyWaits += 1
+        return self.queue.get()
+
+    def fill(self):
+        return self.queue.qsize()
+
+    def __str__(self):
+        avg = float(self.fillSum) / self.puts if self.puts else 0.0
+        return "Queue %-12s: avg fill %5.1f%% , max %d/%d , producer blocked %d , consumer starved %d" % \
+               (self.name, 100.0 * avg / self.maxsize, self.maxFill, self.maxsize,
+                self.fullWaits, self.emptyWaits)
+
+class _Error:
+
+    def __init__(self, excInfo):
+        self.excInfo = excInfo
+
+def threaded(items, name, queues, maxsize=DEF_QUEUE_SIZE, batch=STAGE_BATCH):
+    # runs iteration of `items` in its own thread and yields them back through
+    # a bounded StageQueue (appended to `queues`). Exceptions are re-raised in
+    # the consuming thread. Closing the returned generator stops the thread
+    q    = StageQueue(name, maxsize)
+    stop = threading.Event()
+    queues.append(q)
+
+    def produce():
+        try:
+            buf = []
+            for item in items:
+                if stop.is_set():
+                    break
+                buf.append(item)
+                if len(buf) >= batch:
+                    q.put(buf)
+                    buf = []
+            if buf:
+                q.put(buf)
+            q.put(_END)
+        except Exception:
+            q.put(_Error(sys.exc_info()))
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+
+    def consume():
+        try:
+            while True:
+                buf = q.get()
+                if buf is _END:
+                    break
+                if isinstance(buf, _Error):
+                    raise buf.excInfo[0], buf.excInfo[1], buf.excInfo[2]
+                for item in buf:
+                    yield item
+        finally:
+            # unblock and wait for the producer if the consumer stopped early
+            stop.set()
+            while t.is_alive():
+                try:
+                    q.queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            t.join()
+
+    t = threading.Thread(target=produce, name=name)
+    t.daemon = True
+    t.start()
+    return consume()
+
+class FrameWriter(object):
+    # file-like object writing frames from its own thread; frames are copied
+    # since decoder buffers are reused for the next picture. write_frame
+    # needs fd to be a yuvfile.YuvFile
+
+    def __init__(self, fd, queues, maxsize=DEF_QUEUE_SIZE):
+        self.fd     = fd
+        self.mode   = fd.mode
+        # bytes queued so far
+        self.size   = 0
+        self.q      = StageQueue('write', maxsize)
+        self.error  = None
+        queues.append(self.q)
+        self.thread = threading.Thread(target=self._run, name='write')
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def closed(self):
+        return self.fd.closed
+
+    def fileno(self):
+        return self.fd.fileno()
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        self.size += len(data)
+        self.q.put((bytearray(data),))
+
+    def write_frame(self, data, width, height):
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        self.size += len(data)
+        self.q.put((bytearray(data), width, height))
+
+    def _run(self):
+        while True:
+            item = self.q.get()
+            if item is _END:
+                return
+            if self.error is None:
+                try:
+                    if len(item) == 1:
+                        self.fd.write(item[0])
+                    else:
+                        self.fd.write_frame(*item)
+                except Exception:
+                    self.error = sys.exc_info()
+
+    def close(self):
+        # waits for pending frames, the underlying file is left open
+        self.q.put(_END)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
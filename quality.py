@@ -0,0 +1,246 @@
+import json
+import math
+import heapq
+from fractions import gcd
+import yuvfile
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# per-frame quality of the decoded frames against a reference YUV file (e.g.
+# the encoder's source), computed on the decoder buffers and written instead
+# of the YUV file. Needs numpy
+PLANES        = ('y', 'u', 'v')
+MAX_PIXEL     = 255
+# PSNR of identical planes, also their weight in the means
+MAX_PSNR      = 100.0
+# SSIM over every SSIM_WINDOW x SSIM_WINDOW window (smaller planes: the whole
+# plane), with the constants of Wang et al.
+SSIM_WINDOW   = 8
+SSIM_C1       = (0.01 * MAX_PIXEL) ** 2
+SSIM_C2       = (0.03 * MAX_PIXEL) ** 2
+# records buffered before each write
+QUALITY_BATCH = 256
+# summary written next to the per-frame records
+SUMMARY_EXT   = '.summary.json'
+# RTP timestamps are 32 bit and wrap around
+TS_MOD        = 1 << 32
+TS_HALF       = 1 << 31
+
+def parse_size(size):
+    # 'WIDTHxHEIGHT' -> (width, height)
+    try:
+        width, height = [int(v) for v in size.lower().split('x')]
+    except ValueError:
+        raise ValueError('invalid size: ' + size)
+    if width <= 0 or height <= 0 or width % 2 or height % 2:
+        raise ValueError('invalid size: ' + size)
+    return width, height
+
+def summary_file_name(qualityFile):
+    return qualityFile + SUMMARY_EXT
+
+def record_header(ssim):
+    columns = ['frame'] + ['psnr_' + p for p in PLANES]
+    if ssim:
+        columns += ['ssim_' + p for p in PLANES]
+    return '\t'.join(columns) + '\n'
+
+def psnr(mse):
+    if mse == 0:
+        return MAX_PSNR
+    return min(MAX_PSNR, 10 * math.log10(MAX_PIXEL * MAX_PIXEL / mse))
+
+def plane_mse(a, b):
+    d = a.astype(numpy.int32)
+    d -= b
+    return float(numpy.vdot(d, d)) / d.size
+
+def _window_sums(x, n):
+    # sums of x over every n x n window, from its summed area table
+    sat = numpy.zeros((x.shape[0] + 1, x.shape[1] + 1), numpy.int64)
+    sat[1:, 1:] = x.cumsum(0).cumsum(1)
+    return (sat[n:, n:] - sat[:-n, n:] - sat[n:, :-n] + sat[:-n, :-n]).astype(numpy.float64)
+
+def plane_ssim(a, b):
+    # mean SSIM of the windows of planes a and b
+    n  = min(SSIM_WINDOW, a.shape[0], a.shape[1])
+    n2 = float(n * n)
+    a  = a.astype(numpy.int64)
+    b  = b.astype(numpy.int64)
+    ma = _window_sums(a, n) / n2
+    mb = _window_sums(b, n) / n2
+    va = _window_sums(a * a, n) / n2 - ma * ma
+    vb = _window_sums(b * b, n) / n2 - mb * mb
+    cv = _window_sums(a * b, n) / n2 - ma * mb
+    ssim = ((2 * ma * mb + SSIM_C1) * (2 * cv + SSIM_C2)) / \
+           ((ma * ma + mb * mb + SSIM_C1) * (va + vb + SSIM_C2))
+    return float(ssim.mean())
+
+class SourceFrames:
+    # number in the source (the reference) of the pictures the decoder
+    # returns, from the RTP timestamps of the access units it was given.
+    # Pictures come out in display order: each one is the access unit of
+    # lowest timestamp among those decoded and not returned yet. Numbers
+    # count from the first access unit in steps of the greatest common
+    # divisor of the timestamp distances of all access units, decoded or
+    # skipped, so access units that were skipped or lost keep their place.
+    # That takes every access unit of the source being sent; otherwise (e.g.
+    # a temporal layer dropped) period gives the timestamp distance of two
+    # source frames
+
+    def __init__(self, period=None):
+        self.first   = None
+        self.last    = None
+        self.delta   = 0
+        self.pushed  = False
+        self.step    = 0
+        self.period  = period
+        # timestamps from the first one of the access units not returned yet
+        self.pending = []
+
+    def access_unit(self, timestamp, decoded):
+        # a slice of the access unit of this timestamp, which goes to the
+        # decoder or is skipped
+        if timestamp != self.last:
+            self.last = timestamp
+            if self.first is None:
+                self.first = timestamp
+            delta = (timestamp - self.first) % TS_MOD
+            if delta >= TS_HALF:
+                delta -= TS_MOD
+            self.step   = gcd(self.step, abs(delta))
+            self.delta  = delta
+            self.pushed = False
+        if decoded and not self.pushed:
+            heapq.heappush(self.pending, self.delta)
+            self.pushed = True
+
+    def picture(self):
+        # source frame number of the picture just returned, None if unknown
+        # (e.g. displayed before the first access unit)
+        if not self.pending:
+            return None
+        delta = heapq.heappop(self.pending)
+        if delta < 0:
+            return None
+        if self.period:
+            return int(round(delta / self.period))
+        return delta // self.step if self.step else 0
+
+class ReferenceYuv:
+    # planar YUV 4:2:0 file read one frame at a time into the same buffer
+
+    def __init__(self, fileName, width, height):
+        self.fd     = open(fileName, 'rb')
+        self.width  = width
+        self.height = height
+        # frame the file is positioned at
+        self.next   = 0
+        self.buf    = numpy.empty(yuvfile.frame_size(width, height), numpy.uint8)
+        ySize       = width * height
+        cSize       = ySize >> 2
+        self.planes = [self.buf[:ySize].reshape(height, width),
+                       self.buf[ySize:ySize + cSize].reshape(height >> 1, width >> 1),
+                       self.buf[ySize + cSize:].reshape(height >> 1, width >> 1)]
+
+    def frame(self, n):
+        # planes of frame n, None past the last one; frames in sequence are
+        # read without seeking
+        if n is None:
+            return None
+        if n != self.next:
+            self.fd.seek(n * len(self.buf))
+        self.next = n + 1
+        if self.fd.readinto(self.buf) != len(self.buf):
+            return None
+        return self.planes
+
+    def close(self):
+        self.fd.close()
+
+class QualityMeter:
+    # PSNR (and SSIM) per plane of every decoded frame against its source
+    # frame in the reference (see SourceFrames), one record per frame written
+    # to fd. Frames with no reference frame, or of another size, are counted
+    # but not compared. For period see SourceFrames
+
+    def __init__(self, fd, reference, ssim=False, period=None):
+        self.fd         = fd
+        self.reference  = reference
+        self.ssim       = ssim
+        self.sources    = SourceFrames(period)
+        self.pending    = [record_header(ssim)]
+        self.frames     = 0
+        self.compared   = 0
+        self.noRef      = 0
+        self.sizeDiffer = 0
+        self.mse        = [0.0] * len(PLANES)
+        self.psnr       = [[0.0, MAX_PSNR, 0.0] for _ in PLANES]
+        self.ssimStats  = [[0.0, 1.0] for _ in PLANES]
+
+    def add_frame(self, dec, n):
+        # last frame of the decoder, source frame n
+        self.frames += 1
+        ref = self.reference.frame(n)
+        if ref is None:
+            self.noRef += 1
+            return
+        planes = dec.frame_planes()
+        if planes[0].shape != ref[0].shape:
+            self.sizeDiffer += 1
+            return
+        self.compared += 1
+        record = [str(n)]
+        for i, (a, b) in enumerate(zip(planes, ref)):
+            mse  = plane_mse(a, b)
+            self.mse[i] += mse
+            p    = psnr(mse)
+            stat = self.psnr[i]
+            stat[0] += p
+            stat[1]  = min(stat[1], p)
+            stat[2]  = max(stat[2], p)
+            record.append('%.3f' % p)
+        if self.ssim:
+            for i, (a, b) in enumerate(zip(planes, ref)):
+                s    = plane_ssim(a, b)
+                stat = self.ssimStats[i]
+                stat[0] += s
+                stat[1]  = min(stat[1], s)
+                record.append('%.5f' % s)
+        self.pending.append('\t'.join(record) + '\n')
+        if len(self.pending) >= QUALITY_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.fd.write(''.join(self.pending))
+            self.pending = []
+
+    def summary(self):
+        # mean, min and max PSNR per plane and the PSNR of the mean squared
+        # error, mean and min SSIM
+        rep = {'frames': self.frames, 'compared': self.compared,
+               'noReference': self.noRef, 'sizeDiffers': self.sizeDiffer}
+        if not self.compared:
+            return rep
+        rep['psnr'] = dict((p, {'mean': total / self.compared, 'min': low, 'max': high,
+                                'global': psnr(mse / self.compared)})
+                           for p, (total, low, high), mse in zip(PLANES, self.psnr, self.mse))
+        if self.ssim:
+            rep['ssim'] = dict((p, {'mean': total / self.compared, 'min': low})
+                               for p, (total, low) in zip(PLANES, self.ssimStats))
+        return rep
+
+    def close(self, fileName):
+        # writes pending records and the summary next to fileName, the file
+        # is left open
+        self.flush()
+        self.reference.close()
+        fd = open(summary_file_name(fileName), 'w')
+        try:
+            json.dump(self.summary(), fd, indent=2, sort_keys=True)
+            fd.write('\n')
+        finally:
+            fd.close()
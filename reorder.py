@@ -0,0 +1,175 @@
+import time
+import heapq
+
+# RTP sequence numbers are 16 bit and wrap around
+SEQ_MOD           = 1 << 16
+SEQ_HALF          = 1 << 15
+# default number of out-of-order packets held per SSRC
+DEF_REORDER_DEPTH = 64
+# a sequence number this far (or the depth, if more) behind the expected one
+# is a restart of the sender rather than a late packet
+MIN_RESYNC_JUMP   = DEF_REORDER_DEPTH
+# decoding order numbers of interleaved NALs are 16 bit too
+DON_MOD           = 1 << 16
+DON_HALF          = 1 << 15
+# default number of interleaved NALs held for decoding order
+DEF_DON_DEPTH     = 64
+
+class ReorderStats:
+
+    def __init__(self):
+        self.lost       = 0
+        self.reordered  = 0
+        self.duplicated = 0
+        self.late       = 0
+        self.resyncs    = 0
+
+    def __str__(self):
+        return "lost: " + str(self.lost) + " , reordered: " + str(self.reordered) + \
+               " , duplicated: " + str(self.duplicated) + " , late: " + str(self.late) + \
+               " , resyncs: " + str(self.resyncs)
+
+class _SsrcState:
+
+    def __init__(self, extSeq):
+        self.expected = extSeq
+        self.held     = {}
+
+class ReorderBuffer:
+    # Puts RTP packets of each SSRC back in sequence number order. At most
+    # `depth` packets are held per SSRC while waiting for a missing one; when
+    # that is exceeded the missing packets are declared lost and the first
+    # packet after the gap is released with lossBefore set. With maxDelay
+    # (seconds) the same happens once the first held packet is older than
+    # that, by packet time or on expire(). A packet further behind the
+    # expected one than the depth (see MIN_RESYNC_JUMP) means the sender
+    # restarted: the held packets are released and the sequence starts over
+    # from it.
+
+    def __init__(self, depth=DEF_REORDER_DEPTH, maxDelay=None):
+        self.depth    = depth
+        self.maxDelay = maxDelay
+        self.streams  = {}
+        self.stats    = ReorderStats()
+
+    def push(self, p):
+        st = self.streams.get(p.ssrc)
+        if st is None:
+            st = self.streams[p.ssrc] = _SsrcState(p.seq)
+        # extended sequence number closest to the expected one
+        delta = (p.seq - st.expected) % SEQ_MOD
+        if delta >= SEQ_HALF:
+            delta -= SEQ_MOD
+        extSeq = st.expected + delta
+        out    = []
+        if extSeq < st.expected - max(self.depth, MIN_RESYNC_JUMP):
+            self.stats.resyncs += 1
+            while st.held:
+                self._skip_gap(st, out)
+            st.expected = extSeq
+        elif extSeq < st.expected:
+            self.stats.late += 1
+            return []
+        if extSeq in st.held:
+            self.stats.duplicated += 1
+            return []
+        if extSeq == st.expected:
+            if st.held:
+                self.stats.reordered += 1
+            out.append(p)
+            st.expected += 1
+            self._drain(st, out)
+            return out
+        st.held[extSeq] = p
+        while len(st.held) > self.depth:
+            self._skip_gap(st, out)
+        self._expire(st, p.time, out)
+        return out
+
+    def expire(self, now):
+        # with maxDelay, releases the packets held too long at time now while
+        # no packet arrives
+        out = []
+        for st in self.streams.values():
+            self._expire(st, now, out)
+        return out
+
+    def flush(self):
+        out = []
+        for st in self.streams.values():
+            while st.held:
+                self._skip_gap(st, out)
+        return out
+
+    def _skip_gap(self, st, out):
+        first = min(st.held)
+        self.stats.lost += first - st.expected
+        st.held[first].lossBefore = True
+        st.expected = first
+        self._drain(st, out)
+
+    def _expire(self, st, now, out):
+        if self.maxDelay is not None:
+            while st.held and now - st.held[min(st.held)].time > self.maxDelay:
+                self._skip_gap(st, out)
+
+    def _drain(self, st, out):
+        held = st.held
+        while st.expected in held:
+            out.append(held.pop(st.expected))
+            st.expected += 1
+
+class DonBuffer:
+    # Puts NALs of interleaved packetization (STAP-B, MTAPs, FU-B, NI-MTAP
+    # with DONs) in decoding order. At most `depth` NALs are held; past that
+    # the one of lowest DON is released. DONs are extended against the last
+    # one pushed, so they may wrap around; a NAL whose DON is below one
+    # already released is late, and dropped like late packets.
+
+    def __init__(self, depth=DEF_DON_DEPTH):
+        self.depth    = depth
+        # heap of (extended DON, arrival, item)
+        self.held     = []
+        self.last     = None
+        self.released = None
+        self.arrivals = 0
+        self.late     = 0
+
+    def push(self, don, item):
+        if self.last is None:
+            extDon = don
+        else:
+            delta = (don - self.last) % DON_MOD
+            if delta >= DON_HALF:
+                delta -= DON_MOD
+            extDon = self.last + delta
+        self.last = extDon
+        if self.released is not None and extDon < self.released:
+            self.late += 1
+            return []
+        heapq.heappush(self.held, (extDon, self.arrivals, item))
+        self.arrivals += 1
+        out = []
+        while len(self.held) > self.depth:
+            out.append(self._pop())
+        return out
+
+    def flush(self):
+        out = []
+        while self.held:
+            out.append(self._pop())
+        return out
+
+    def _pop(self):
+        extDon, _, item = heapq.heappop(self.held)
+        self.released = extDon
+        return item
+
+def reorder_packets(pkts, reorderBuf):
+    # generator stage releasing packets in sequence number order. None is a
+    # poll tick of a live source, whose packet times are arrival times
+    for p in pkts:
+        for q in reorderBuf.push(p) if p is not None else reorderBuf.expire(time.time()):
+            yield q
+    for q in reorderBuf.flush():
+        yield q
@@ -0,0 +1,209 @@
+import logging
+import socket
+from struct import Struct
+
+# ---------------
+# --- LINK LAYERS
+# ---------------
+LINKTYPE_NULL          = 0
+LINKTYPE_ETHERNET      = 1
+LINKTYPE_RAW           = 101
+LINKTYPE_LOOP          = 108
+LINKTYPE_LINUX_SLL     = 113
+LINKTYPE_IPV4          = 228
+# Ethernet header (DST, SRC, ETHERTYPE) and 802.1Q/802.1ad tags
+ETH_HDR_LEN            = 14
+ETH_TYPE_OFF           = 12
+VLAN_TAG_LEN           = 4
+ETHERTYPE_IPV4         = 0x0800
+ETHERTYPE_VLAN         = (0x8100, 0x88a8, 0x9100)
+# Linux cooked capture header
+SLL_HDR_LEN            = 16
+SLL_TYPE_OFF           = 14
+# BSD loopback header (address family)
+NULL_HDR_LEN           = 4
+NULL_AF_INET           = 2
+# ----------
+# --- IP/UDP
+# ----------
+IPV4_MIN_HDR_LEN       = 20
+IPV4_VERSION           = 4
+IPV4_IHL_MASK          = 0x0f
+IPV4_FRAG_MASK         = 0x3fff
+IP_PROTO_UDP           = 17
+UDP_HDR_LEN            = 8
+# -------
+# --- RTP
+# -------
+RTP_HDR_LEN            = 12
+RTP_VERSION            = 2
+RTP_P_MASK             = 0x20
+RTP_X_MASK             = 0x10
+RTP_CC_MASK            = 0x0f
+RTP_M_MASK             = 0x80
+RTP_PT_MASK            = 0x7f
+RTP_EXT_HDR_LEN        = 4
+
+# byte reads go through Struct as well: data may be a memoryview (see
+# pcapreader.MappedPcapReader), whose items are strings. Headers are read
+# with a single call, which costs about as much as reading one field
+_u8  = Struct('B').unpack_from
+_u16 = Struct('>H').unpack_from
+_u32 = Struct('>I').unpack_from
+# IPv4 header (VER_IHL, TOTAL_LEN, FRAG, PROTO, SRC)
+_ipv4Hdr = Struct('>BxHxxHxBxxI').unpack_from
+# RTP header (V_P_X_CC, M_PT, SEQ, TS, SSRC)
+_rtpHdr  = Struct('>BBHII').unpack_from
+
+_scapy = None
+
+def load_scapy():
+    # scapy is slow to import, so only pay for it when it is really needed
+    global _scapy
+    if _scapy is None:
+        logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
+        import scapy.all
+        _scapy = scapy.all
+    return _scapy
+
+class RtpPacket(object):
+    __slots__ = ('index', 'time', 'srcIp', 'ssrc', 'seq', 'timestamp',
+                 'marker', 'payloadType', 'payload', 'lossBefore', 'preroll', 'hidden')
+
+    def __init__(self, ssrc, seq, timestamp, marker, payloadType, payload):
+        self.index       = 0
+        self.time        = 0.0
+        self.srcIp       = 0
+        self.ssrc        = ssrc
+        self.seq         = seq
+        self.timestamp   = timestamp
+        self.marker      = marker
+        self.payloadType = payloadType
+        self.payload     = payload
+        self.lossBefore  = False
+        # decoded only to reference later packets, frames are not output
+        self.preroll     = False
+        # decoded only to bring the decoder to the state it has in a serial
+        # decode: nothing is output, see pcap2yuv.decode_segment_packet
+        self.hidden      = False
+
+    def __getstate__(self):
+        # views on a mapped capture cannot be pickled, worker processes
+        # (see pcap2yuv.decode_sessions) get a copy of the payload
+        return tuple(bytearray(v) if isinstance(v, memoryview) else v
+                     for v in (getattr(self, name) for name in self.__slots__))
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+def ip_to_int(ip):
+    return _u32(socket.inet_aton(ip))[0]
+
+def int_to_ip(ip):
+    return socket.inet_ntoa(Struct('>I').pack(ip))
+
+def parse_ip_filter(filterSrcIp):
+    # comma separated dotted IPs -> set of integers (empty set means no filter)
+    try:
+        return set(ip_to_int(ip.strip()) for ip in filterSrcIp.split(',') if ip.strip())
+    except socket.error:
+        raise ValueError('invalid source IP filter: ' + filterSrcIp)
+
+def parse_ssrc_filter(filterSSRC):
+    # comma separated decimal SSRCs -> set of integers (empty set means no filter)
+    try:
+        return set(int(ssrc) for ssrc in filterSSRC.split(',') if ssrc.strip())
+    except ValueError:
+        raise ValueError('invalid SSRC filter: ' + filterSSRC)
+
+def _scapy_dissect(linktype, data):
+    # slow path for captures the fixed offset parser does not understand
+    if linktype is None:
+        return None
+    _s  = load_scapy()
+    cls = _s.conf.l2types.get(linktype)
+    if cls is None:
+        return None
+    p   = cls(data.tobytes() if isinstance(data, memoryview) else str(data))
+    ip  = p.getlayer(_s.IP)
+    udp = p.getlayer(_s.UDP)
+    if ip is None or udp is None:
+        return None
+    payload = bytearray(str(udp.payload))
+    return ip_to_int(ip.src), payload, 0, len(payload)
+
+def dissect(linktype, data):
+    # returns (src IP, buffer, UDP payload start, UDP payload end) for IPv4/UDP
+    # frames, None for anything else
+    size = len(data)
+    if linktype == LINKTYPE_ETHERNET:
+        if size < ETH_HDR_LEN:
+            return None
+        ethType = _u16(data, ETH_TYPE_OFF)[0]
+        off     = ETH_HDR_LEN
+        while ethType in ETHERTYPE_VLAN and off + VLAN_TAG_LEN <= size:
+            ethType = _u16(data, off + 2)[0]
+            off    += VLAN_TAG_LEN
+        if ethType != ETHERTYPE_IPV4:
+            return None
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        off = 0
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if size < SLL_HDR_LEN or _u16(data, SLL_TYPE_OFF)[0] != ETHERTYPE_IPV4:
+            return None
+        off = SLL_HDR_LEN
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if size < NULL_HDR_LEN or NULL_AF_INET not in (_u8(data, 0)[0], _u8(data, 3)[0]):
+            return None
+        off = NULL_HDR_LEN
+    else:
+        return _scapy_dissect(linktype, data)
+    # IPv4
+    if size < off + IPV4_MIN_HDR_LEN:
+        return None
+    verIhl, totalLen, frag, proto, srcIp = _ipv4Hdr(data, off)
+    if verIhl >> 4 != IPV4_VERSION or proto != IP_PROTO_UDP:
+        return None
+    if frag & IPV4_FRAG_MASK:
+        return _scapy_dissect(linktype, data)
+    ipEnd  = min(off + totalLen, size)
+    off   += (verIhl & IPV4_IHL_MASK) * 4
+    # UDP
+    if ipEnd < off + UDP_HDR_LEN:
+        return None
+    udpEnd = min(off + _u16(data, off + 4)[0], ipEnd)
+    return srcIp, data, off + UDP_HDR_LEN, udpEnd
+
+def peek_ssrc(buf, start, end):
+    # SSRC of an RTP version 2 header, None if the payload is not RTP
+    if end - start < RTP_HDR_LEN:
+        return None
+    b0, _, _, _, ssrc = _rtpHdr(buf, start)
+    return ssrc if b0 >> 6 == RTP_VERSION else None
+
+def peek_seq(buf, start):
+    return _u16(buf, start + 2)[0]
+
+def peek_ts(buf, start):
+    return _u32(buf, start + 4)[0]
+
+def payload_bounds(buf, start, end):
+    # (start, end) of the RTP payload without CSRCs, header extension and
+    # padding; start >= end if there is no payload
+    return _payload_bounds(buf, _u8(buf, start)[0], start, end)
+
+def _payload_bounds(buf, b0, start, end):
+    hdrEnd  = start + RTP_HDR_LEN + (b0 & RTP_CC_MASK) * 4
+    if b0 & RTP_X_MASK and hdrEnd + RTP_EXT_HDR_LEN <= end:
+        hdrEnd += RTP_EXT_HDR_LEN + _u16(buf, hdrEnd + 2)[0] * 4
+    if b0 & RTP_P_MASK and end > hdrEnd:
+        end -= _u8(buf, end - 1)[0]
+    return hdrEnd, end
+
+def parse_rtp(buf, start, end):
+    b0, b1, seq, ts, ssrc = _rtpHdr(buf, start)
+    payStart, payEnd = _payload_bounds(buf, b0, start, end)
+    if payStart >= payEnd:
+        return None
+    return RtpPacket(ssrc, seq, ts, (b1 & RTP_M_MASK) >> 7, b1 & RTP_PT_MASK, buf[payStart : payEnd])
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+
+import sys
+import time
+import socket
+import argparse
+import rtp
+from pcapreader import open_pcap, PcapFormatError
+
+# sends the RTP packets of a pcap file over UDP at their capture pace, e.g. to
+# try the live mode of pcap2yuv on loopback
+DEF_HOST  = '127.0.0.1'
+DEF_SPEED = 1.0
+
+def replay(pcapFile, host, port, filterSrcIp=(), filterSSRC=(), speed=DEF_SPEED):
+    # returns the number of packets sent. speed 0 sends as fast as possible
+    sock  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    pkts  = open_pcap(pcapFile)
+    sent  = 0
+    start = origin = None
+    try:
+        for ts, linktype, data, offset, ordinal in pkts:
+            udp = rtp.dissect(linktype, data)
+            if udp is None:
+                continue
+            srcIp, buf, begin, end = udp
+            ssrc = rtp.peek_ssrc(buf, begin, end)
+            if ssrc is None or (filterSrcIp and srcIp not in filterSrcIp) or \
+               (filterSSRC and ssrc not in filterSSRC):
+                continue
+            if speed:
+                if origin is None:
+                    start, origin = time.time(), ts
+                delay = (ts - origin) / speed - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            sock.sendto(buf[begin:end], (host, port))
+            sent += 1
+    finally:
+        pkts.close()
+        sock.close()
+    return sent
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Send the RTP packets of a pcap file over UDP at "
+                                                 "their capture pace.")
+    parser.add_argument('pcapFile', metavar='<pcap file>', help="pcap file name")
+    parser.add_argument('port', type=int, metavar='<port>', help="destination UDP port")
+    parser.add_argument('--host', default=DEF_HOST, help="destination host. Default is " + DEF_HOST)
+    parser.add_argument('--src-ip', dest='filterSrcIp', default='',
+                        help="only packets from these source IPs (comma separated)")
+    parser.add_argument('--ssrc', dest='filterSSRC', default='',
+                        help="only packets of these SSRCs (comma separated)")
+    parser.add_argument('--speed', type=float, default=DEF_SPEED,
+                        help="pace factor, 0 sends as fast as possible. Default is " + str(DEF_SPEED))
+    return parser
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    try:
+        count = replay(args.pcapFile, args.host, args.port, rtp.parse_ip_filter(args.filterSrcIp),
+                       rtp.parse_ssrc_filter(args.filterSSRC), args.speed)
+    except ValueError as e:
+        print "Invalid filter:", e
+        sys.exit(1)
+    except PcapFormatError as e:
+        print "Could not read " + args.pcapFile + ": ", e
+        sys.exit(1)
+    print count, "RTP packets sent to", args.host + ":" + str(args.port)
@@ -0,0 +1,78 @@
+from ctypes import c_ubyte, cast, addressof, POINTER
+import svcdecoder as svc
+from nal import NAL_TYPE_MASK, NAL_SLICE, NAL_IDR, NAL_SLICE_EXT
+
+# default picture size
+DEF_WIDTH            = 1280
+DEF_HEIGHT           = 720
+# slice NALs making up a picture
+DEF_SLICES_PER_FRAME = 1
+SLICE_TYPES          = (NAL_SLICE, NAL_IDR, NAL_SLICE_EXT)
+
+class StubLib:
+    # stands in for libopensvc: every slicesPerFrame slice NALs make up a
+    # picture of the configured size, stored with the decoder's padding. Like
+    # the library, a picture is returned when the first slice of the next one
+    # is decoded. Pictures differ by a stamp taken from their first slice
+
+    def __init__(self, width=DEF_WIDTH, height=DEF_HEIGHT, slicesPerFrame=DEF_SLICES_PER_FRAME):
+        self.width          = width
+        self.height         = height
+        self.slicesPerFrame = slicesPerFrame
+        self.slices         = 0
+        self.nals           = 0
+        # last byte of the first slice of the picture being decoded, written
+        # in the first U sample of the picture when returned
+        self.stamp          = 0
+        self.planes         = []
+        for w, h, fill in ((width, height, 0x80), (width >> 1, height >> 1, 0x40),
+                           (width >> 1, height >> 1, 0xc0)):
+            pad    = svc.FRAME_PAD >> (0 if w == width else 1)
+            stride = w + pad
+            size   = stride * (h + pad)
+            ramp   = ''.join(chr((fill + i) & 0xff) for i in range(256))
+            plane  = (c_ubyte * size).from_buffer_copy((ramp * (size // 256 + 1))[:size])
+            # first visible pixel, past the top and left border
+            self.planes.append((plane, (pad >> 1) * stride + (pad >> 1)))
+
+    def plane_ptr(self, i):
+        plane, off = self.planes[i]
+        return cast(addressof(plane) + off, POINTER(c_ubyte))
+
+    def SVCDecoder_init(self, dec_data):
+        # a new stream starts, as after a reopen
+        self.slices = 0
+        self.stamp  = 0
+        return svc.SVC_STATUS_OK.value
+
+    def SetCommandLayer(self, command_table, dq_id_max, curr_dq_id, t_com, temporal_id):
+        pass
+
+    def decodeNAL(self, dec_data, nal_data, nal_size, frame, command_table):
+        self.nals += 1
+        if nal_data[0] & NAL_TYPE_MASK not in SLICE_TYPES:
+            return svc.SVC_STATUS_OK.value
+        self.slices += 1
+        if (self.slices - 1) % self.slicesPerFrame:
+            return svc.SVC_STATUS_OK.value
+        # first slice of a picture: the previous one is complete
+        stamp, self.stamp = self.stamp, nal_data[nal_size - 1]
+        if self.slices <= self.slicesPerFrame:
+            return svc.SVC_STATUS_OK.value
+        plane, off   = self.planes[1]
+        plane[off]   = stamp
+        frame        = frame._obj
+        frame.Width  = self.width
+        frame.Height = self.height
+        frame.pY[0], frame.pU[0], frame.pV[0] = [self.plane_ptr(i) for i in range(3)]
+        return svc.SVC_IMAGE_READY.value
+
+    def SVCDecoder_close(self, dec_data):
+        return svc.SVC_STATUS_OK.value
+
+class StubDecoder(svc.SVCDecoder):
+    # svcdecoder.SVCDecoder running on StubLib: the Python side (input
+    # buffers, command layer, frame packing and writing) is the real one
+
+    def __init__(self, width=DEF_WIDTH, height=DEF_HEIGHT, slicesPerFrame=DEF_SLICES_PER_FRAME):
+        svc.SVCDecoder.__init__(self, StubLib(width, height, slicesPerFrame))
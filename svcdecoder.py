@@ -1,10 +1,16 @@
 from ctypes import * #IGNORE:W0614
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 SVC_RVAL = c_int
 SVC_STATUS_ERROR = SVC_RVAL(-1)
 SVC_STATUS_OK    = SVC_RVAL(0)
 SVC_IMAGE_READY  = SVC_RVAL(1)
 SVC_GHOST_IMAGE  = SVC_RVAL(2)	
+# decoded pictures are stored with a border of FRAME_PAD / 2 pixels per side
+FRAME_PAD        = 32
 
 class OPENSVCFRAME(Structure):
     _fields_ = [("Width", c_int),
@@ -16,37 +22,116 @@ class OPENSVCFRAME(Structure):
 class SVCException(Exception):
     pass
 
+# decodeNAL return values handed back as they are
+SVC_DECODE_RVALS = (SVC_STATUS_OK.value, SVC_IMAGE_READY.value, SVC_GHOST_IMAGE.value)
+# initial size of the input buffer used for NALs not given as bytearray
+NAL_BUF_INIT_SIZE = 64 * 1024
+
+class PY_BUFFER(Structure):
+    # Py_buffer of Python 2.7, to read any buffer object from its address
+    _fields_ = [("buf", c_void_p),
+                ("obj", c_void_p),
+                ("len", c_ssize_t),
+                ("itemsize", c_ssize_t),
+                ("readonly", c_int),
+                ("ndim", c_int),
+                ("format", c_char_p),
+                ("shape", POINTER(c_ssize_t)),
+                ("strides", POINTER(c_ssize_t)),
+                ("suboffsets", POINTER(c_ssize_t)),
+                ("smalltable", c_ssize_t * 2),
+                ("internal", c_void_p)]
+
+PyBUF_SIMPLE = 0
+_get_buffer              = pythonapi.PyObject_GetBuffer
+_get_buffer.argtypes     = [py_object, POINTER(PY_BUFFER), c_int]
+_release_buffer          = pythonapi.PyBuffer_Release
+_release_buffer.argtypes = [POINTER(PY_BUFFER)]
+_release_buffer.restype  = None
+
+def _declare_signatures(lib):
+    lib.SVCDecoder_init.argtypes  = [POINTER(c_void_p)]
+    lib.SVCDecoder_init.restype   = c_int
+    lib.SetCommandLayer.argtypes  = [POINTER(c_int), c_int, c_int, POINTER(c_int), c_int]
+    lib.SetCommandLayer.restype   = None
+    lib.decodeNAL.argtypes        = [c_void_p, POINTER(c_ubyte), c_int,
+                                     POINTER(OPENSVCFRAME), POINTER(c_int)]
+    lib.decodeNAL.restype         = c_int
+    lib.SVCDecoder_close.argtypes = [c_void_p]
+    lib.SVCDecoder_close.restype  = c_int
+
 class SVCDecoder():
-    def __init__(self):
-        # init decoder
-        self.lib = CDLL("libopensvc.so")
+    def __init__(self, lib=None):
+        # init decoder; lib stands in for libopensvc if given (see stubdecoder)
+        if lib is None:
+            lib = CDLL("libopensvc.so")
+            _declare_signatures(lib)
+        self.lib = lib
         self.dec_data = c_void_p()
-        rval = self.lib.SVCDecoder_init(byref(self.dec_data))
-        if rval == SVC_STATUS_ERROR: 
-            raise SVCException('SVCDecoder_init failed')
         # init command table		
         self.command_table = (c_int * 4) ()
-        t_com = c_int(0)	
-        self.lib.SetCommandLayer(self.command_table, c_int(255), c_int(0), byref(t_com), c_int(0))
+        self.t_com         = c_int(0)
+        self.reopen()
+        # reusable input buffer, grown as needed
+        self.nal_buf = (c_ubyte * NAL_BUF_INIT_SIZE) ()
+        # packed output frame, reused while the resolution does not change
+        self.frameBuf     = None
+        self.frameBufDims = None
+
+    def reopen(self):
+        # new decoding state, also after close(): the library and the buffers
+        # are kept, so one decoder serves streams one after the other
+        rval = self.lib.SVCDecoder_init(byref(self.dec_data))
+        if rval == SVC_STATUS_ERROR.value: 
+            raise SVCException('SVCDecoder_init failed')
+        self.command       = None
+        self.set_command_layer(255, 0, 0, 0)
+        # command applied before every NAL, see set_target_layer
+        self.layer_command = (0, 0, 3, 0)
         # init frame
         self.frame = OPENSVCFRAME()
 
+    def set_command_layer(self, dq_id_max, curr_dq_id, temporal_com, temporal_id):
+        # the command table is only rewritten when the requested layer changes
+        command = (dq_id_max, curr_dq_id, temporal_com, temporal_id)
+        if command == self.command:
+            return
+        self.t_com.value = temporal_com
+        self.lib.SetCommandLayer(self.command_table, dq_id_max, curr_dq_id, byref(self.t_com), temporal_id)
+        self.command = command
+
+    def set_target_layer(self, did, qid, tid):
+        # decode up to DQId = 16 * did + qid and temporal id tid
+        dq_id = (did << 4) | qid
+        self.layer_command = (dq_id, dq_id, 3, tid)
+
     def decode_nal(self, nal, nal_size):
         # set command table		
-        t_com = c_int(3)	
-        self.lib.SetCommandLayer(self.command_table, c_int(0), c_int(0), byref(t_com), c_int(0))
-        # init input data
-        nal_data = (c_ubyte * nal_size) (*[nal[i] for i in range(nal_size)])
+        self.set_command_layer(*self.layer_command)
+        # init input data: bytearrays are passed without copy, anything else
+        # is copied into the reusable input buffer
+        if isinstance(nal, bytearray):
+            nal_data = (c_ubyte * nal_size).from_buffer(nal)
+        else:
+            if len(self.nal_buf) < nal_size:
+                self.nal_buf = (c_ubyte * (nal_size * 2)) ()
+            # copied once, from the memory of the object (e.g. a memoryview
+            # on the mapped capture, which must not be written to)
+            view = PY_BUFFER()
+            _get_buffer(nal, byref(view), PyBUF_SIMPLE)
+            try:
+                memmove(self.nal_buf, view.buf, min(nal_size, view.len))
+            finally:
+                _release_buffer(byref(view))
+            nal_data = self.nal_buf
         # decode nal		
-        rval = self.lib.decodeNAL(self.dec_data, nal_data, c_int(nal_size), byref(self.frame), self.command_table)
-        if rval == SVC_STATUS_ERROR.value:
+        rval = self.lib.decodeNAL(self.dec_data, nal_data, nal_size, byref(self.frame), self.command_table)
+        # release the view so the caller may resize its bytearray again
+        nal_data = None
+        if rval in SVC_DECODE_RVALS:
+            return rval
+        elif rval == SVC_STATUS_ERROR.value:
             raise SVCException('decodeNAL failed')
-        elif rval == SVC_STATUS_OK.value:
-            return 0
-        elif rval == SVC_IMAGE_READY.value:
-            return 1		
-        elif rval == SVC_GHOST_IMAGE.value:
-            return 2
         else:
             raise SVCException('Unexpected return value from decodeNAL: ' + str(rval))
 
@@ -59,24 +144,63 @@ class SVCDecoder():
                 raise SVCException('Invalid file-descriptor mode')
         except AttributeError:
             raise SVCException('Invalid file-descriptor')
-        # get last frame data        
-        PicWidth  = self.frame.Width  + 32
-        PicHeight = self.frame.Height + 32
-        Y = self.frame.pY[0]
-        U = self.frame.pU[0]
-        V = self.frame.pV[0]
-        # write yuv
-        XDIM = PicWidth  - 32
-        YDIM = PicHeight - 32
-        for i in range(YDIM):
-            l = i * PicWidth                
-            fd.write(bytearray( Y[l : l + XDIM] ))
-        for i in range(YDIM >> 1):
-            l = i * (PicWidth >> 1)
-            fd.write(bytearray( U[l : l + (XDIM >> 1)] ))
-        for i in range(YDIM >> 1):
-            l = i * (PicWidth >> 1)
-            fd.write(bytearray( V[l : l + (XDIM >> 1)] ))
+        fd.write(self.frame_buffer())
+
+    def frame_buffer(self):
+        # last decoded frame packed as planar YUV 4:2:0 (border removed).
+        # The returned buffer is reused and only valid until the next call
+        width  = self.frame.Width
+        height = self.frame.Height
+        stride = width + FRAME_PAD
+        if self.frameBufDims != (width, height):
+            self.frameBufDims = (width, height)
+            self.frameBuf     = numpy.empty(width * height * 3 // 2, numpy.uint8) \
+                                if numpy is not None else bytearray(width * height * 3 // 2)
+        ySize = width * height
+        cSize = ySize >> 2
+        self._copy_plane(self.frame.pY[0], stride,      width,      height,      0)
+        self._copy_plane(self.frame.pU[0], stride >> 1, width >> 1, height >> 1, ySize)
+        self._copy_plane(self.frame.pV[0], stride >> 1, width >> 1, height >> 1, ySize + cSize)
+        if numpy is not None:
+            return self.frameBuf.data
+        return self.frameBuf
+
+    def _copy_plane(self, ptr, stride, width, height, dstOff):
+        if numpy is not None:
+            # strided view over the padded decoder plane, copied in one go
+            src = numpy.ctypeslib.as_array(ptr, shape=(height, stride))[:, :width]
+            self.frameBuf[dstOff : dstOff + width * height].reshape(height, width)[:] = src
+        else:
+            src = cast(ptr, c_void_p).value
+            dst = addressof((c_char * len(self.frameBuf)).from_buffer(self.frameBuf)) + dstOff
+            for i in range(height):
+                memmove(dst + i * width, src + i * stride, width)
+
+    def frame_planes(self):
+        # (Y, U, V) numpy views over the visible area of the last decoded
+        # frame in the decoder buffers, without copy: only valid until the
+        # next NAL is decoded. Requires numpy
+        width  = self.frame.Width
+        height = self.frame.Height
+        stride = width + FRAME_PAD
+        return [numpy.ctypeslib.as_array(ptr, shape=(rows, s))[:, :w]
+                for ptr, s, w, rows in ((self.frame.pY[0], stride,      width,      height),
+                                        (self.frame.pU[0], stride >> 1, width >> 1, height >> 1),
+                                        (self.frame.pV[0], stride >> 1, width >> 1, height >> 1))]
+
+    def hash_frame(self, h):
+        # feeds the last decoded frame to the hashlib object h straight from
+        # the decoder buffers, row by row in the order of frame_buffer(): the
+        # digest is the one of the packed frame, which is never copied
+        width  = self.frame.Width
+        height = self.frame.Height
+        stride = width + FRAME_PAD
+        for ptr, s, w, rows in ((self.frame.pY[0], stride,      width,      height),
+                                (self.frame.pU[0], stride >> 1, width >> 1, height >> 1),
+                                (self.frame.pV[0], stride >> 1, width >> 1, height >> 1)):
+            plane = memoryview((c_ubyte * (s * rows)).from_address(cast(ptr, c_void_p).value))
+            for off in range(0, s * rows, s):
+                h.update(plane[off : off + w])
 
     def close(self):
         # close decoder		
@@ -0,0 +1,273 @@
+#! /usr/bin/env python
+
+import random
+import socket
+import argparse
+from struct import pack
+import pacsi
+from nal import NAL_SLICE, NAL_IDR, NAL_SPS, NAL_PPS, NAL_PREFIX, NAL_SUBSET_SPS, \
+                NAL_SLICE_EXT, NAL_SEI, STAP_A, STAP_B, MTAP16, MTAP24, FU_A, FU_B, PACSI, \
+                FU_S_MASK, FU_E_MASK, DON_MOD, PARAMETER_SETS
+
+# synthetic H.264-SVC over RTP captures, for benchmarks and tests. NAL
+# payloads are filler bytes: only the packetization is realistic
+DEF_FRAMES     = 300
+DEF_GOP        = 30
+DEF_FPS        = 30
+DEF_LAYERS     = 2
+DEF_MTU        = 1400
+DEF_MIN_SLICE  = 100
+DEF_MAX_SLICE  = 4000
+DEF_SEED       = 1
+DEF_SRC_IP     = '10.0.0.1'
+DEF_DST_IP     = '10.0.0.2'
+DEF_SSRC       = 889614168
+DEF_PORT       = 5004
+RTP_PT         = 96
+RTP_CLOCK_RATE = 90000
+# NAL header values: NRI 3 for references, 0 for the PACSI's SEIs and for
+# non-reference pictures, every other access unit of a GOP
+NRI_REF        = 0x60
+NRI_NON_REF    = 0
+PCAP_HDR       = pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+ETH_HDR        = '\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb\x08\x00'
+
+def nal_header(nalType, nri=NRI_REF):
+    return chr(nri | nalType)
+
+def svc_ext(idr, did, qid=0, tid=0):
+    # SVC extension of prefix, slice extension and PACSI NALs
+    return chr(0x80 | (0x40 if idr else 0)) + chr(0x80 | (did << 4) | qid) + chr((tid << 5) | 0x07)
+
+def filler(size, seed):
+    return ''.join(chr((seed + i) & 0xff) for i in range(min(size, 256))) * (size // 256) + \
+           ''.join(chr((seed + i) & 0xff) for i in range(size % 256))
+
+def stream_layout_sei(layers):
+    payload = pacsi.STREAM_LAYOUT_UUID + chr(layers) + '\x00' * 7 + chr(pacsi.SL_P_MASK) + \
+              chr(pacsi.LD_LEN)
+    for did in range(layers):
+        width, height = 320 << did, 180 << did
+        payload += pack(pacsi.LD_FMT, width, height, width, height, 100000 << did,
+                        (4 << 3) | did, 0x02, 0)
+    return nal_header(NAL_SEI, 0) + chr(5) + chr(len(payload)) + payload
+
+def bitstream_info_sei(nals):
+    payload = pacsi.BITSREAM_INFO_UUID + chr(1) + chr(nals)
+    return nal_header(NAL_SEI, 0) + chr(5) + chr(len(payload)) + payload
+
+def pacsi_nal(idr, donc, seis, nri=NRI_REF, tid=0):
+    # PACSI with T flag (DONC) and the S/E flags of a whole access unit
+    nal = nal_header(PACSI, nri) + svc_ext(idr, 0, tid=tid) + chr(0x20 | 0x02 | 0x01) + \
+          pack('>H', donc)
+    for sei in seis:
+        nal += pack('>H', len(sei)) + sei
+    return nal
+
+def access_units(frames=DEF_FRAMES, gop=DEF_GOP, layers=DEF_LAYERS,
+                 minSlice=DEF_MIN_SLICE, maxSlice=DEF_MAX_SLICE, seed=DEF_SEED, paramsOnce=False,
+                 enhIdr=False, temporal=False):
+    # NALs of every access unit: at IDRs parameter sets (at the first one only
+    # with paramsOnce) and a PACSI with stream layout and bitstream info SEIs,
+    # an SVC base slice with its prefix NAL, then one slice extension per
+    # enhancement layer. With enhIdr the access unit in the middle of every
+    # GOP is an IDR in the enhancement layers only. With temporal the
+    # non-reference access units are in temporal layer 1
+    rnd = random.Random(seed)
+    for frame in range(frames):
+        idr    = frame % gop == 0
+        # idr_flag of the enhancement layers
+        extIdr = idr or (enhIdr and layers > 1 and frame % gop == gop // 2 > 0)
+        nri    = NRI_NON_REF if frame % gop % 2 else NRI_REF
+        tid    = 1 if temporal and nri == NRI_NON_REF else 0
+        nals   = []
+        if idr:
+            seis = [stream_layout_sei(layers), bitstream_info_sei(2 * layers)]
+            nals.append(pacsi_nal(True, frame & 0xffff, seis))
+            if frame == 0 or not paramsOnce:
+                nals.append(nal_header(NAL_SPS) + filler(10, frame))
+                if layers > 1:
+                    nals.append(nal_header(NAL_SUBSET_SPS) + filler(12, frame))
+                nals.append(nal_header(NAL_PPS) + filler(4, frame))
+        else:
+            nals.append(pacsi_nal(extIdr, frame & 0xffff, [], nri, tid))
+        if layers > 1:
+            nals.append(nal_header(NAL_PREFIX, nri) + svc_ext(idr, 0, tid=tid))
+        # slices start with first_mb_in_slice 0, a single 1 bit
+        nals.append(nal_header(NAL_IDR if idr else NAL_SLICE, nri) + '\x80' +
+                    filler(rnd.randint(minSlice, maxSlice), frame))
+        for did in range(1, layers):
+            nals.append(nal_header(NAL_SLICE_EXT, nri) + svc_ext(extIdr, did, tid=tid) +
+                        '\x80' + filler(rnd.randint(minSlice, maxSlice) << did, frame))
+        yield nals
+
+def packetize(nals, mtu=DEF_MTU, alone=()):
+    # RTP payloads of one access unit: NALs that fit together go in STAP-As,
+    # NALs that fit alone or whose type is in alone in single NAL packets,
+    # bigger ones in FU-As
+    payloads = []
+    stap     = []
+    for nal in nals:
+        if ord(nal[0]) & 0x1f in alone:
+            if stap:
+                payloads.append(stap_a(stap))
+                stap = []
+            payloads.append(nal)
+            continue
+        if len(stap) and 1 + sum(2 + len(n) for n in stap) + 2 + len(nal) > mtu:
+            payloads.append(stap_a(stap))
+            stap = []
+        if 1 + 2 + len(nal) <= mtu and (stap or len(nal) < mtu // 2):
+            stap.append(nal)
+            continue
+        if stap:
+            payloads.append(stap_a(stap))
+            stap = []
+        if len(nal) <= mtu:
+            payloads.append(nal)
+        else:
+            payloads.extend(fu_a(nal, mtu))
+    if stap:
+        payloads.append(stap_a(stap))
+    return payloads
+
+def packetize_interleaved(nals, don, mtu=DEF_MTU, aggregate=STAP_B):
+    # RTP payloads of one access unit in interleaved mode, its first NAL
+    # has decoding order number don: NALs that fit together go in aggregates
+    # of the given type (STAP-B, MTAP16 or MTAP24), alone if need be, bigger
+    # ones in an FU-B followed by FU-As
+    unitLen  = {STAP_B: 2, MTAP16: 5, MTAP24: 6}[aggregate]
+    payloads = []
+    group    = []
+    for nal in nals:
+        if group and 3 + sum(unitLen + len(n) for n in group) + unitLen + len(nal) > mtu:
+            payloads.append(aggregate_nals(aggregate, group, don - len(group)))
+            group = []
+        if 3 + unitLen + len(nal) <= mtu:
+            group.append(nal)
+        else:
+            if group:
+                payloads.append(aggregate_nals(aggregate, group, don - len(group)))
+                group = []
+            payloads.extend(fu_a(nal, mtu - 2, don))
+        don += 1
+    if group:
+        payloads.append(aggregate_nals(aggregate, group, don - len(group)))
+    return payloads
+
+def aggregate_nals(aggregate, nals, don):
+    # STAP-B, MTAP16 or MTAP24 with the DON (base) of the first NAL, MTAP
+    # units have timestamp offset 0
+    nri = max(ord(n[0]) & 0x60 for n in nals)
+    hdr = nal_header(aggregate, nri) + pack('>H', don % DON_MOD)
+    if aggregate == STAP_B:
+        return hdr + ''.join(pack('>H', len(n)) + n for n in nals)
+    tsOffset = '\x00' * (2 if aggregate == MTAP16 else 3)
+    return hdr + ''.join(pack('>HB', len(n), i) + tsOffset + n for i, n in enumerate(nals))
+
+def stap_a(nals):
+    if len(nals) == 1:
+        return nals[0]
+    nri = max(ord(n[0]) & 0x60 for n in nals)
+    return nal_header(STAP_A, nri) + ''.join(pack('>H', len(n)) + n for n in nals)
+
+def fu_a(nal, mtu, don=None):
+    # with a DON, the first fragment is an FU-B
+    indicator = nal_header(FU_A, ord(nal[0]) & 0x60)
+    nalType   = ord(nal[0]) & 0x1f
+    body      = nal[1:]
+    step      = mtu - 2
+    frags     = []
+    for pos in range(0, len(body), step):
+        fuHdr = nalType | (FU_S_MASK if pos == 0 else 0) | (FU_E_MASK if pos + step >= len(body) else 0)
+        frags.append(indicator + chr(fuHdr) + body[pos : pos + step])
+    if don is not None:
+        frags[0] = nal_header(FU_B, ord(nal[0]) & 0x60) + frags[0][1] + pack('>H', don % DON_MOD) + \
+                   frags[0][2:]
+    return frags
+
+def udp_frame(payload, srcIp, dstIp, port):
+    udp = pack('>HHHH', port, port, 8 + len(payload), 0) + payload
+    ip  = pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0x4000, 64, 17, 0,
+               socket.inet_aton(srcIp), socket.inet_aton(dstIp))
+    return ETH_HDR + ip + udp
+
+def write_pcap(fileName, frames=DEF_FRAMES, gop=DEF_GOP, layers=DEF_LAYERS, mtu=DEF_MTU,
+               minSlice=DEF_MIN_SLICE, maxSlice=DEF_MAX_SLICE, fps=DEF_FPS, seed=DEF_SEED,
+               ssrc=DEF_SSRC, srcIp=DEF_SRC_IP, dstIp=DEF_DST_IP, interleaved=False,
+               firstDon=0, paramsOnce=False, enhIdr=False, temporal=False):
+    # returns the number of RTP packets written. Interleaved captures use
+    # STAP-B, MTAP16 and MTAP24 in turn and FU-B, and send every access unit
+    # at an odd position of its GOP after the one that follows it. With
+    # paramsOnce parameter sets are only sent at the start, each in a single
+    # NAL packet. For enhIdr and temporal see access_units
+    fd  = open(fileName, 'wb')
+    seq = 0
+    don = firstDon
+    aus = []
+    for frame, nals in enumerate(access_units(frames, gop, layers, minSlice, maxSlice, seed,
+                                              paramsOnce, enhIdr, temporal)):
+        if interleaved:
+            payloads = packetize_interleaved(nals, don, mtu, (STAP_B, MTAP16, MTAP24)[frame % 3])
+            don     += len(nals)
+        else:
+            payloads = packetize(nals, mtu, PARAMETER_SETS if paramsOnce else ())
+        aus.append((frame, payloads))
+    n = 0
+    while interleaved and n + 1 < len(aus):
+        if n % gop % 2 and (n + 1) % gop:
+            aus[n], aus[n + 1] = aus[n + 1], aus[n]
+            n += 1
+        n += 1
+    try:
+        fd.write(PCAP_HDR)
+        for frame, payloads in aus:
+            ts       = frame * RTP_CLOCK_RATE // fps
+            usec     = frame * 1000000 // fps
+            for i, payload in enumerate(payloads):
+                rtpHdr = pack('>BBHII', 0x80, (0x80 if i == len(payloads) - 1 else 0) | RTP_PT,
+                              seq & 0xffff, ts & 0xffffffff, ssrc)
+                data   = udp_frame(rtpHdr + payload, srcIp, dstIp, DEF_PORT)
+                fd.write(pack('<IIII', usec // 1000000, usec % 1000000, len(data), len(data)) + data)
+                seq   += 1
+    finally:
+        fd.close()
+    return seq
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Write a synthetic pcap file of RTP packets carrying "
+                                                 "H.264-SVC NALs (filler payloads), for benchmarks.")
+    parser.add_argument('pcapFile', metavar='<pcap file>', help="output pcap file name")
+    parser.add_argument('--frames', type=int, default=DEF_FRAMES,
+                        help="access units. Default is " + str(DEF_FRAMES))
+    parser.add_argument('--gop', type=int, default=DEF_GOP,
+                        help="access units between IDRs. Default is " + str(DEF_GOP))
+    parser.add_argument('--layers', type=int, default=DEF_LAYERS, choices=range(1, 8),
+                        help="spatial layers (DID 0 ..). Default is " + str(DEF_LAYERS))
+    parser.add_argument('--mtu', type=int, default=DEF_MTU,
+                        help="max RTP payload size. Default is " + str(DEF_MTU))
+    parser.add_argument('--min-slice', dest='minSlice', type=int, default=DEF_MIN_SLICE,
+                        help="min base layer slice size. Default is " + str(DEF_MIN_SLICE))
+    parser.add_argument('--max-slice', dest='maxSlice', type=int, default=DEF_MAX_SLICE,
+                        help="max base layer slice size, doubled per layer. Default is " +
+                             str(DEF_MAX_SLICE))
+    parser.add_argument('--seed', type=int, default=DEF_SEED,
+                        help="seed of the slice sizes. Default is " + str(DEF_SEED))
+    parser.add_argument('--interleaved', action='store_true',
+                        help="interleaved packetization mode: STAP-B, MTAPs and FU-B with DONs, "
+                             "access units sent out of decoding order")
+    parser.add_argument('--params-once', dest='paramsOnce', action='store_true',
+                        help="send parameter sets only at the start, each in a single NAL packet")
+    parser.add_argument('--enh-idr', dest='enhIdr', action='store_true',
+                        help="make the access unit in the middle of every GOP an IDR in the "
+                             "enhancement layers only")
+    parser.add_argument('--temporal', action='store_true',
+                        help="put the non-reference access units in temporal layer 1")
+    return parser
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    count = write_pcap(args.pcapFile, args.frames, args.gop, args.layers, args.mtu,
+                       args.minSlice, args.maxSlice, seed=args.seed, interleaved=args.interleaved,
+                       paramsOnce=args.paramsOnce, enhIdr=args.enhIdr, temporal=args.temporal)
+    print count, "RTP packets written in", args.pcapFile
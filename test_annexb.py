@@ -0,0 +1,53 @@
+import unittest
+from StringIO import StringIO
+import annexb
+import synthpcap
+from decodecase import DecodeCase, LAYERS
+
+class Test(DecodeCase):
+
+    def setUp(self):
+        DecodeCase.setUp(self)
+        self.nals = [nal for au in synthpcap.access_units(self.FRAMES, self.GOP, LAYERS, 10, 1500)
+                     for nal in au]
+
+    def export(self, **opts):
+        ses = self.decode_stream('out.264', pacsiFile=None, annexB=True, **opts)
+        return ses, open(self.path('out.264'), 'rb').read()
+
+    def test_writer(self):
+        out    = StringIO()
+        writer = annexb.AnnexBWriter(out)
+        writer.write(bytearray('\x67\x42\x00'), 2)
+        writer.write(bytearray('\x68\xce'), 2)
+        self.assertEquals(out.getvalue(), '')
+        writer.flush()
+        self.assertEquals(out.getvalue(), '\x00\x00\x00\x01\x67\x42\x00\x00\x00\x01\x68\xce')
+        self.assertEquals(writer.size, 12)
+
+    def test_export(self):
+        ses, data = self.export()
+        self.assertEquals(data, ''.join(annexb.START_CODE + nal for nal in self.nals))
+        self.assertEquals(ses.metrics.bytes, len(data))
+
+    def test_export_pipeline_without_pacsi(self):
+        ses, data = self.export(pipeline=True, dropPacsi=True)
+        self.assertEquals(data, ''.join(annexb.START_CODE + nal for nal in self.nals
+                                        if ord(nal[0]) & 0x1f != 30))
+
+    def test_export_base_layer(self):
+        ses, data = self.export(targetDid=0)
+        self.assertEquals(data, ''.join(annexb.START_CODE + nal for nal in self.nals
+                                        if ord(nal[0]) & 0x1f != 20))
+
+    def test_export_temporal_layer(self):
+        # the base slices of temporal layer 1 go with their prefix NALs,
+        # sent in an aggregate with the PACSI
+        self.write_capture(self.pcapFile, gop=4, temporal=True)
+        aus       = list(synthpcap.access_units(self.FRAMES, 4, LAYERS, 10, 1500, temporal=True))
+        ses, data = self.export(targetTid=0)
+        self.assertEquals(data, ''.join(annexb.START_CODE + nal for frame, au in enumerate(aus)
+                                        if frame % 2 == 0 for nal in au))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import json
+import os
+import batch
+from decodecase import DecodeCase, options
+
+# frames of the captures
+CAPTURES = (('a.pcap', 12), ('b.pcap', 7), ('c.pcapng', 9))
+
+class Test(DecodeCase):
+
+    def setUp(self):
+        DecodeCase.setUp(self)
+        self.capDir = self.path('captures')
+        self.outDir = self.path('out')
+        os.mkdir(self.capDir)
+        for name, frames in CAPTURES:
+            # pcapng by name only, the reader goes by the magic number
+            self.write_capture(os.path.join(self.capDir, name), frames)
+        open(os.path.join(self.capDir, 'notes.txt'), 'w').close()
+
+    def run_batch(self, jobs, workers=2, rerun=False):
+        return batch.summarize(batch.run_batch(jobs, options(), workers,
+                                               os.path.join(self.outDir, 'state'), rerun,
+                                               verbose=False))
+
+    def single(self, pcapFile):
+        # YUV of a decode on its own, with a new decoder
+        self.assertEquals(self.main('single.yuv', pcapFile, 'p.txt', 'n.txt'), 0)
+        return open(self.path('single.yuv'), 'rb').read()
+
+    def test_dir(self):
+        jobs = batch.dir_jobs(self.capDir, self.outDir, '', '', options())
+        self.assertEquals([os.path.basename(job.outFile) for job in jobs], ['a.yuv', 'b.yuv', 'c.yuv'])
+        # one worker: the decoder is reused by every job
+        summary = self.run_batch(jobs, workers=1)
+        self.assertEquals((summary['ok'], summary['failed'], summary['skipped']), (3, 0, 0))
+        self.assertEquals(summary['frames'], sum(frames - 1 for name, frames in CAPTURES))
+        for job in jobs:
+            self.assertEquals(open(job.outFile, 'rb').read(), self.single(job.pcapFile))
+            self.assertTrue(os.path.exists(job.logFile))
+        # finished jobs are skipped, a changed capture is run again
+        self.write_capture(jobs[1].pcapFile, 6)
+        os.utime(jobs[1].pcapFile, (0, 0))
+        summary = self.run_batch(jobs)
+        self.assertEquals((summary['ok'], summary['skipped']), (1, 2))
+        self.assertEquals(summary['results'][1]['frames'], 5)
+        self.assertTrue(summary['results'][0]['skipped'])
+        self.assertEquals(self.run_batch(jobs, rerun=True)['ok'], 3)
+
+    def test_manifest(self):
+        manifest = os.path.join(self.capDir, 'jobs.txt')
+        open(manifest, 'w').write('# pcap srcip ssrc\n'
+                                  'a.pcap - -  out_a.yuv\n'
+                                  'missing.pcap 10.0.0.1 - \n'
+                                  'b.pcap - - - b_pacsi.txt  # comment\n')
+        jobs = batch.manifest_jobs(manifest, self.outDir, options())
+        self.assertEquals([(job.filterSrcIp, job.filterSSRC) for job in jobs],
+                          [('', ''), ('10.0.0.1', ''), ('', '')])
+        self.assertEquals(jobs[0].outFile, os.path.join(self.capDir, 'out_a.yuv'))
+        self.assertEquals(jobs[2].outFile, os.path.join(self.outDir, 'b.yuv'))
+        self.assertEquals(jobs[2].outPacsiFile, os.path.join(self.capDir, 'b_pacsi.txt'))
+        summary = self.run_batch(jobs)
+        self.assertEquals((summary['ok'], summary['failed']), (2, 1))
+        self.assertEquals(summary['results'][1]['status'], 1)
+        self.assertTrue('does not exist' in open(jobs[1].logFile).read())
+        # the failed job is tried again
+        summary = self.run_batch(jobs)
+        self.assertEquals((summary['failed'], summary['skipped']), (1, 2))
+        open(manifest, 'a').write('c.pcapng -\n')
+        self.assertRaises(ValueError, batch.manifest_jobs, manifest, self.outDir, options())
+
+    def test_state(self):
+        state = self.path('state')
+        open(state, 'w').write(json.dumps({'key': 'k1', 'result': {'status': 0}}) + '\n' +
+                               json.dumps({'key': 'k2', 'result': {'status': 1}}) + '\n' +
+                               '{"key": "k3", "res')
+        self.assertEquals(batch.load_state(state), {'k1': {'status': 0}})
+
+if __name__ == "__main__":
+    unittest.main()
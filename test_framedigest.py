@@ -0,0 +1,58 @@
+import unittest
+import hashlib
+import os
+import stubdecoder
+import framedigest
+from decodecase import DecodeCase, WIDTH, HEIGHT
+
+class Test(DecodeCase):
+
+    def test_hash_frame(self):
+        # hashing the decoder buffers is hashing the packed frame
+        dec = stubdecoder.StubDecoder(WIDTH, HEIGHT)
+        for nal in ('\x65\x80\x01', '\x41\x80\x02'):
+            rval = dec.decode_nal(bytearray(nal), len(nal))
+        self.assertEquals(rval, 1)
+        h = hashlib.sha1()
+        dec.hash_frame(h)
+        self.assertEquals(h.hexdigest(), hashlib.sha1(bytearray(dec.frame_buffer())).hexdigest())
+
+    def test_digests(self):
+        self.decode_stream('out.yuv')
+        ses = self.decode_stream('out.digests', digest=True)
+        # no YUV file, and the digests are those of its frames
+        self.assertFalse(os.path.exists(self.path('out.digests.idx')))
+        algo, digests = framedigest.load_digests(self.path('out.digests'))
+        self.assertEquals(algo, framedigest.DEF_DIGEST_ALGO)
+        self.assertEquals(len(digests), ses.frames)
+        self.assertEquals(digests, list(framedigest.yuv_digests(self.path('out.yuv'))))
+        # frames differ by the stamp of the stub decoder
+        self.assertEquals(len(set(d for w, h, d in digests)), len(digests))
+
+    def test_verify(self):
+        ref = self.path('ref.digests')
+        self.decode_stream('ref.digests', digest=True, digestAlgo='sha256')
+        ses = self.decode_stream('out.digests', verify=ref)
+        self.assertEquals(ses.digests.algo, 'sha256')
+        self.assertEquals(ses.digests.mismatch, None)
+        # frames after --frames are not missing
+        ses = self.decode_stream('out.digests', verify=ref, frames=3)
+        self.assertEquals(ses.digests.mismatch, None)
+        # decoding stops at the first mismatch
+        good = open(ref).readlines()
+        bad  = list(good)
+        bad[4] = bad[4][:-2] + ('1' if bad[4][-2] == '0' else '0') + '\n'
+        open(ref, 'w').writelines(bad)
+        ses = self.decode_stream('out.digests', verify=ref)
+        self.assertEquals(ses.digests.mismatch.split(',')[0], 'frame 3 is 16x8 ' + good[4].split()[-1])
+        self.assertEquals(ses.frames, 4)
+        # shorter and longer references
+        open(ref, 'w').writelines(good[:4])
+        self.assertEquals(self.decode_stream('out.digests', verify=ref).digests.mismatch,
+                          'frame 3 is not in the reference (3 frames)')
+        open(ref, 'w').writelines(good + ['%d\t16\t8\t%s\n' % (self.FRAMES - 1, '0' * 64)])
+        self.assertEquals(self.decode_stream('out.digests', verify=ref).digests.mismatch,
+                          '%d frames decoded, reference has %d' % (self.FRAMES - 1, self.FRAMES))
+
+if __name__ == "__main__":
+    unittest.main()
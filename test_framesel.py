@@ -0,0 +1,55 @@
+import unittest
+import os
+import framesel
+from decodecase import DecodeCase, LAYERS, WIDTH, HEIGHT
+
+# base layer slices: IDR, reference and non-reference, first_mb_in_slice 0
+IDR     = bytearray('\x65\x80')
+REF     = bytearray('\x41\x80')
+NON_REF = bytearray('\x01\x80')
+SPS     = bytearray('\x67\x42')
+
+class Test(DecodeCase):
+
+    def decode(self, **opts):
+        ses = self.decode_stream('out.yuv', **opts)
+        self.assertEquals(os.path.getsize(self.path('out.yuv')), ses.frames * WIDTH * HEIGHT * 3 // 2)
+        return ses
+
+    def test_selector(self):
+        sel = framesel.FrameSelector(every=2)
+        self.assertTrue(sel.decode(IDR))
+        self.assertTrue(sel.decode(SPS))
+        # the second access unit is not written and, being non-reference, not decoded
+        self.assertFalse(sel.decode(NON_REF))
+        self.assertTrue(sel.decode(REF))
+        # the picture returned with the first slice of the third access unit
+        # is the one of the first
+        self.assertTrue(sel.write_image())
+        # the fourth one is not written but decoded, as a reference
+        self.assertTrue(sel.decode(REF))
+        self.assertTrue(sel.write_image())
+        self.assertTrue(sel.decode(REF))
+        self.assertFalse(sel.write_image())
+        self.assertEquals(sel.skipped, 1)
+
+    def test_all_frames(self):
+        # the last picture is never returned
+        self.assertEquals(self.decode().frames, self.FRAMES - 1)
+
+    def test_every(self):
+        # access units 0, 3, 6 and 9 are written, non-reference 1, 8 and 11
+        # are not decoded
+        ses = self.decode(everyNth=3)
+        self.assertEquals(ses.frames, 4)
+        self.assertEquals(ses.selector.skipped, 3 * (LAYERS + 1))
+
+    def test_keyframes(self):
+        # only IDR access units 0, 5 and 10 are decoded
+        ses = self.decode(keyFrames=True)
+        self.assertEquals(ses.frames, 2)
+        self.assertEquals(ses.selector.skipped, (self.FRAMES - 3) * (LAYERS + 1))
+        self.assertEquals(self.decode(keyFrames=True, everyNth=2).frames, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import threading
+import time
+import os
+import socket
+import live
+import annexb
+import synthpcap
+import rtpreplay
+import pcap2yuv
+from struct import pack
+from pcapreader import PcapReader
+from decodecase import DecodeCase, LAYERS
+
+class Test(DecodeCase):
+
+    def setUp(self):
+        DecodeCase.setUp(self)
+        self.stream = ''.join(annexb.START_CODE + nal
+                              for au in synthpcap.access_units(self.FRAMES, self.GOP, LAYERS, 10, 1500)
+                              for nal in au)
+
+    def export(self, pkts):
+        self.decode_stream('out.264', pkts, pacsiFile=None, annexB=True, maxDelay=live.DEF_MAX_DELAY)
+        return open(self.path('out.264'), 'rb').read()
+
+    def test_udp_address(self):
+        self.assertEquals(live.udp_address('udp:5004'), (live.DEF_LISTEN_HOST, 5004))
+        self.assertEquals(live.udp_address('udp:127.0.0.1:5004'), ('127.0.0.1', 5004))
+        self.assertRaises(ValueError, live.udp_address, 'udp:port')
+
+    def test_udp(self):
+        receiver = live.UdpReceiver('127.0.0.1', 0)
+        port     = receiver.address()[1]
+        sender   = threading.Thread(target=rtpreplay.replay, args=(self.pcapFile, '127.0.0.1', port),
+                                    kwargs={'speed': 0})
+        sender.start()
+        try:
+            data = self.export(receiver.packets(set(), set(), live.StopRequest(), idleTimeout=0.5))
+        finally:
+            sender.join()
+            receiver.close()
+        self.assertEquals(data, self.stream)
+
+    def test_idle_timeout(self):
+        # packets filtered out do not keep the stream going
+        receiver = live.UdpReceiver('127.0.0.1', 0)
+        sock     = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        done     = threading.Event()
+        def send():
+            while not done.wait(0.02):
+                # RTP packet of SSRC 1
+                sock.sendto(pack('>BBHII', 0x80, 96, 0, 0, 1) + '\x01', receiver.address())
+        sender = threading.Thread(target=send)
+        sender.start()
+        try:
+            t    = time.time()
+            pkts = list(receiver.packets(set(), set([2]), live.StopRequest(), idleTimeout=0.3,
+                                         ticks=True))
+            self.assertTrue(time.time() - t < 0.3 + 2 * live.POLL_INTERVAL)
+            self.assertEquals(pkts, [])
+        finally:
+            done.set()
+            sender.join()
+            sock.close()
+            receiver.close()
+
+    def test_stdin(self):
+        rfd, wfd = os.pipe()
+        writer   = threading.Thread(target=lambda: (os.write(wfd, open(self.pcapFile, 'rb').read()),
+                                                    os.close(wfd)))
+        writer.start()
+        reader = PcapReader(live.StdinStream(live.StopRequest(), rfd))
+        data   = self.export(pcap2yuv.filter_packets(reader, set(), set()))
+        writer.join()
+        os.close(rfd)
+        self.assertEquals(data, self.stream)
+
+    def test_stop_while_waiting(self):
+        rfd, wfd = os.pipe()
+        stop     = live.StopRequest()
+        stream   = live.StdinStream(stop, rfd)
+        threading.Timer(0.1, lambda: setattr(stop, 'stopped', True)).start()
+        t = time.time()
+        self.assertEquals(stream.read(16), '')
+        self.assertTrue(time.time() - t < 0.1 + 2 * live.POLL_INTERVAL)
+        os.close(rfd)
+        os.close(wfd)
+
+if __name__ == "__main__":
+    unittest.main()
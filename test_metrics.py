@@ -0,0 +1,46 @@
+import unittest
+import tempfile
+import json
+import os
+import metrics
+
+class Test(unittest.TestCase):
+
+    def test_timed_and_nested_stages(self):
+        m     = metrics.RunMetrics()
+        inner = metrics.timed(iter(range(10)), m, metrics.STAGE_PCAP)
+        outer = metrics.timed((i * 2 for i in inner), m, metrics.STAGE_FILTER)
+        self.assertEquals(list(outer), range(0, 20, 2))
+        m.nest(metrics.STAGE_FILTER, metrics.STAGE_PCAP)
+        times = m.report()['times']
+        self.assertTrue(m.times[metrics.STAGE_FILTER] >= m.times[metrics.STAGE_PCAP] > 0)
+        self.assertEquals(times[metrics.STAGE_FILTER],
+                          m.times[metrics.STAGE_FILTER] - m.times[metrics.STAGE_PCAP])
+
+    def test_report_and_merge(self):
+        worker = metrics.RunMetrics()
+        worker.packets = 3
+        for nalType in (5, 1, 1):
+            worker.add_nal(nalType)
+        worker.add_frame(100)
+        worker.times[metrics.STAGE_DECODE] = 0.5
+        run = metrics.RunMetrics()
+        run.packets = 3
+        run.merge(json.loads(json.dumps(worker.report())))
+        rep = run.report()
+        self.assertEquals((rep['packets'], rep['nals'], rep['frames'], rep['bytes']), (3, 3, 1, 100))
+        self.assertEquals(rep['nalTypes'], {'1': 2, '5': 1})
+        self.assertEquals(rep['times'][metrics.STAGE_DECODE], 0.5)
+        self.assertTrue(rep['peakMemoryKB'] > 0)
+
+    def test_save(self):
+        fd, name = tempfile.mkstemp()
+        os.close(fd)
+        metrics.RunMetrics().save(name, pcapFile='a.pcap')
+        rep = json.load(open(name))
+        os.remove(name)
+        self.assertEquals(rep['pcapFile'], 'a.pcap')
+        self.assertEquals(sorted(rep['times']), sorted(metrics.STAGES))
+
+if __name__ == "__main__":
+    unittest.main()
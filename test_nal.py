@@ -0,0 +1,105 @@
+import unittest
+from struct import pack
+import nal
+
+IDR      = bytearray('\x65\x88\x80')
+SLICE    = bytearray('\x41\x9a\x02')
+EXT_IDR  = bytearray('\x74\xc0\x80\x07')
+EXT      = bytearray('\x74\x80\x80\x07')
+# IDR in the enhancement layer (DID 1) only
+EXT_IDR1 = bytearray('\x74\xc0\x90\x07')
+PACSI_I  = bytearray('\x7e\xc0\x80\x07\x22')
+PACSI_NI = bytearray('\x7e\x80\x80\x07\x22')
+
+def stap(*nals):
+    return bytearray('\x78') + bytearray(''.join(pack('>H', len(n)) + str(n) for n in nals))
+
+def mtap(nalType, donb, *nals):
+    tsOffset = '\x00' * (2 if nalType == nal.MTAP16 else 3)
+    return bytearray(chr(0x60 | nalType) + pack('>H', donb) +
+                     ''.join(pack('>HB', len(n), i * 2) + tsOffset + str(n) for i, n in enumerate(nals)))
+
+def aggregated(payload):
+    return [(str(payload[start:end]), don) for start, end, don in
+            nal.aggregated_nals(payload, 0, len(payload))]
+
+def is_key(payload):
+    return nal.is_key_payload(payload, 0, len(payload))
+
+class Test(unittest.TestCase):
+
+    def test_single_nals(self):
+        self.assertTrue(is_key(IDR))
+        self.assertFalse(is_key(SLICE))
+        self.assertTrue(is_key(EXT_IDR))
+        self.assertFalse(is_key(EXT))
+        self.assertFalse(is_key(EXT_IDR1))
+        # the I flag may stand for an enhancement layer IDR only
+        self.assertFalse(is_key(PACSI_I))
+        self.assertFalse(is_key(PACSI_NI))
+
+    def test_stap_a(self):
+        self.assertTrue(is_key(stap(PACSI_NI, IDR)))
+        self.assertFalse(is_key(stap(PACSI_NI, SLICE)))
+        self.assertFalse(is_key(stap(PACSI_I, SLICE, EXT_IDR1)))
+
+    def test_fu_a(self):
+        self.assertTrue(is_key(bytearray('\x7c\x85\x88')))
+        self.assertFalse(is_key(bytearray('\x7c\x05\x88')))
+        self.assertTrue(is_key(bytearray('\x7c\x94\xc0\x80\x07')))
+        self.assertFalse(is_key(bytearray('\x7c\x94\x80\x80\x07')))
+        self.assertFalse(is_key(bytearray('\x7c\x94\xc0\x90\x07')))
+
+    def test_aggregates(self):
+        self.assertEquals(aggregated(stap(PACSI_NI, IDR)), [(str(PACSI_NI), None), (str(IDR), None)])
+        stapB = bytearray('\x79\xff\xff') + stap(SLICE, EXT)[1:]
+        self.assertEquals(aggregated(stapB), [(str(SLICE), 65535), (str(EXT), 0)])
+        self.assertTrue(is_key(bytearray('\x79\x00\x01') + stap(PACSI_NI, IDR)[1:]))
+        for nalType in (nal.MTAP16, nal.MTAP24):
+            self.assertEquals(aggregated(mtap(nalType, 65534, SLICE, EXT, IDR)),
+                              [(str(SLICE), 65534), (str(EXT), 0), (str(IDR), 2)])
+            self.assertTrue(is_key(mtap(nalType, 0, SLICE, EXT_IDR)))
+            self.assertFalse(is_key(mtap(nalType, 0, SLICE, EXT)))
+        # NI-MTAP, with DONs when J is set
+        niMtap = bytearray('\x7f\x10') + ''.join(pack('>HH', len(n), 0) + str(n) for n in (SLICE, EXT))
+        self.assertEquals(aggregated(niMtap), [(str(SLICE), None), (str(EXT), None)])
+        niMtap = bytearray('\x7f\x14') + ''.join(pack('>HHH', len(n), 0, don) + str(n)
+                                                   for don, n in ((7, SLICE), (6, EXT)))
+        self.assertEquals(aggregated(niMtap), [(str(SLICE), 7), (str(EXT), 6)])
+        # other type 31 subtypes
+        self.assertEquals(aggregated(bytearray('\x7f\x08\x00\x03') + IDR), [])
+        # truncated unit
+        self.assertEquals(aggregated(mtap(nal.MTAP16, 0, SLICE)[:6]), [])
+
+    def test_fu_b(self):
+        self.assertTrue(is_key(bytearray('\x7d\x85\x00\x07\x88')))
+        self.assertTrue(is_key(bytearray('\x7d\x94\x00\x07\xc0\x80\x07')))
+        self.assertFalse(is_key(bytearray('\x7d\x94\x00\x07\x80\x80\x07')))
+
+    def test_parameter_set_id(self):
+        def ps_id(payload):
+            return nal.parameter_set_id(bytearray(payload), 0, len(payload))
+        # baseline profile, level 3.0, id 0 / 3
+        self.assertEquals(ps_id('\x67\x42\x00\x1e\x80'), 0)
+        self.assertEquals(ps_id('\x6f\x53\x00\x1e\x20'), 3)
+        self.assertEquals(ps_id('\x68\xce'), 0)
+        self.assertEquals(ps_id('\x68\x0a\x80'), 20)
+        # emulation prevention byte after profile 0 and constraint flags 0
+        self.assertEquals(ps_id('\x67\x00\x00\x03\x01\x40'), 1)
+        self.assertEquals(ps_id('\x67\x42\x00'), None)
+
+    def test_above_layer(self):
+        # EXT is DID 0, QID 0, TID 0
+        for layer, above in (((0, 0, 0), False), ((1, 0, 0), False)):
+            self.assertEquals(nal.above_layer(nal.NAL_SLICE_EXT, EXT, 0, len(EXT), layer), above)
+        ext = bytearray('\x74\x80\x21\x40')
+        self.assertEquals(nal.ext_layer(ext, 0), (2, 1, 2))
+        self.assertTrue(nal.above_layer(nal.NAL_SLICE_EXT, ext, 0, len(ext), (1, 15, 7)))
+        self.assertTrue(nal.above_layer(nal.NAL_SLICE_EXT, ext, 0, len(ext), (2, 0, 7)))
+        self.assertTrue(nal.above_layer(nal.NAL_SLICE_EXT, ext, 0, len(ext), (2, 1, 1)))
+        self.assertFalse(nal.above_layer(nal.NAL_SLICE_EXT, ext, 0, len(ext), (2, 1, 2)))
+        # only NALs with an SVC extension are judged
+        self.assertFalse(nal.above_layer(nal.NAL_SLICE, ext, 0, len(ext), (0, 0, 0)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from StringIO import StringIO
+import naltrace
+
+class Test(unittest.TestCase):
+
+    def test_full(self):
+        out   = StringIO()
+        trace = naltrace.NalTrace(out, naltrace.TRACE_FULL)
+        trace.add(3, 5, 100, naltrace.RES_IMAGE, 320, 180)
+        trace.add(4, 20, 50, naltrace.RES_DROPPED)
+        trace.close()
+        self.assertEquals(out.getvalue(), naltrace.RECORD_HEADER +
+                          '3\t5\t100\timage\t320\t180\n4\t20\t50\tdropped\t0\t0\n')
+
+    def test_full_is_batched(self):
+        out   = StringIO()
+        trace = naltrace.NalTrace(out, naltrace.TRACE_FULL)
+        for i in range(naltrace.TRACE_BATCH - 2):
+            trace.add(i, 1, 10, naltrace.RES_OK)
+        self.assertEquals(out.getvalue(), '')
+        trace.add(0, 1, 10, naltrace.RES_OK)
+        self.assertEquals(len(out.getvalue().splitlines()), naltrace.TRACE_BATCH)
+
+    def test_summary(self):
+        out   = StringIO()
+        trace = naltrace.NalTrace(out, naltrace.TRACE_SUMMARY)
+        for size in (10, 20):
+            trace.add(0, 1, size, naltrace.RES_OK)
+        trace.add(0, 5, 100, naltrace.RES_IMAGE, 320, 180)
+        trace.close()
+        self.assertEquals(out.getvalue(), naltrace.SUMMARY_HEADER + '1\tok\t2\t30\n5\timage\t1\t100\n')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+import json
+from StringIO import StringIO
 import pacsi
 
 F_NRI_TYPE      = 0b10011111
@@ -215,6 +217,37 @@ class Test(unittest.TestCase):
         print '***** test_parse_pacsi *****'
         print pa 
 
+    def test_sei_fields_are_read_from_the_nal(self):
+        nal = bytearray(PACSI)
+        pa  = pacsi.parse_pacsi(nal, len(nal))
+        # bitrate of the second layer description, read on first access
+        pos = len(PACSI_HEAD + SEI1_SIZE + SEI1_HEAD) + 50
+        nal[pos : pos + 4] = '\x00\x00\x00\x2a'
+        self.assertEquals(pa.seiList[0].layerList[1].bitrate, 42)
+        self.assertEquals(pa.seiList[1].payload, SEI_BS_INFO)
+
+    def test_writer_records(self):
+        pa  = pacsi.parse_pacsi(PACSI, len(PACSI))
+        out = StringIO()
+        w   = pacsi.PacsiWriter(out, pacsi.PACSI_FMT_JSONL)
+        w.write(pa, 7, 90000)
+        self.assertEquals(out.getvalue(), '')
+        w.flush()
+        rec = json.loads(out.getvalue())
+        self.assertEquals((rec['index'], rec['rtpTs'], rec['type'], rec['donc']), (7, 90000, 30, 0))
+        self.assertEquals(rec['seiList'][0]['layerList'][1]['bitrate'], 18999)
+        self.assertEquals(rec['seiList'][1]['numOfNaluUnit'], 4)
+
+        out = StringIO()
+        w   = pacsi.PacsiWriter(out, pacsi.PACSI_FMT_BINARY)
+        w.write(pa, 7, 90000)
+        w.flush()
+        self.assertEquals(len(out.getvalue()), pacsi.PACSI_RECORD_STRUCT.size)
+        rec = dict(zip([n for n, _ in pacsi.PACSI_RECORD], pacsi.PACSI_RECORD_STRUCT.unpack(out.getvalue())))
+        self.assertEquals((rec['index'], rec['rtpTs'], rec['t'], rec['tl0picidx'], rec['donc']),
+                          (7, 90000, 1, -1, 0))
+        self.assertEquals((rec['seiCount'], rec['layerCount'], rec['refFrmCount']), (2, 2, 1))
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import unittest
+import tempfile
+import os
+import pcapindex
+
+SRC_IP1 = 1
+SRC_IP2 = 2
+SSRC1   = 889614168
+SSRC2   = 889614169
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.pcapFile = tempfile.mkstemp(suffix='.pcap')
+        os.write(fd, 'pcap')
+        os.close(fd)
+        self.idxFile = pcapindex.index_file_name(self.pcapFile)
+        self.index   = pcapindex.PcapIndex()
+        self.index.add(SRC_IP1, SSRC1, 24,  1, 10, 9000,  1.5, False, True)
+        self.index.add(SRC_IP2, SSRC2, 100, 2, 70, 500,   1.6, False)
+        self.index.add(SRC_IP1, SSRC1, 200, 4, 11, 9000,  1.7, True)
+        self.index.add(SRC_IP1, SSRC2, 300, 5, 5,  100,   1.8, False)
+        self.index.add(SRC_IP1, SSRC1, 400, 6, 12, 9000,  1.9, True)
+        self.index.add(SRC_IP1, SSRC1, 500, 7, 13, 12000, 2.0, False, True)
+
+    def tearDown(self):
+        for f in (self.pcapFile, self.idxFile):
+            if os.path.exists(f):
+                os.remove(f)
+
+    def offsets(self, index, filterSrcIp, filterSSRC):
+        return [offset for offset, _ in index.records(filterSrcIp, filterSSRC)]
+
+    def test_select(self):
+        self.assertEquals(self.offsets(self.index, set(), set()), [24, 100, 200, 300, 400, 500])
+        self.assertEquals(self.offsets(self.index, set([SRC_IP1]), set()), [24, 200, 300, 400, 500])
+        self.assertEquals(self.offsets(self.index, set([SRC_IP1]), set([SSRC1])),
+                          [24, 200, 400, 500])
+        self.assertEquals(self.offsets(self.index, set([SRC_IP2]), set([SSRC1])), [])
+
+    def test_save_and_load(self):
+        self.index.save(self.idxFile, self.pcapFile)
+        index = pcapindex.load_index(self.idxFile, self.pcapFile)
+        ses   = index.sessions[(SRC_IP1, SSRC1)]
+        self.assertEquals(list(ses.offsets), [24, 200, 400, 500])
+        self.assertEquals(list(ses.ordinals), [1, 4, 6, 7])
+        # key packets of one access unit are one key access unit, from its first packet
+        self.assertEquals(list(ses.keyOffsets), [24])
+        self.assertEquals(list(ses.keyTimes), [1.7])
+        self.assertEquals(list(ses.paramOffsets), [24, 500])
+        self.assertEquals(ses.firstSeq, 10)
+        self.assertEquals(ses.lastSeq, 13)
+        self.assertEquals(self.offsets(index, set(), set()), [24, 100, 200, 300, 400, 500])
+
+    def test_seek(self):
+        sessions = self.index.select(set([SRC_IP1]), set([SSRC1]))
+        self.assertEquals(self.index.key_offset_before(sessions, 1.8), 24)
+        self.assertEquals(list(self.index.param_records_before(sessions, 24)), [])
+        self.assertEquals(list(self.index.param_records_before(sessions, 600)), [(24, 1), (500, 7)])
+
+    def test_invalidated_when_pcap_changes(self):
+        self.index.save(self.idxFile, self.pcapFile)
+        fd = open(self.pcapFile, 'ab')
+        fd.write('more')
+        fd.close()
+        self.assertEquals(pcapindex.load_index(self.idxFile, self.pcapFile), None)
+
+    def test_missing_or_corrupt(self):
+        self.assertEquals(pcapindex.load_index(self.idxFile, self.pcapFile), None)
+        open(self.idxFile, 'wb').write('garbage\n')
+        self.assertEquals(pcapindex.load_index(self.idxFile, self.pcapFile), None)
+
+if __name__ == "__main__":
+    unittest.main()
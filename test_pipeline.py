@@ -0,0 +1,53 @@
+import unittest
+import tempfile
+import os
+import time
+import pipeline
+
+class Test(unittest.TestCase):
+
+    def test_threaded_keeps_order(self):
+        queues = []
+        out = list(pipeline.threaded(iter(range(1000)), 'test', queues, maxsize=2, batch=7))
+        self.assertEquals(out, range(1000))
+        self.assertEquals(len(queues), 1)
+        self.assertTrue(queues[0].maxFill <= 2)
+
+    def test_threaded_propagates_errors(self):
+        def failing():
+            yield 1
+            raise ValueError('stage failed')
+        self.assertRaises(ValueError, list, pipeline.threaded(failing(), 'test', []))
+
+    def test_threaded_stops_when_closed(self):
+        produced = []
+        def endless():
+            i = 0
+            while True:
+                produced.append(i)
+                yield i
+                i += 1
+        out = pipeline.threaded(endless(), 'test', [], maxsize=2, batch=1)
+        self.assertEquals([out.next() for _ in range(5)], range(5))
+        out.close()
+        count = len(produced)
+        time.sleep(0.2)
+        self.assertEquals(len(produced), count)
+        self.assertTrue(count < 100)
+
+    def test_frame_writer(self):
+        fd, name = tempfile.mkstemp()
+        os.close(fd)
+        fd     = open(name, 'wb')
+        writer = pipeline.FrameWriter(fd, [], maxsize=1)
+        buf    = bytearray('a' * 4)
+        for c in 'abc':
+            buf[:] = c * 4
+            writer.write(buf)
+        writer.close()
+        fd.close()
+        self.assertEquals(open(name, 'rb').read(), 'aaaabbbbcccc')
+        os.remove(name)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import json
+import math
+import os
+import random
+import synthpcap
+import quality
+import yuvfile
+from quality import numpy
+from decodecase import DecodeCase, WIDTH, HEIGHT
+
+def naive_ssim(a, b, n):
+    # straight from the definition, window by window
+    values = []
+    for i in range(a.shape[0] - n + 1):
+        for j in range(a.shape[1] - n + 1):
+            x  = a[i:i + n, j:j + n].astype(float).ravel()
+            y  = b[i:i + n, j:j + n].astype(float).ravel()
+            mx, my = x.mean(), y.mean()
+            vx, vy = ((x - mx) ** 2).mean(), ((y - my) ** 2).mean()
+            cv = ((x - mx) * (y - my)).mean()
+            values.append(((2 * mx * my + quality.SSIM_C1) * (2 * cv + quality.SSIM_C2)) /
+                          ((mx * mx + my * my + quality.SSIM_C1) * (vx + vy + quality.SSIM_C2)))
+    return sum(values) / len(values)
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class Test(DecodeCase):
+
+    def decode(self, outFile, lost=(), **opts):
+        # lost: access units (frame numbers) whose packets are left out
+        lostTs = set(frame * synthpcap.RTP_CLOCK_RATE // synthpcap.DEF_FPS for frame in lost)
+        pkts   = (p for p in self.packets() if p.timestamp not in lostTs)
+        return self.decode_stream(outFile, pkts, **opts)
+
+    def test_metrics(self):
+        rnd = random.Random(1)
+        a   = numpy.array([[rnd.randrange(256) for _ in range(24)] for _ in range(12)], numpy.uint8)
+        b   = numpy.clip(a.astype(int) + [[rnd.randrange(-9, 10) for _ in range(24)] for _ in range(12)],
+                         0, 255).astype(numpy.uint8)
+        mse = ((a.astype(float) - b) ** 2).mean()
+        self.assertAlmostEquals(quality.plane_mse(a, b), mse)
+        self.assertAlmostEquals(quality.psnr(mse), 10 * math.log10(255 ** 2 / mse))
+        self.assertEquals(quality.psnr(0), quality.MAX_PSNR)
+        self.assertAlmostEquals(quality.plane_ssim(a, b), naive_ssim(a, b, quality.SSIM_WINDOW))
+        self.assertAlmostEquals(quality.plane_ssim(a, a), 1.0)
+        # planes smaller than a window are one window
+        self.assertAlmostEquals(quality.plane_ssim(a[:4, :6], b[:4, :6]), naive_ssim(a[:4, :6], b[:4, :6], 4))
+        self.assertEquals(quality.parse_size('1280X720'), (1280, 720))
+        self.assertRaises(ValueError, quality.parse_size, '1279x720')
+
+    def test_psnr(self):
+        ses = self.decode('out.yuv')
+        # reference: the decoded frames but one, of which a luma sample differs by 4,
+        # and a frame short
+        size = yuvfile.frame_size(WIDTH, HEIGHT)
+        data = bytearray(open(self.path('out.yuv'), 'rb').read())[:-size]
+        data[2 * size + 5] = (data[2 * size + 5] + 4) % 256
+        ref  = self.path('ref.yuv')
+        open(ref, 'wb').write(data)
+        ses  = self.decode('out.quality', psnr=ref, refSize=(WIDTH, HEIGHT), ssim=True)
+        self.assertFalse(os.path.exists(self.path('out.quality.idx')))
+        lines = open(self.path('out.quality')).read().splitlines()
+        self.assertEquals(lines[0], quality.record_header(True).rstrip('\n'))
+        self.assertEquals(len(lines), ses.frames)
+        frame2 = lines[3].split('\t')
+        self.assertEquals(frame2[:4], ['2', '%.3f' % quality.psnr(16.0 / (WIDTH * HEIGHT)),
+                                       '100.000', '100.000'])
+        self.assertTrue(float(frame2[4]) < 1)
+        summary = json.load(open(quality.summary_file_name(self.path('out.quality'))))
+        self.assertEquals((summary['frames'], summary['compared'], summary['noReference']),
+                          (ses.frames, ses.frames - 1, 1))
+        self.assertEquals(summary['psnr']['y']['max'], quality.MAX_PSNR)
+        self.assertAlmostEquals(summary['psnr']['y']['global'],
+                                quality.psnr(16.0 / (WIDTH * HEIGHT) / (ses.frames - 1)))
+        self.assertEquals(summary['ssim']['u']['min'], 1.0)
+
+    def test_skipped_and_lost_frames(self):
+        # the reference is the decode of every frame: a frame compared with
+        # its own source frame is identical
+        self.decode('out.yuv')
+        ref = self.path('out.yuv')
+        for opts, sources in (({'everyNth': 3}, [0, 3, 6, 9]),
+                              ({'keyFrames': True}, [0, 5]),
+                              ({'lost': (4, 7)}, [0, 1, 2, 3, 5, 6, 8, 9, 10])):
+            self.decode('out.quality', psnr=ref, refSize=(WIDTH, HEIGHT), **opts)
+            records = [line.split('\t') for line in
+                       open(self.path('out.quality')).read().splitlines()[1:]]
+            self.assertEquals([int(r[0]) for r in records], sources, (opts, records))
+            self.assertEquals(set(v for r in records for v in r[1:]), set(['100.000']), opts)
+
+    def test_temporal_layer_dropped(self):
+        # every other access unit is in temporal layer 1: with --tid 0 the
+        # timestamps are two source frames apart
+        self.write_capture(self.pcapFile, gop=4, temporal=True)
+        self.decode('out.yuv')
+        ref = self.path('out.yuv')
+        self.decode('out.quality', psnr=ref, refSize=(WIDTH, HEIGHT), targetTid=0,
+                    refFps=synthpcap.DEF_FPS)
+        records = [line.split('\t') for line in
+                   open(self.path('out.quality')).read().splitlines()[1:]]
+        self.assertEquals([int(r[0]) for r in records], [0, 2, 4, 6, 8])
+        self.assertEquals(set(v for r in records for v in r[1:]), set(['100.000']))
+        # which --tid does not decode without
+        self.assertEquals(self.main('q', psnr=ref, refSize=(WIDTH, HEIGHT), targetTid=0), 1)
+
+    def test_source_frames(self):
+        # a 3000 tick source sent at half its frame rate
+        for period, expected in ((None, [0, 1, 2, 3]), (3000.0, [0, 2, 4, 6])):
+            sources = quality.SourceFrames(period)
+            for ts in (0, 6000, 12000, 18000):
+                sources.access_unit(ts, True)
+            self.assertEquals([sources.picture() for _ in range(4)], expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import os
+import synthpcap
+import pcapindex
+from decodecase import DecodeCase, WIDTH, HEIGHT
+from nal import NAL_SPS, NAL_PPS, NAL_SUBSET_SPS, NAL_IDR, NAL_PREFIX, PACSI
+
+FRAMES  = 23
+# in the third GOP, after its first two access units
+START   = 12.0 / synthpcap.DEF_FPS
+
+class Test(DecodeCase):
+    FRAMES  = FRAMES
+    # SPS, subset SPS and PPS are only sent before the first IDR, each in
+    # a packet of its own
+    CAPTURE = {'paramsOnce': True}
+
+    def decode(self, name, **opts):
+        # (YUV, rows of the NAL trace)
+        self.assertEquals(self.main(name + '.yuv', pacsiFile=name + '.pacsi', nalFile=name + '.nal',
+                                    **opts), 0)
+        return open(self.path(name + '.yuv'), 'rb').read(), \
+               [line.split('\t') for line in open(self.path(name + '.nal'))][1:]
+
+    def test_parameter_sets_sent_once(self):
+        frameSize = WIDTH * HEIGHT * 3 // 2
+        full, _   = self.decode('full', noIndex=True)
+        # without and with the index written by the first decode
+        for name in ('scan', 'indexed'):
+            yuv, nals = self.decode(name, start=START)
+            self.assertTrue(os.path.exists(pcapindex.index_file_name(self.pcapFile)))
+            self.assertEquals([int(row[1]) for row in nals[:6]],
+                              [NAL_SPS, NAL_SUBSET_SPS, NAL_PPS, PACSI, NAL_PREFIX, NAL_IDR])
+            # frames returned from START on; the stub returns a picture when
+            # the next one starts
+            self.assertEquals(len(yuv), (FRAMES - 12) * frameSize)
+            self.assertTrue(yuv == full[-len(yuv):])
+            # packets are numbered by their place in the capture either way
+            if name == 'scan':
+                scanNals = nals
+            else:
+                self.assertEquals(nals, scanNals)
+
+if __name__ == "__main__":
+    unittest.main()
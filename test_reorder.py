@@ -0,0 +1,115 @@
+import unittest
+import reorder
+from rtp import RtpPacket
+
+SSRC1 = 889614168
+SSRC2 = 889614169
+
+def pkt(seq, ssrc=SSRC1):
+    return RtpPacket(ssrc, seq, 0, 0, 96, bytearray('\x01'))
+
+def run(seqs, depth=reorder.DEF_REORDER_DEPTH, ssrc=SSRC1):
+    buf = reorder.ReorderBuffer(depth)
+    out = list(reorder.reorder_packets([pkt(s, ssrc) for s in seqs], buf))
+    return [p.seq for p in out], [p.lossBefore for p in out], buf.stats
+
+class Test(unittest.TestCase):
+
+    def test_in_order(self):
+        seqs, loss, stats = run([1, 2, 3])
+        self.assertEquals(seqs, [1, 2, 3])
+        self.assertEquals(loss, [False] * 3)
+        self.assertEquals(stats.lost, 0)
+
+    def test_reordered(self):
+        seqs, loss, stats = run([1, 3, 2, 4])
+        self.assertEquals(seqs, [1, 2, 3, 4])
+        self.assertEquals(stats.reordered, 1)
+        self.assertEquals(stats.lost, 0)
+
+    def test_max_delay(self):
+        buf = reorder.ReorderBuffer(maxDelay=0.1)
+        out = []
+        for seq, t in ((1, 0.0), (3, 0.01), (4, 0.05), (5, 0.12)):
+            p = pkt(seq)
+            p.time = t
+            out.extend(buf.push(p))
+        # 3 waited longer than 0.1 s for 2
+        self.assertEquals([p.seq for p in out], [1, 3, 4, 5])
+        self.assertEquals([p.lossBefore for p in out], [False, True, False, False])
+        self.assertEquals(buf.stats.lost, 1)
+
+    def test_expire(self):
+        # packets held too long are released while no packet arrives
+        buf = reorder.ReorderBuffer(maxDelay=0.1)
+        out = []
+        for seq, t in ((1, 0.0), (3, 0.01), (4, 0.05)):
+            p = pkt(seq)
+            p.time = t
+            out.extend(buf.push(p))
+        self.assertEquals(buf.expire(0.1), [])
+        out.extend(buf.expire(0.12))
+        self.assertEquals([p.seq for p in out], [1, 3, 4])
+        self.assertEquals(buf.stats.lost, 1)
+        self.assertEquals(reorder.ReorderBuffer().expire(1e9), [])
+
+    def test_wraparound(self):
+        seqs, loss, stats = run([65534, 0, 65535, 1])
+        self.assertEquals(seqs, [65534, 65535, 0, 1])
+        self.assertEquals(stats.lost, 0)
+
+    def test_loss_when_depth_exceeded(self):
+        seqs, loss, stats = run([1, 3, 4, 5], depth=2)
+        self.assertEquals(seqs, [1, 3, 4, 5])
+        self.assertEquals(loss, [False, True, False, False])
+        self.assertEquals(stats.lost, 1)
+
+    def test_loss_at_flush(self):
+        seqs, loss, stats = run([1, 4])
+        self.assertEquals(seqs, [1, 4])
+        self.assertEquals(loss, [False, True])
+        self.assertEquals(stats.lost, 2)
+
+    def test_duplicated_and_late(self):
+        seqs, loss, stats = run([1, 3, 3, 2, 2], depth=4)
+        self.assertEquals(seqs, [1, 2, 3])
+        self.assertEquals(stats.duplicated, 1)
+        self.assertEquals(stats.late, 1)
+
+    def test_sender_restart(self):
+        # far behind the expected sequence number: held packets are released
+        # and the sequence starts over
+        seqs, loss, stats = run([1000, 1001, 1003, 10, 11, 12, 9])
+        self.assertEquals(seqs, [1000, 1001, 1003, 10, 11, 12])
+        self.assertEquals(loss, [False, False, True, False, False, False])
+        self.assertEquals((stats.resyncs, stats.lost, stats.late), (1, 1, 1))
+        # across the wraparound, and past a depth larger than the minimum jump
+        seqs, loss, stats = run([100, 101, 65000, 65001], depth=reorder.MIN_RESYNC_JUMP * 2)
+        self.assertEquals(seqs, [100, 101, 65000, 65001])
+        self.assertEquals(stats.resyncs, 1)
+        seqs, loss, stats = run([200, 201, 100], depth=reorder.MIN_RESYNC_JUMP * 2)
+        self.assertEquals(seqs, [200, 201])
+        self.assertEquals((stats.resyncs, stats.late), (0, 1))
+
+    def test_ssrcs_are_independent(self):
+        buf = reorder.ReorderBuffer()
+        pkts = [pkt(10, SSRC1), pkt(500, SSRC2), pkt(11, SSRC1), pkt(501, SSRC2)]
+        out = [(p.ssrc, p.seq) for p in reorder.reorder_packets(pkts, buf)]
+        self.assertEquals(out, [(SSRC1, 10), (SSRC2, 500), (SSRC1, 11), (SSRC2, 501)])
+
+    def test_don_order(self):
+        buf = reorder.DonBuffer(depth=3)
+        out = []
+        for don in (65534, 1, 65535, 0, 3, 2, 4):
+            out.extend(buf.push(don, don))
+        self.assertEquals(out + buf.flush(), [65534, 65535, 0, 1, 2, 3, 4])
+        # held past the depth: a lower DON is late and dropped
+        buf = reorder.DonBuffer(depth=1)
+        out = []
+        for don in (5, 7, 6, 4, 8):
+            out.extend(buf.push(don, don))
+        self.assertEquals(out + buf.flush(), [5, 6, 7, 8])
+        self.assertEquals(buf.late, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+import unittest
+import tempfile
+import os
+import shutil
+from struct import pack
+import rtp
+import pcapreader
+import pcap2yuv
+
+SRC_IP      = '10.17.53.168'
+DST_IP      = '10.17.53.1'
+SSRC        = 889614168
+SEQ         = 65535
+RTP_TS      = 90000
+RTP_PAYLOAD = '\x7c\x85\xaa\xbb\xcc'
+
+def build_rtp(ssrc=SSRC, seq=SEQ, payload=RTP_PAYLOAD, marker=1, csrc=0, padding=0, ts=RTP_TS):
+    b0  = 0x80 | (0x20 if padding else 0) | csrc
+    hdr = pack('>BBHII', b0, (marker << 7) | 96, seq, ts, ssrc)
+    hdr += '\x00\x00\x00\x01' * csrc
+    pad = ('\x00' * (padding - 1) + chr(padding)) if padding else ''
+    return hdr + payload + pad
+
+def build_frame(rtpData, srcIp=SRC_IP, vlan=False):
+    udp = pack('>HHHH', 5004, 5004, 8 + len(rtpData), 0) + rtpData
+    ip  = pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0x4000, 64, 17, 0,
+               rtp.socket.inet_aton(srcIp), rtp.socket.inet_aton(DST_IP)) + udp
+    eth = '\x00\x11\x22\x33\x44\x55' + '\x66\x77\x88\x99\xaa\xbb'
+    if vlan:
+        eth += '\x81\x00\x00\x0a'
+    # trailing bytes emulate Ethernet padding, which must not reach RTP
+    return bytearray(eth + '\x08\x00' + ip + '\x00\x00')
+
+def pcapng_block(order, blockType, body):
+    body += '\x00' * (-len(body) % 4)
+    size  = 12 + len(body)
+    return pack(order + 'II', blockType, size) + body + pack(order + 'I', size)
+
+def build_pcapng(order, frames):
+    # frames: (interface, ts units, data); interface 0 is Ethernet with the
+    # default microsecond resolution, 1 raw IP with nanoseconds, 2**-10 s
+    # and an offset of 100 s
+    hdr = pcapng_block(order, 0x0a0d0d0a, pack(order + 'IHHq', 0x1a2b3c4d, 1, 0, -1))
+    hdr += pcapng_block(order, 1, pack(order + 'HHI', rtp.LINKTYPE_ETHERNET, 0, 0))
+    hdr += pcapng_block(order, 1, pack(order + 'HHI', rtp.LINKTYPE_RAW, 0, 0) +
+                        pack(order + 'HH', 9, 1) + '\x09\x00\x00\x00' +
+                        pack(order + 'HH', 0, 0))
+    hdr += pcapng_block(order, 1, pack(order + 'HHI', rtp.LINKTYPE_RAW, 0, 0) +
+                        pack(order + 'HH', 9, 1) + '\x8a\x00\x00\x00' +
+                        pack(order + 'HH', 14, 8) + pack(order + 'q', 100))
+    # name resolution block, to be skipped
+    hdr += pcapng_block(order, 4, pack(order + 'HH', 0, 0))
+    offsets = []
+    for iface, ts, data in frames:
+        offsets.append(len(hdr))
+        hdr += pcapng_block(order, 6, pack(order + 'IIIII', iface, ts >> 32, ts & 0xffffffff,
+                                           len(data), len(data)) + str(data))
+    return hdr, offsets
+
+class Test(unittest.TestCase):
+
+    def test_dissect_and_parse(self):
+        for vlan in (False, True):
+            srcIp, buf, start, end = rtp.dissect(rtp.LINKTYPE_ETHERNET, build_frame(build_rtp(), vlan=vlan))
+            self.assertEquals(srcIp, rtp.ip_to_int(SRC_IP))
+            self.assertEquals(rtp.peek_ssrc(buf, start, end), SSRC)
+            p = rtp.parse_rtp(buf, start, end)
+            self.assertEquals(p.ssrc, SSRC)
+            self.assertEquals(p.seq, SEQ)
+            self.assertEquals(p.timestamp, RTP_TS)
+            self.assertEquals(p.marker, 1)
+            self.assertEquals(p.payloadType, 96)
+            self.assertEquals(p.payload, bytearray(RTP_PAYLOAD))
+
+    def test_csrc_and_padding_are_stripped(self):
+        srcIp, buf, start, end = rtp.dissect(rtp.LINKTYPE_ETHERNET,
+                                             build_frame(build_rtp(csrc=2, padding=3)))
+        self.assertEquals(rtp.parse_rtp(buf, start, end).payload, bytearray(RTP_PAYLOAD))
+
+    def test_not_rtp(self):
+        srcIp, buf, start, end = rtp.dissect(rtp.LINKTYPE_ETHERNET, build_frame('\x00' * 20))
+        self.assertEquals(rtp.peek_ssrc(buf, start, end), None)
+        arp = bytearray('\xff' * 12 + '\x08\x06' + '\x00' * 28)
+        self.assertEquals(rtp.dissect(rtp.LINKTYPE_ETHERNET, arp), None)
+
+    def test_filters(self):
+        self.assertEquals(rtp.parse_ip_filter(''), set())
+        self.assertEquals(rtp.parse_ip_filter(SRC_IP + ',1.1.1.1'),
+                          set([rtp.ip_to_int(SRC_IP), rtp.ip_to_int('1.1.1.1')]))
+        self.assertEquals(rtp.parse_ssrc_filter('889614168,889614169'), set([889614168, 889614169]))
+        self.assertRaises(ValueError, rtp.parse_ip_filter, 'not.an.ip')
+        self.assertRaises(ValueError, rtp.parse_ssrc_filter, '0x12')
+
+    def test_pcap_reader(self):
+        frame = build_frame(build_rtp())
+        for magic, div in ((0xa1b2c3d4, 1e6), (0xa1b23c4d, 1e9)):
+            for order in ('<', '>'):
+                fd, name = tempfile.mkstemp(suffix='.pcap')
+                os.write(fd, pack(order + 'IHHiIII', magic, 2, 4, 0, 0, 65535, 1))
+                os.write(fd, pack(order + 'IIII', 10, 500, len(frame), len(frame)) + str(frame))
+                os.close(fd)
+                reader = pcapreader.open_pcap(name)
+                recs   = list(reader)
+                reader.close()
+                os.remove(name)
+                self.assertEquals(len(recs), 1)
+                self.assertEquals(recs[0][0], 10 + 500 / div)
+                self.assertEquals(recs[0][1], rtp.LINKTYPE_ETHERNET)
+                self.assertEquals(recs[0][2], frame)
+                self.assertEquals(recs[0][3:], (24, 1))
+
+    def read_pcap(self, content, offsets=None):
+        fd, name = tempfile.mkstemp(suffix='.pcapng')
+        os.write(fd, content)
+        os.close(fd)
+        reader = pcapreader.open_pcap(name)
+        recs   = list(reader if offsets is None else reader.iter_at(offsets))
+        reader.close()
+        os.remove(name)
+        return recs
+
+    def test_pcapng_reader(self):
+        frame = build_frame(build_rtp())
+        ip    = frame[14 : -2]
+        for order in ('<', '>'):
+            content, offsets = build_pcapng(order, [(0, 10500000, frame), (1, 2000000001, ip),
+                                                    (2, 3 * 1024, ip), (3, 0, ip)])
+            recs = self.read_pcap(content)
+            # the packet of the undefined interface 3 is skipped
+            self.assertEquals([(ts, lt) for ts, lt, _, _, _ in recs],
+                              [(10.5, rtp.LINKTYPE_ETHERNET), (2.000000001, rtp.LINKTYPE_RAW),
+                               (103.0, rtp.LINKTYPE_RAW)])
+            self.assertEquals([r[2] for r in recs], [frame, ip, ip])
+            self.assertEquals([r[3] for r in recs], offsets[:3])
+            self.assertEquals([r[4] for r in recs], [1, 2, 3])
+            # packets are views on the mapped file, dissected and parsed as is
+            self.assertTrue(isinstance(recs[0][2], memoryview))
+            for ts, lt, data, _, _ in recs:
+                srcIp, buf, start, end = rtp.dissect(lt, data)
+                self.assertEquals(rtp.parse_rtp(buf, start, end).payload, bytearray(RTP_PAYLOAD))
+            recs = self.read_pcap(content, zip(offsets, range(1, 4))[2:0:-1])
+            self.assertEquals([(r[0], r[4]) for r in recs], [(103.0, 3), (2.000000001, 2)])
+
+    def test_pcapng_sections(self):
+        # a section in the other byte order, whose interface 0 is raw IP
+        frame = build_frame(build_rtp())
+        first, offsets = build_pcapng('<', [(0, 1000000, frame)])
+        second, _      = build_pcapng('>', [])
+        offsets.append(len(first) + len(second))
+        second        += pcapng_block('>', 6, pack('>IIIII', 1, 0, 2000000, len(frame) - 16,
+                                                   len(frame) - 16) + str(frame[14 : -2]))
+        recs = self.read_pcap(first + second)
+        self.assertEquals([(ts, lt) for ts, lt, _, _, _ in recs],
+                          [(1.0, rtp.LINKTYPE_ETHERNET), (0.002, rtp.LINKTYPE_RAW)])
+        recs = self.read_pcap(first + second, zip(offsets, (1, 2))[::-1])
+        self.assertEquals([ts for ts, _, _, _, _ in recs], [0.002, 1.0])
+
+    def test_truncated_and_invalid(self):
+        frame    = build_frame(build_rtp())
+        classic  = pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+        classic += pack('<IIII', 10, 0, len(frame), len(frame)) + str(frame)
+        self.assertEquals(len(self.read_pcap(classic)), 1)
+        self.assertEquals(len(self.read_pcap(classic + classic[24:-1])), 1)
+        content, _ = build_pcapng('<', [(0, 0, frame), (0, 0, frame)])
+        self.assertEquals(len(self.read_pcap(content[:-1])), 1)
+        for content in ('', 'not a capture file at all'):
+            fd, name = tempfile.mkstemp()
+            os.write(fd, content)
+            os.close(fd)
+            self.assertRaises(pcapreader.PcapFormatError, pcapreader.MappedPcapReader, name)
+            os.remove(name)
+
+    def test_unsupported_without_scapy(self):
+        # other formats than pcap and pcapng are left to scapy, which is optional
+        def no_scapy():
+            raise ImportError('No module named scapy.all')
+        tmpDir     = tempfile.mkdtemp()
+        name       = os.path.join(tmpDir, 'in.pcap')
+        load_scapy = rtp.load_scapy
+        rtp.load_scapy = no_scapy
+        try:
+            for content in ('', 'not a capture file at all'):
+                open(name, 'wb').write(content)
+                self.assertRaises(pcapreader.PcapFormatError, pcapreader.open_pcap, name)
+                self.assertEquals(pcap2yuv.main(name, '', '', os.path.join(tmpDir, 'out.yuv'),
+                                                os.path.join(tmpDir, 'pacsi.txt'),
+                                                os.path.join(tmpDir, 'nal.txt'), pcap2yuv.Options()), 1)
+        finally:
+            rtp.load_scapy = load_scapy
+            shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    unittest.main()
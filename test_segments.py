@@ -0,0 +1,109 @@
+import unittest
+import os
+from functools import partial
+import synthpcap
+import stubdecoder
+import naltrace
+import pcap2yuv
+from metrics import RunMetrics
+from decodecase import DecodeCase, options, LAYERS, WIDTH, HEIGHT
+
+FRAMES  = 23
+GOP     = 4
+JOBS    = 3
+
+class InterruptedDecoder(stubdecoder.StubDecoder):
+    # interrupted by the user after decoding some NALs
+
+    def __init__(self, nals, *args):
+        stubdecoder.StubDecoder.__init__(self, *args)
+        self.nals = nals
+
+    def decode_nal(self, nal, nalSize):
+        if self.nals == 0:
+            raise KeyboardInterrupt
+        self.nals -= 1
+        return stubdecoder.StubDecoder.decode_nal(self, nal, nalSize)
+
+class Test(DecodeCase):
+    FRAMES  = FRAMES
+    GOP     = GOP
+
+    def decode(self, name, jobs, **opts):
+        # contents of the outputs
+        outFiles = [self.path(name + ext) for ext in ('.yuv', '.pacsi', '.nal')]
+        if jobs > 1:
+            ses = pcap2yuv.decode_segments(self.packets(), *outFiles,
+                                           opts=options(jobs=jobs, segmentPackets=20, **opts),
+                                           runMetrics=RunMetrics(), verbose=False)
+            self.assertEquals(ses.failed, 0)
+        else:
+            self.decode_stream(name + '.yuv', pacsiFile=name + '.pacsi', nalFile=name + '.nal', **opts)
+        outFiles.append(outFiles[0] + '.idx')
+        self.assertEquals(os.listdir(self.tmpDir).count(name + '.yuv'), 1)
+        return [open(f, 'rb').read() for f in outFiles]
+
+    def test_segments(self):
+        serial = self.decode('serial', 1)
+        # one frame per access unit but the last, each stamped by the stub
+        # decoder with the previous one
+        self.assertEquals(len(serial[0]), (FRAMES - 1) * WIDTH * HEIGHT * 3 // 2)
+        # compared as a whole, a diff of the outputs is not readable
+        self.assertTrue(self.decode('segments', JOBS) == serial)
+
+    def test_segments_options(self):
+        for opts in ({'keyFrames': True}, {'nalTrace': naltrace.TRACE_SUMMARY},
+                     {'targetDid': 0, 'pacsiFormat': pcap2yuv.PACSI_FMT_BINARY}):
+            self.assertTrue(self.decode('segments', JOBS, **opts) == self.decode('serial', 1, **opts),
+                            opts)
+
+    def test_interleaved(self):
+        # the same access units in interleaved packetization mode give the same frames
+        plain = self.decode('plain', 1)[0]
+        self.write_capture(self.pcapFile, interleaved=True)
+        self.assertTrue(self.decode('serial', 1)[0] == plain)
+        self.assertTrue(self.decode('pipeline', 1, pipeline=True)[0] == plain)
+        self.assertTrue(self.decode('segments', JOBS)[0] == plain)
+        self.assertTrue(self.decode('layer', 1, targetDid=0)[0] ==
+                        self.decode('pipeline_layer', 1, targetDid=0, pipeline=True)[0])
+
+    def test_gop_segments(self):
+        pkts = list(self.packets())
+        segs = list(pcap2yuv.gop_segments(iter(pkts), 20))
+        self.assertTrue(len(segs) > 2)
+        # every packet is in one segment, the access unit it starts with is
+        # also the lookahead of the previous one
+        self.assertEquals(sum(len(packets) for params, packets, lead, ahead in segs), len(pkts))
+        for (params, packets, lead, ahead), nxt in zip(segs, segs[1:] + [None]):
+            if nxt is not None:
+                self.assertEquals(ahead, nxt[1][:nxt[2]])
+                # parameter sets of the first IDR access unit, one packet per NAL
+                self.assertTrue(nxt[0])
+                self.assertTrue(all(p.payload[0] & 0x1f in (7, 8, 15) for p in nxt[0]))
+                self.assertTrue(nxt[2] > 0)
+
+    def test_enhancement_layer_idr(self):
+        # IDRs of the enhancement layer only, in the middle of every GOP, do
+        # not start segments: the base layer still refers to earlier pictures
+        self.write_capture(self.pcapFile, enhIdr=True)
+        pkts  = self.packets()
+        step  = synthpcap.RTP_CLOCK_RATE // synthpcap.DEF_FPS
+        frames = [packets[0].timestamp // step for params, packets, lead, ahead in
+                  pcap2yuv.gop_segments(pkts, 1)]
+        self.assertEquals(frames, range(0, FRAMES, GOP))
+        self.assertTrue(self.decode('segments', JOBS) == self.decode('serial', 1))
+
+    def test_interrupted(self):
+        # Ctrl-C halfway: the YUV file holds the frames written, without the
+        # preallocated space after them
+        full = self.decode('full', 1)[0]
+        for pipeline in (False, True):
+            self.assertRaises(KeyboardInterrupt, self.decode_stream, 'cut.yuv', nalFile='cut.nal',
+                              decoder=partial(InterruptedDecoder, 40, WIDTH, HEIGHT, LAYERS),
+                              pipeline=pipeline)
+            yuv = open(self.path('cut.yuv'), 'rb').read()
+            self.assertTrue(0 < len(yuv) < len(full), pipeline)
+            self.assertTrue(yuv == full[:len(yuv)], pipeline)
+
+if __name__ == "__main__":
+    unittest.main()
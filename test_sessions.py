@@ -0,0 +1,73 @@
+import unittest
+import os
+from struct import unpack_from
+import synthpcap
+import pcap2yuv
+from decodecase import DecodeCase
+
+SSRCS = (1001, 1002, 1003)
+
+def pcap_records(fileName):
+    # (timestamp, record) of a classic pcap file written by synthpcap
+    data = open(fileName, 'rb').read()
+    pos  = 24
+    recs = []
+    while pos < len(data):
+        tsSec, tsUsec, capLen, _ = unpack_from('<IIII', data, pos)
+        recs.append((tsSec * 1000000 + tsUsec, data[pos : pos + 16 + capLen]))
+        pos += 16 + capLen
+    return data[:24], recs
+
+class Test(DecodeCase):
+
+    def setUp(self):
+        DecodeCase.setUp(self)
+        # one capture per SSRC, then their packets merged in time order
+        recs = []
+        for i, ssrc in enumerate(SSRCS):
+            name = self.path(str(ssrc) + '.pcap')
+            self.write_capture(name, seed=i, ssrc=ssrc)
+            hdr, ssrcRecs = pcap_records(name)
+            recs.extend(ssrcRecs)
+        recs.sort(key=lambda rec: rec[0])
+        open(self.pcapFile, 'wb').write(hdr + ''.join(rec for _, rec in recs))
+
+    def decode(self, pcapFile, outFile, **opts):
+        return self.main(outFile, pcapFile, 'p.txt', 'n.txt', noIndex=True, **opts)
+
+    def test_session_jobs(self):
+        alone = []
+        for ssrc in SSRCS:
+            self.assertEquals(self.decode(self.path(str(ssrc) + '.pcap'), 'alone.yuv'), 0)
+            alone.append(open(self.path('alone.yuv'), 'rb').read())
+        # with fewer workers than sessions the others are spooled, then
+        # decoded as workers are done. Workers still running whenever one
+        # is started are counted
+        started = []
+        running = []
+        start   = pcap2yuv.SessionWorker.__dict__['start']
+        def counted_start(worker, *args):
+            running.append(sum(w.proc.is_alive() for w in started))
+            started.append(worker)
+            start(worker, *args)
+        pcap2yuv.SessionWorker.start = counted_start
+        try:
+            for jobs in (1, 2, 3):
+                del started[:], running[:]
+                self.assertEquals(self.decode(self.pcapFile, 'out.yuv',
+                                              sessions=pcap2yuv.sessionsBySSRC, sessionJobs=jobs), 0)
+                self.assertEquals(len(started), len(SSRCS))
+                self.assertTrue(max(running) < jobs, (jobs, running))
+                self.check_outputs(alone)
+        finally:
+            pcap2yuv.SessionWorker.start = start
+
+    def check_outputs(self, alone):
+        for ssrc, yuv in zip(SSRCS, alone):
+            name = self.path('out_' + synthpcap.DEF_SRC_IP + '_' + str(ssrc) + '.yuv')
+            self.assertTrue(open(name, 'rb').read() == yuv, ssrc)
+        # nothing is left of the spooled packets
+        self.assertEquals([f for f in os.listdir(self.tmpDir) if f.startswith('.')], [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import tempfile
+import os
+import synthpcap
+import stubdecoder
+import pcap2yuv
+import svcdecoder as svc
+from pacsi import parse_pacsi
+from pcapreader import open_pcap
+
+FRAMES = 12
+GOP    = 5
+LAYERS = 2
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.pcapFile = tempfile.mkstemp(suffix='.pcap')
+        os.close(fd)
+        self.count = synthpcap.write_pcap(self.pcapFile, FRAMES, GOP, LAYERS, mtu=600,
+                                          minSlice=10, maxSlice=1500)
+
+    def tearDown(self):
+        os.remove(self.pcapFile)
+
+    def test_depacketized_nals_match_access_units(self):
+        pkts = list(pcap2yuv.filter_packets(open_pcap(self.pcapFile), set(), set()))
+        self.assertEquals(len(pkts), self.count)
+        self.assertTrue(set(bytearray(p.payload[:1])[0] & 0x1f for p in pkts) >= set([24, 28]))
+        nals = []
+        ses  = pcap2yuv.DecodeSession(None, None, None, None)
+        ses.nalSink = lambda ses, nal, nalSize: nals.append(str(bytearray(nal[:nalSize])))
+        for p in pkts:
+            pcap2yuv.decode_packet(ses, p)
+        expected = [nal for au in synthpcap.access_units(FRAMES, GOP, LAYERS, 10, 1500)
+                    for nal in au]
+        self.assertEquals(nals, expected)
+        pacsi = parse_pacsi(bytearray(nals[0]), len(nals[0]))
+        self.assertEquals(len(pacsi.seiList[0].layerList), LAYERS)
+        self.assertEquals(pacsi.seiList[1].numOfNaluUnit, 2 * LAYERS)
+
+    def test_interleaved(self):
+        # DONs wrap around within the capture
+        synthpcap.write_pcap(self.pcapFile, FRAMES, GOP, LAYERS, mtu=600, minSlice=10, maxSlice=1500,
+                             interleaved=True, firstDon=65530)
+        pkts = list(pcap2yuv.filter_packets(open_pcap(self.pcapFile), set(), set()))
+        self.assertEquals(set(bytearray(p.payload[:1])[0] & 0x1f for p in pkts), set([25, 26, 27, 28, 29]))
+        self.assertNotEqual([p.timestamp for p in pkts], sorted(p.timestamp for p in pkts))
+        nals = []
+        ses  = pcap2yuv.DecodeSession(None, None, None, None)
+        ses.nalSink = lambda ses, nal, nalSize: nals.append((str(bytearray(nal[:nalSize])), ses.packet.index))
+        for p in pkts:
+            pcap2yuv.decode_packet(ses, p)
+        pcap2yuv.flush_nals(ses)
+        expected = [nal for au in synthpcap.access_units(FRAMES, GOP, LAYERS, 10, 1500)
+                    for nal in au]
+        self.assertTrue([nal for nal, index in nals] == expected)
+        self.assertEquals(ses.donBuf.late, 0)
+        # each NAL goes with the packet it came in
+        self.assertEquals(nals[0][1], pkts[0].index)
+
+    def test_stub_decoder(self):
+        dec = stubdecoder.StubDecoder(64, 32, slicesPerFrame=2)
+        self.assertEquals(dec.decode_nal(bytearray('\x67\x00'), 2), svc.SVC_STATUS_OK.value)
+        self.assertEquals(dec.decode_nal(bytearray('\x65\x00'), 2), svc.SVC_STATUS_OK.value)
+        self.assertEquals(dec.decode_nal('\x74\x00', 2), svc.SVC_STATUS_OK.value)
+        self.assertEquals(dec.decode_nal(bytearray('\x41\x00'), 2), svc.SVC_IMAGE_READY.value)
+        frame = bytearray(dec.frame_buffer())
+        self.assertEquals(len(frame), 64 * 32 * 3 // 2)
+        # first visible luma pixel, past the border
+        pad = svc.FRAME_PAD
+        self.assertEquals(frame[0], (0x80 + (pad >> 1) * (64 + pad) + (pad >> 1)) & 0xff)
+        # views are read where they point to, past their start
+        data = memoryview(bytearray('\x00\x41\x00\x65\x2a'))
+        self.assertEquals(dec.decode_nal(data[1:3], 2), svc.SVC_STATUS_OK.value)
+        self.assertEquals(dec.decode_nal(data[3:], 2), svc.SVC_IMAGE_READY.value)
+        self.assertEquals(dec.lib.stamp, 0x2a)
+
+if __name__ == "__main__":
+    unittest.main()
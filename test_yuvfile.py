@@ -0,0 +1,53 @@
+import unittest
+import tempfile
+import shutil
+import os
+import yuvfile
+
+# frames written: (width, height, fill byte); the third one spans two extents
+FRAMES      = [(8, 4, 'a'), (8, 4, 'b'), (16, 8, 'c'), (8, 4, 'd')]
+EXTENT_SIZE = 100
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir  = tempfile.mkdtemp()
+        self.yuvName = os.path.join(self.tmpDir, 'out.yuv')
+        self.extent  = yuvfile.EXTENT_MIN_SIZE, yuvfile.EXTENT_FRAMES
+        yuvfile.EXTENT_MIN_SIZE, yuvfile.EXTENT_FRAMES = EXTENT_SIZE, 0
+
+    def tearDown(self):
+        yuvfile.EXTENT_MIN_SIZE, yuvfile.EXTENT_FRAMES = self.extent
+        shutil.rmtree(self.tmpDir)
+
+    def write(self):
+        yuv = yuvfile.YuvFile(self.yuvName)
+        for width, height, c in FRAMES:
+            yuv.write_frame(bytearray(c * yuvfile.frame_size(width, height)), width, height)
+        yuv.close()
+        return yuv
+
+    def test_frames_and_size(self):
+        yuv      = self.write()
+        expected = ''.join(c * yuvfile.frame_size(w, h) for w, h, c in FRAMES)
+        self.assertEquals(open(self.yuvName, 'rb').read(), expected)
+        self.assertEquals(yuv.size, len(expected))
+
+    def test_index(self):
+        yuv = self.write()
+        self.assertEquals(yuv.index.runs, [[0, 0, 8, 4], [2, 96, 16, 8], [3, 288, 8, 4]])
+        self.assertEquals(yuv.index.locate(1), (48, 8, 4))
+        self.assertEquals(yuv.index.locate(3), (288, 8, 4))
+        self.assertRaises(IndexError, yuv.index.locate, 4)
+        yuv.index.save(yuvfile.index_file_name(self.yuvName))
+        for n, (width, height, c) in enumerate(FRAMES):
+            self.assertEquals(yuvfile.read_frame(self.yuvName, n),
+                              (width, height, c * yuvfile.frame_size(width, height)))
+
+    def test_wrong_frame_size(self):
+        yuv = yuvfile.YuvFile(self.yuvName)
+        self.assertRaises(ValueError, yuv.write_frame, bytearray(10), 8, 4)
+        yuv.close()
+
+if __name__ == "__main__":
+    unittest.main()
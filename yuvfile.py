@@ -0,0 +1,191 @@
+import os
+import stat
+import json
+import mmap
+from bisect import bisect_right
+from ctypes import CDLL, c_int, c_longlong, c_char, addressof, memmove
+from ctypes.util import find_library
+
+# the output file is grown by extents of at least EXTENT_FRAMES frames and
+# EXTENT_MIN_SIZE bytes; frames are copied into the extent mapped in memory
+EXTENT_FRAMES       = 32
+EXTENT_MIN_SIZE     = 64 * 1024 * 1024
+# frame index written next to the YUV file
+FRAME_INDEX_VERSION = 1
+FRAME_INDEX_EXT     = '.idx'
+
+def _libc_fallocate():
+    try:
+        fallocate = CDLL(find_library('c')).posix_fallocate64
+    except (OSError, AttributeError):
+        return None
+    fallocate.argtypes = [c_int, c_longlong, c_longlong]
+    fallocate.restype  = c_int
+    return fallocate
+
+# allocates disk blocks up front, which makes writing to the mapped pages
+# cheaper than on a sparse file grown with ftruncate
+_fallocate = _libc_fallocate()
+
+def preallocate(fd, start, end):
+    # grows fd to end bytes, allocating blocks from start where supported
+    if _fallocate is None or _fallocate(fd.fileno(), start, end - start) != 0:
+        os.ftruncate(fd.fileno(), end)
+
+def frame_size(width, height):
+    # bytes of a planar YUV 4:2:0 frame
+    return width * height * 3 // 2
+
+def index_file_name(yuvFile):
+    return yuvFile + FRAME_INDEX_EXT
+
+class FrameIndex:
+    # frames of a YUV file as runs of consecutive frames of the same size:
+    # [first frame, file offset, width, height]
+
+    def __init__(self, runs=None, frames=0):
+        self.runs   = runs or []
+        self.frames = frames
+        self.firsts = [r[0] for r in self.runs]
+
+    def add(self, offset, width, height):
+        if not self.runs or self.runs[-1][2:] != [width, height]:
+            self.runs.append([self.frames, offset, width, height])
+            self.firsts.append(self.frames)
+        self.frames += 1
+
+    def extend(self, other, offset):
+        # appends the frames of other, the index of frames appended to the
+        # file at offset
+        for i, (first, runOffset, width, height) in enumerate(other.runs):
+            end = other.runs[i + 1][0] if i + 1 < len(other.runs) else other.frames
+            if not self.runs or self.runs[-1][2:] != [width, height]:
+                self.runs.append([self.frames, offset + runOffset, width, height])
+                self.firsts.append(self.frames)
+            self.frames += end - first
+
+    def locate(self, n):
+        # (file offset, width, height) of frame n
+        if not 0 <= n < self.frames:
+            raise IndexError('frame ' + str(n) + ' not in 0..' + str(self.frames - 1))
+        first, offset, width, height = self.runs[bisect_right(self.firsts, n) - 1]
+        return offset + (n - first) * frame_size(width, height), width, height
+
+    def save(self, fileName):
+        fd = open(fileName, 'w')
+        try:
+            json.dump({'version': FRAME_INDEX_VERSION, 'frames': self.frames, 'runs': self.runs}, fd)
+            fd.write('\n')
+        finally:
+            fd.close()
+
+def load_frame_index(fileName):
+    # returns the FrameIndex saved in fileName, None if missing or unusable
+    try:
+        fd = open(fileName)
+        try:
+            header = json.load(fd)
+        finally:
+            fd.close()
+        if header.get('version') != FRAME_INDEX_VERSION:
+            return None
+        return FrameIndex(header['runs'], header['frames'])
+    except (IOError, ValueError, KeyError):
+        return None
+
+def read_frame(yuvFile, n, index=None):
+    # (width, height, data) of frame n, using the index next to the file
+    if index is None:
+        index = load_frame_index(index_file_name(yuvFile))
+        if index is None:
+            raise IOError('No frame index for ' + yuvFile)
+    offset, width, height = index.locate(n)
+    fd = open(yuvFile, 'rb')
+    try:
+        fd.seek(offset)
+        return width, height, fd.read(frame_size(width, height))
+    finally:
+        fd.close()
+
+class YuvFile(object):
+    # YUV output of decoded frames. Regular files are preallocated by extents
+    # and written through a memory map, other files (pipes, devices) with
+    # plain writes. Keeps the frame index and the bytes written, the file is
+    # cut to the frames written when closed
+    mode = 'wb'
+
+    def __init__(self, fileName):
+        self.name      = fileName
+        self.fd        = open(fileName, 'w+b')
+        self.index     = FrameIndex()
+        # bytes of the frames written, and file size including preallocation
+        self.size      = 0
+        self.allocated = 0
+        self.mapped    = stat.S_ISREG(os.fstat(self.fd.fileno()).st_mode)
+        self.map       = None
+        self.mapBuf    = None
+        self.mapStart  = 0
+        self.mapEnd    = 0
+
+    @property
+    def closed(self):
+        return self.fd.closed
+
+    def fileno(self):
+        return self.fd.fileno()
+
+    def write_frame(self, data, width, height):
+        size = frame_size(width, height)
+        if len(data) != size:
+            raise ValueError('Frame of ' + str(len(data)) + ' bytes for ' + str(width) + 'x' + str(height))
+        self.index.add(self.size, width, height)
+        if not self.mapped:
+            # whole frames for whoever reads the pipe
+            self.fd.write(data)
+            self.fd.flush()
+            self.size += size
+            return
+        try:
+            src = addressof((c_char * size).from_buffer(data))
+        except TypeError:
+            # read-only buffer
+            data = bytearray(data)
+            src  = addressof((c_char * size).from_buffer(data))
+        done = 0
+        while done < size:
+            pos = self.size + done
+            if pos >= self.mapEnd:
+                self._map_extent(pos, size - done, size)
+            chunk = min(size - done, self.mapEnd - pos)
+            memmove(addressof(self.mapBuf) + pos - self.mapStart, src + done, chunk)
+            done += chunk
+        self.size += size
+
+    def _map_extent(self, pos, needed, frameSize):
+        # maps the extent starting at pos, growing the file if needed
+        self._unmap()
+        start = pos - pos % mmap.ALLOCATIONGRANULARITY
+        end   = max(pos + max(EXTENT_MIN_SIZE, EXTENT_FRAMES * frameSize), pos + needed)
+        if end > self.allocated:
+            preallocate(self.fd, self.allocated, end)
+            self.allocated = end
+        self.map      = mmap.mmap(self.fd.fileno(), end - start, offset=start)
+        self.mapBuf   = (c_char * (end - start)).from_buffer(self.map)
+        self.mapStart = start
+        self.mapEnd   = end
+
+    def _unmap(self):
+        if self.map is not None:
+            # no reference to the mapped memory may outlive the map
+            self.mapBuf = None
+            self.map.close()
+            self.map    = None
+            self.mapEnd = 0
+
+    def close(self):
+        if self.fd.closed:
+            return
+        self._unmap()
+        if self.mapped and self.allocated != self.size:
+            os.ftruncate(self.fd.fileno(), self.size)
+        self.fd.close()